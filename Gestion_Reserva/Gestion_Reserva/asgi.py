@@ -9,8 +9,23 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Gestion_Reserva.settings')
 
-application = get_asgi_application()
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import OriginValidator  # noqa: E402
+
+from habitaciones.routing import websocket_urlpatterns  # noqa: E402
+from usuarios.websocket import JWTWebsocketMiddleware  # noqa: E402
+
+application = ProtocolTypeRouter({
+    'http': django_asgi_app,
+    # Solo los orígenes del frontend (los mismos que admite CORS) y usuario del token JWT en scope['user']
+    'websocket': OriginValidator(
+        JWTWebsocketMiddleware(URLRouter(websocket_urlpatterns)), settings.CORS_ALLOWED_ORIGINS,
+    ),
+})
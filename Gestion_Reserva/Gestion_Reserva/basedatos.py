@@ -0,0 +1,57 @@
+"""
+Perfiles de configuración de la base de datos SQLite (``DB_PERFIL``).
+
+- ``desarrollo``: la configuración por defecto de Django. Journal en modo
+  DELETE, una conexión nueva por petición y transacciones diferidas.
+- ``produccion``: pensado para escrituras concurrentes.
+  - Cada conexión nueva aplica ``journal_mode=WAL`` (los lectores no bloquean
+    al escritor), ``synchronous=NORMAL`` (seguro con WAL, sin fsync en cada
+    commit), ``mmap_size`` y ``cache_size``.
+  - Las conexiones se reutilizan entre peticiones (``CONN_MAX_AGE``), con
+    comprobación de salud.
+  - Las transacciones empiezan con ``BEGIN IMMEDIATE``. Con transacciones
+    diferidas, una que lee y luego escribe (crear una reserva, confirmar un
+    pago) falla con "database is locked" sin esperar si otra escribió entre
+    medio. Con IMMEDIATE el lock de escritura se pide al empezar y la espera
+    la cubre ``timeout`` (el busy_timeout de SQLite).
+
+``transaction_mode`` afecta solo a los bloques ``transaction.atomic()``, que
+en este proyecto son los de escritura. Las lecturas en autocommit no toman
+el lock de escritura.
+"""
+
+PERFILES = ('desarrollo', 'produccion')
+
+
+def pragmas(mmap_mb=256, cache_mb=64):
+    """``init_command`` con los PRAGMA del perfil de producción."""
+    return ';'.join([
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f'PRAGMA mmap_size={mmap_mb * 1024 * 1024}',
+        # Negativo: tamaño en KiB en lugar de páginas
+        f'PRAGMA cache_size=-{cache_mb * 1024}',
+        'PRAGMA temp_store=MEMORY',
+    ])
+
+
+def sqlite(nombre, perfil='desarrollo', timeout=20, conn_max_age=600, mmap_mb=256, cache_mb=64):
+    """Entrada de ``DATABASES`` para el archivo ``nombre`` según ``perfil``."""
+    if perfil not in PERFILES:
+        raise ValueError(f"DB_PERFIL '{perfil}' no es válido. Usa uno de: {', '.join(PERFILES)}.")
+    base = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': nombre,
+    }
+    if perfil == 'desarrollo':
+        return base
+    return {
+        **base,
+        'CONN_MAX_AGE': conn_max_age,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': pragmas(mmap_mb, cache_mb),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': timeout,
+        },
+    }
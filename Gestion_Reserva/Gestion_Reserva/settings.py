@@ -14,11 +14,21 @@ from pathlib import Path
 from datetime import timedelta
 from decouple import config
 
+from . import basedatos
+
 
 STRIPE_PUBLIC_KEY = config('STRIPE_PUBLIC_KEY')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY')
 STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET')
 
+# Pasarela de pagos (pagos.pasarelas): 'stripe' o 'falsa' (en memoria, sin red)
+PAGOS_PASARELA = config('PAGOS_PASARELA', default='stripe')
+PAGOS_PASARELA_TIMEOUT = config('PAGOS_PASARELA_TIMEOUT', default=10, cast=float)
+PAGOS_PASARELA_TIMEOUT_CONEXION = config('PAGOS_PASARELA_TIMEOUT_CONEXION', default=3, cast=float)
+PAGOS_PASARELA_REINTENTOS = config('PAGOS_PASARELA_REINTENTOS', default=1, cast=int)
+PAGOS_CIRCUITO_UMBRAL = config('PAGOS_CIRCUITO_UMBRAL', default=5, cast=int)
+PAGOS_CIRCUITO_ENFRIAMIENTO = config('PAGOS_CIRCUITO_ENFRIAMIENTO', default=30, cast=int)
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -55,11 +65,13 @@ INSTALLED_APPS = [
     'pagos',
     'logs',
     'usuarios',
+    'analitica',
+    'rendimiento',
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'usuarios.autenticacion.JWTAutenticacionCache',
     ],
 }
 
@@ -85,8 +97,15 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'rendimiento.middleware.InstrumentacionSQLMiddleware',
 ]
 
+# Métricas de SQL por petición (rendimiento.middleware). Desactivado no tiene costo.
+INSTRUMENTACION_SQL = config('INSTRUMENTACION_SQL', default=False, cast=bool)
+INSTRUMENTACION_SQL_MAX_CONSULTAS = config('INSTRUMENTACION_SQL_MAX_CONSULTAS', default=50, cast=int)
+INSTRUMENTACION_SQL_MAX_MS = config('INSTRUMENTACION_SQL_MAX_MS', default=500, cast=int)
+INSTRUMENTACION_SQL_REPETICIONES = config('INSTRUMENTACION_SQL_REPETICIONES', default=5, cast=int)
+
 ROOT_URLCONF = 'Gestion_Reserva.urls'
 
 TEMPLATES = [
@@ -110,11 +129,19 @@ WSGI_APPLICATION = 'Gestion_Reserva.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Perfiles en Gestion_Reserva/basedatos.py: 'desarrollo' (por defecto de Django)
+# o 'produccion' (WAL, conexiones persistentes, BEGIN IMMEDIATE)
+DB_PERFIL = config('DB_PERFIL', default='desarrollo')
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': basedatos.sqlite(
+        config('DB_NOMBRE', default=str(BASE_DIR / 'db.sqlite3')),
+        perfil=DB_PERFIL,
+        timeout=config('DB_TIMEOUT', default=20, cast=int),
+        conn_max_age=config('DB_CONN_MAX_AGE', default=600, cast=int),
+        mmap_mb=config('DB_MMAP_MB', default=256, cast=int),
+        cache_mb=config('DB_CACHE_MB', default=64, cast=int),
+    )
 }
 
 
@@ -173,3 +200,33 @@ CACHES = {
         'LOCATION': 'unique-sse-cache',
     }
 }
+
+# Bus de eventos de habitaciones entre workers: 'memoria', 'sqlite' o 'channels'
+HABITACIONES_BUS = config('HABITACIONES_BUS', default='memoria')
+
+# Segundos entre barridos de reservas pendientes con la cuenta vencida
+# (reservas.vencimiento). Sin valor el barrido solo corre con el comando vencer_reservas.
+BARREDOR_RESERVAS_INTERVALO = config('BARREDOR_RESERVAS_INTERVALO', default=None, cast=lambda v: int(v) if v else None)
+
+# Segundos entre actualizaciones del resumen diario con las fechas de las reservas
+# que cambiaron (analitica.resumen). Sin valor el resumen solo se recalcula con el
+# comando recalcular_resumen_diario.
+RESUMEN_DIARIO_INTERVALO = config('RESUMEN_DIARIO_INTERVALO', default=None, cast=lambda v: int(v) if v else None)
+
+# Trabajadores que procesan los eventos del webhook de pagos (pagos.procesador).
+# Con 0 los eventos solo se procesan con el comando procesar_eventos_pago.
+PAGOS_PROCESADOR_HILOS = config('PAGOS_PROCESADOR_HILOS', default=0, cast=int)
+PAGOS_PROCESADOR_INTERVALO = config('PAGOS_PROCESADOR_INTERVALO', default=5, cast=int)
+PAGOS_EVENTOS_MAX_INTENTOS = config('PAGOS_EVENTOS_MAX_INTENTOS', default=8, cast=int)
+
+# Segundos que se guarda en caché el usuario de un token JWT (usuarios.autenticacion).
+# Acota cuánto tarda otro proceso en ver un cambio de rol o una desactivación.
+AUTH_USUARIO_CACHE_SEGUNDOS = config('AUTH_USUARIO_CACHE_SEGUNDOS', default=60, cast=int)
+
+# Capa en memoria: solo sirve dentro de un proceso. Con HABITACIONES_BUS='channels'
+# hay que configurar una compartida (channels_redis); con esta el bus no arranca.
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    }
+}
@@ -27,6 +27,7 @@ urlpatterns = [
     path('api/usuarios/', include('usuarios.urls')),
     path('api/habitaciones/', include('habitaciones.urls')),
     path('api/pagos/', include('pagos.urls')),
+    path('api/analitica/', include('analitica.urls')),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from analitica.resumen import recalcular
+
+
+class Command(BaseCommand):
+    help = ("Recalcula el resumen diario de ocupación e ingresos. Por defecto "
+            "cubre desde 30 días atrás hasta 365 días adelante (reservas futuras).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help="Fecha inicial AAAA-MM-DD")
+        parser.add_argument('--hasta', help="Fecha final AAAA-MM-DD (inclusive)")
+
+    def handle(self, *args, desde=None, hasta=None, **options):
+        hoy = timezone.localdate()
+        desde = parse_date(desde) if desde else hoy - timedelta(days=30)
+        hasta = parse_date(hasta) if hasta else hoy + timedelta(days=365)
+        if desde is None or hasta is None or desde > hasta:
+            raise CommandError("Rango de fechas no válido")
+
+        filas = 0
+        # Por tramos de un mes, para no mantener una transacción larga
+        inicio = desde
+        while inicio <= hasta:
+            fin = min(inicio + timedelta(days=30), hasta)
+            filas += recalcular(inicio, fin)
+            inicio = fin + timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f"Resumen diario recalculado ({desde} a {hasta}): {filas} filas"))
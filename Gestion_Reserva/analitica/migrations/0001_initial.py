@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('habitaciones', '0002_evento_habitacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('pago', models.CharField(max_length=20)),
+                ('habitaciones_vendidas', models.PositiveIntegerField(default=0)),
+                ('noches', models.PositiveIntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('descuentos', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('cancelaciones', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('tipo_habitacion', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='habitaciones.tipohabitacion')),
+            ],
+            options={
+                'db_table': 'resumen_diario',
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'tipo_habitacion', 'pago'), name='uniq_resumen_diario')],
+            },
+        ),
+    ]
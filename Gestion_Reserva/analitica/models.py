@@ -0,0 +1,27 @@
+from django.db import models
+
+from habitaciones.models import TipoHabitacion
+
+
+class ResumenDiario(models.Model):
+    """Totales de la noche ``fecha`` por tipo de habitación y medio de pago:
+    noches vendidas con sus ingresos, y reservas con check-in esa fecha. Se
+    mantiene desde reservas (ver analitica.resumen)."""
+    fecha = models.DateField()
+    tipo_habitacion = models.ForeignKey(TipoHabitacion, on_delete=models.PROTECT)
+    pago = models.CharField(max_length=20)
+    habitaciones_vendidas = models.PositiveIntegerField(default=0)  # Llegadas confirmadas o finalizadas
+    noches = models.PositiveIntegerField(default=0)  # Habitaciones vendidas esa noche
+    ingresos = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    descuentos = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    cancelaciones = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'resumen_diario'
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'tipo_habitacion', 'pago'], name='uniq_resumen_diario'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} - {self.tipo_habitacion_id} - {self.pago}"
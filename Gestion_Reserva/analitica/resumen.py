@@ -0,0 +1,252 @@
+"""
+Resumen diario de ocupación e ingresos.
+
+Cada fila de ``ResumenDiario`` es una fecha local (una noche), un tipo de
+habitación y un medio de pago:
+
+- noches, ingresos y descuentos: noches vendidas esa fecha, contadas en
+  ``NocheHabitacion`` (una fila por habitación y noche) de las reservas
+  Confirmada o Finalizada. Cada noche lleva la parte proporcional del
+  total_pagar y del descuento de su reserva. Así la ocupación y el RevPAR
+  de un día son los de ese día y nunca pasan del 100 %. Tras un check-out
+  anticipado solo cuentan las noches usadas.
+- habitaciones_vendidas y cancelaciones: reservas vendidas y canceladas con
+  check-in esa fecha.
+
+Las reservas no recalculan el resumen al guardarse: ``marcar`` anota las
+fechas que tocaron (en memoria del proceso) y ``procesar_pendientes`` las
+recalcula por tramos de días seguidos. Lo llama el hilo que se inicia con
+``RESUMEN_DIARIO_INTERVALO`` (segundos), fuera de las peticiones. El comando
+``recalcular_resumen_diario`` recalcula un rango completo cada noche y
+corrige cualquier desvío, incluidas las fechas que quedaron sin procesar si
+el proceso terminó. Los reportes leen solo esta tabla.
+
+El recálculo borra las filas, agrega e inserta el resultado en una sola
+transacción que empieza por el ``DELETE``: el lock de escritura se toma antes
+de leer, así dos recálculos del mismo día no pueden escribir cada uno con una
+foto distinta de las reservas. Si la base está bloqueada se reintenta con
+espera creciente.
+"""
+import logging
+import threading
+import time as reloj
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, transaction
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Q, Sum
+from django.db.models.functions import Cast, TruncDate
+from django.utils import timezone
+
+from habitaciones.catalogos import estados_reserva
+from habitaciones.models import Habitacion
+from reservas.models import NocheHabitacion, Reserva
+from .models import ResumenDiario
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_VENDIDOS = ('Confirmada', 'Finalizada')
+REINTENTOS = 5
+ESPERA_BASE = 0.05      # segundos antes del primer reintento; se duplica en cada uno
+CENTIMOS = Decimal('0.01')
+
+
+def _inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def recalcular(desde, hasta):
+    """Recalcula las filas con fecha en [desde, hasta] a partir de las reservas.
+    Devuelve la cantidad de filas escritas."""
+    for intento in range(REINTENTOS):
+        try:
+            return _recalcular(desde, hasta)
+        except OperationalError:
+            # Dentro de otra transacción reintentar no sirve: la decide quien la abrió
+            if intento == REINTENTOS - 1 or transaction.get_connection().in_atomic_block:
+                raise
+            reloj.sleep(ESPERA_BASE * 2 ** intento)
+
+
+def _recalcular(desde, hasta):
+    with transaction.atomic():
+        # Primero la escritura: toma el lock antes de leer las reservas
+        ResumenDiario.objects.filter(fecha__gte=desde, fecha__lte=hasta).delete()
+        filas = [
+            ResumenDiario(fecha=fecha, tipo_habitacion_id=tipo, pago=pago, **valores)
+            for (fecha, tipo, pago), valores in sorted(_grupos(desde, hasta).items())
+        ]
+        ResumenDiario.objects.bulk_create(filas)
+    return len(filas)
+
+
+def _por_noche(campo):
+    # En SQLite un decimal entero se guarda como INTEGER: sin el CAST la división truncaría
+    return Sum(ExpressionWrapper(
+        Cast(f'reserva__{campo}', FloatField()) / F('reserva__total_noches'), output_field=FloatField()
+    ))
+
+
+def _centimos(valor):
+    return Decimal(str(valor or 0)).quantize(CENTIMOS)
+
+
+def _grupos(desde, hasta):
+    """{(fecha, tipo, pago): campos} con las noches y las llegadas de [desde, hasta]."""
+    ids_vendidos = [estados_reserva.por_nombre(n).pk for n in ESTADOS_VENDIDOS]
+    vendidas = Q(id_estado_reserva__in=ids_vendidos)
+    canceladas = Q(id_estado_reserva=estados_reserva.por_nombre('Cancelada').pk)
+    grupos = {}
+
+    def grupo(clave):
+        return grupos.setdefault(clave, {
+            'habitaciones_vendidas': 0, 'noches': 0, 'ingresos': Decimal('0.00'),
+            'descuentos': Decimal('0.00'), 'cancelaciones': 0,
+        })
+
+    noches = (
+        NocheHabitacion.objects.filter(
+            fecha__gte=desde, fecha__lte=hasta, reserva__id_estado_reserva__in=ids_vendidos,
+        )
+        .values('fecha', pago=F('reserva__pago'), tipo=F('habitacion__id_tipo'))
+        .annotate(noches=Count('id'), ingresos=_por_noche('total_pagar'), descuentos=_por_noche('descuento_aplicado'))
+        .order_by()
+    )
+    for g in noches:
+        fila = grupo((g['fecha'], g['tipo'], g['pago']))
+        fila.update(noches=g['noches'], ingresos=_centimos(g['ingresos']), descuentos=_centimos(g['descuentos']))
+
+    llegadas = (
+        Reserva.objects.filter(
+            fecha_checkin_programado__gte=_inicio_del_dia(desde),
+            fecha_checkin_programado__lt=_inicio_del_dia(hasta + timedelta(days=1)),
+        )
+        .filter(vendidas | canceladas)
+        .values('pago', fecha=TruncDate('fecha_checkin_programado'), tipo=F('codigo_habitacion__id_tipo'))
+        .annotate(vendidas=Count('id', filter=vendidas), cancelaciones=Count('id', filter=canceladas))
+        .order_by()
+    )
+    for g in llegadas:
+        fila = grupo((g['fecha'], g['tipo'], g['pago']))
+        fila.update(habitaciones_vendidas=g['vendidas'], cancelaciones=g['cancelaciones'])
+    return grupos
+
+
+def _tramos(fechas):
+    """Agrupa fechas ordenadas en tramos (desde, hasta) de días seguidos."""
+    tramos = []
+    for fecha in fechas:
+        if tramos and fecha == tramos[-1][1] + timedelta(days=1):
+            tramos[-1][1] = fecha
+        else:
+            tramos.append([fecha, fecha])
+    return [tuple(t) for t in tramos]
+
+
+def recalcular_fechas(fechas):
+    """Recalcula los días indicados, un tramo de días seguidos por transacción."""
+    for desde, hasta in _tramos(sorted(set(fechas))):
+        recalcular(desde, hasta)
+
+
+_pendientes = set()
+_pendientes_lock = threading.Lock()
+
+
+def marcar(fechas):
+    """Anota fechas para recalcular más tarde; no consulta la base de datos."""
+    with _pendientes_lock:
+        _pendientes.update(fechas)
+
+
+def procesar_pendientes():
+    """Recalcula las fechas anotadas con ``marcar``. Si falla, las vuelve a
+    anotar para el próximo intento. Devuelve la cantidad de fechas."""
+    with _pendientes_lock:
+        fechas = sorted(_pendientes)
+        _pendientes.clear()
+    try:
+        recalcular_fechas(fechas)
+    except Exception:
+        marcar(fechas)
+        raise
+    return len(fechas)
+
+
+class Actualizador(threading.Thread):
+    """Hilo que ejecuta ``procesar_pendientes`` cada ``intervalo`` segundos."""
+
+    def __init__(self, intervalo):
+        super().__init__(name='actualizador-resumen', daemon=True)
+        self.intervalo = intervalo
+        self.detenido = threading.Event()
+
+    def run(self):
+        while not self.detenido.wait(self.intervalo):
+            try:
+                procesar_pendientes()
+            except Exception:
+                logger.exception("No se pudo actualizar el resumen diario")
+            finally:
+                close_old_connections()
+
+    def detener(self):
+        self.detenido.set()
+
+
+_actualizador = None
+_actualizador_lock = threading.Lock()
+
+
+def iniciar_actualizador():
+    """Inicia el hilo si ``RESUMEN_DIARIO_INTERVALO`` está definido. Devuelve
+    el hilo en ejecución o None."""
+    global _actualizador
+    intervalo = getattr(settings, 'RESUMEN_DIARIO_INTERVALO', None)
+    if not intervalo:
+        return None
+    with _actualizador_lock:
+        if _actualizador is None or not _actualizador.is_alive():
+            _actualizador = Actualizador(intervalo)
+            _actualizador.start()
+    return _actualizador
+
+
+def _dividir(numerador, denominador):
+    if not denominador:
+        return None
+    return (Decimal(numerador) / Decimal(denominador)).quantize(Decimal('0.0001'))
+
+
+def indicadores(desde, hasta, tipo_habitacion=None):
+    """Ocupación, ADR y RevPAR de [desde, hasta] leyendo solo el resumen diario.
+
+    - ocupacion: noches vendidas / noches disponibles (habitaciones x días)
+    - adr: ingresos / noches vendidas
+    - revpar: ingresos / noches disponibles
+    """
+    resumen = ResumenDiario.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+    habitaciones = Habitacion.objects.all()
+    if tipo_habitacion is not None:
+        resumen = resumen.filter(tipo_habitacion=tipo_habitacion)
+        habitaciones = habitaciones.filter(id_tipo=tipo_habitacion)
+
+    campos = dict(
+        habitaciones_vendidas=Sum('habitaciones_vendidas'),
+        noches=Sum('noches'),
+        ingresos=Sum('ingresos'),
+        descuentos=Sum('descuentos'),
+        cancelaciones=Sum('cancelaciones'),
+    )
+    dias = list(resumen.values('fecha').annotate(**campos).order_by('fecha'))
+    totales = {campo: sum((d[campo] or 0) for d in dias) for campo in campos}
+
+    disponibles = habitaciones.count() * ((hasta - desde).days + 1)
+    totales.update(
+        noches_disponibles=disponibles,
+        ocupacion=_dividir(totales['noches'], disponibles),
+        adr=_dividir(totales['ingresos'], totales['noches']),
+        revpar=_dividir(totales['ingresos'], disponibles),
+    )
+    return {'totales': totales, 'dias': dias}
@@ -0,0 +1,31 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from reservas.models import Reserva
+from reservas.ocupacion import noches
+from reservas.signals import transicion_reserva
+from .resumen import marcar
+
+CHECKIN = Reserva.CAMPOS_OCUPACION.index('fecha_checkin_programado')
+CHECKOUT = Reserva.CAMPOS_OCUPACION.index('fecha_checkout_programado')
+
+
+@receiver(transicion_reserva)
+def reservas_en_transicion(sender, reservas, **kwargs):
+    # La señal se envía con la transacción ya confirmada
+    marcar([
+        fecha for r in reservas for fecha in noches(r.fecha_checkin_programado, r.fecha_checkout_programado)
+    ])
+
+
+@receiver(post_save, sender='reservas.Reserva')
+@receiver(post_delete, sender='reservas.Reserva')
+def reserva_modificada(sender, instance, **kwargs):
+    # Las noches de la estadía; la primera es también la fecha de llegada
+    fechas = noches(instance.fecha_checkin_programado, instance.fecha_checkout_programado)
+    anterior = getattr(instance, '_ocupacion_guardada', None)
+    if anterior is not None:
+        # Si cambiaron las fechas también se corrigen las noches anteriores
+        fechas += noches(anterior[CHECKIN], anterior[CHECKOUT])
+    transaction.on_commit(lambda: marcar(fechas))
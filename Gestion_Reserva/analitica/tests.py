@@ -0,0 +1,132 @@
+import io
+from datetime import timedelta
+from decimal import Decimal
+
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from habitaciones.tests import FIXTURES
+from reservas.models import Reserva
+from usuarios.models import Usuario
+from . import resumen
+from .models import ResumenDiario
+
+
+class ResumenDiarioTests(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        self.huesped = Usuario.objects.create_user('70000001', 'Ana', 'Pérez', password='clave-segura')
+        self.checkin = timezone.now() + timedelta(days=5)
+        self.fecha = timezone.localdate(self.checkin)
+        resumen._pendientes.clear()  # Fechas anotadas por otros tests del proceso
+
+    def reservar(self, codigo):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Reserva.objects.create(
+                usuario=self.huesped,
+                codigo_habitacion_id=codigo,
+                id_tipo_reserva_id=2,
+                fecha_checkin_programado=self.checkin,
+                fecha_checkout_programado=self.checkin + timedelta(days=2),
+                precio_noche=100,
+            )
+
+    def test_resumen_incremental_y_recalculo(self):
+        confirmada = self.reservar('HAB101')
+        cancelada = self.reservar('HAB102')
+        self.reservar('HAB103')  # Pendiente: no cuenta
+        with CaptureQueriesContext(connection) as consultas, self.captureOnCommitCallbacks(execute=True):
+            confirmada.confirmar()
+        with self.captureOnCommitCallbacks(execute=True):
+            cancelada.cancelar()
+        # La petición solo anota las fechas: el resumen se recalcula fuera de ella
+        self.assertFalse([q for q in consultas.captured_queries if 'resumen_diario' in q['sql']])
+        self.assertFalse(ResumenDiario.objects.exists())
+        self.assertEqual(resumen.procesar_pendientes(), 2)  # Las dos noches de la estadía
+
+        tipo = confirmada.codigo_habitacion.id_tipo_id
+        noches = {f.fecha: f for f in ResumenDiario.objects.filter(tipo_habitacion=tipo, noches__gt=0)}
+        siguiente = self.fecha + timedelta(days=1)
+        self.assertEqual(sorted(noches), [self.fecha, siguiente])
+        self.assertEqual([(noches[f].noches, noches[f].ingresos) for f in sorted(noches)],
+                         [(1, Decimal('100.00')), (1, Decimal('100.00'))])
+        # La reserva vendida y la cancelada cuentan en su fecha de llegada
+        incremental = list(ResumenDiario.objects.order_by('id').values(
+            'fecha', 'tipo_habitacion', 'pago', 'habitaciones_vendidas', 'noches', 'ingresos', 'cancelaciones'))
+        self.assertEqual([(r['fecha'], r['habitaciones_vendidas']) for r in incremental if r['habitaciones_vendidas']],
+                         [(self.fecha, 1)])
+        self.assertEqual([(r['fecha'], r['cancelaciones']) for r in incremental if r['cancelaciones']],
+                         [(self.fecha, 1)])
+
+        call_command('recalcular_resumen_diario', stdout=io.StringIO())
+        recalculado = list(ResumenDiario.objects.order_by('id').values(
+            'fecha', 'tipo_habitacion', 'pago', 'habitaciones_vendidas', 'noches', 'ingresos', 'cancelaciones'))
+        self.assertCountEqual(recalculado, incremental)
+
+        cliente = APIClient()
+        cliente.force_authenticate(
+            Usuario.objects.create_user('70000002', 'Luis', 'Rojas', password='clave-segura', rol='ADMIN')
+        )
+        with self.assertNumQueries(2):
+            respuesta = cliente.get(f'/api/analitica/resumen/?desde={self.fecha}&hasta={siguiente}')
+        totales = respuesta.data['totales']
+        habitaciones = totales['noches_disponibles'] // 2
+        self.assertEqual(totales['noches'], 2)
+        self.assertEqual(totales['adr'], Decimal('100.0000'))
+        self.assertEqual(totales['ocupacion'], (Decimal(1) / habitaciones).quantize(Decimal('0.0001')))
+        # Cada día tiene su propia noche vendida, no las dos el día de llegada
+        self.assertEqual([d['noches'] for d in respuesta.data['dias']], [1, 1])
+
+    def test_fechas_con_error_se_vuelven_a_procesar(self):
+        resumen.marcar([self.fecha, self.fecha + timedelta(days=1), self.fecha + timedelta(days=5)])
+        with mock.patch.object(resumen, 'recalcular', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                resumen.procesar_pendientes()
+        with mock.patch.object(resumen, 'recalcular', return_value=0) as recalcular:
+            self.assertEqual(resumen.procesar_pendientes(), 3)
+        # Un tramo por grupo de días seguidos
+        self.assertEqual([c.args for c in recalcular.call_args_list], [
+            (self.fecha, self.fecha + timedelta(days=1)),
+            (self.fecha + timedelta(days=5), self.fecha + timedelta(days=5)),
+        ])
+
+
+class RecalculoConcurrenteTests(TransactionTestCase):
+    fixtures = FIXTURES
+
+    def test_lee_con_el_lock_tomado_y_reintenta(self):
+        huesped = Usuario.objects.create_user('70000001', 'Ana', 'Pérez', password='clave-segura')
+        checkin = timezone.now() + timedelta(days=5)
+        Reserva.objects.create(
+            usuario=huesped, codigo_habitacion_id='HAB101', id_tipo_reserva_id=2, id_estado_reserva_id=2,
+            fecha_checkin_programado=checkin, fecha_checkout_programado=checkin + timedelta(days=2),
+            precio_noche=100,
+        )
+        fecha = timezone.localdate(checkin)
+        ResumenDiario.objects.all().delete()
+
+        insertar = ResumenDiario.objects.bulk_create
+        llamadas = []
+
+        def bloqueada(filas):
+            llamadas.append(len(filas))
+            if len(llamadas) == 1:
+                raise OperationalError('database table is locked')
+            return insertar(filas)
+
+        with mock.patch.object(ResumenDiario.objects, 'bulk_create', side_effect=bloqueada), \
+                CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(resumen.recalcular(fecha, fecha), 1)
+        self.assertEqual(llamadas, [1, 1])
+        sentencias = [q['sql'] for q in consultas.captured_queries]
+        borrado = next(i for i, sql in enumerate(sentencias) if sql.startswith('DELETE'))
+        lectura = next(i for i, sql in enumerate(sentencias) if '"reserva"' in sql and sql.startswith('SELECT'))
+        self.assertLess(borrado, lectura)  # La agregación corre dentro de la transacción de escritura
+        self.assertEqual(ResumenDiario.objects.get().habitaciones_vendidas, 1)
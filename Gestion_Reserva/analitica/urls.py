@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import resumen_ocupacion
+
+urlpatterns = [
+    path('resumen/', resumen_ocupacion, name='resumen_ocupacion'),
+]
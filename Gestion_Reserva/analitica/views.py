@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from habitaciones.catalogos import tipos_habitacion
+from .resumen import indicadores
+
+MAX_DIAS = 731
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def resumen_ocupacion(request):
+    """
+    Ocupación, ADR, RevPAR y totales diarios entre ?desde y ?hasta (AAAA-MM-DD,
+    por defecto los últimos 30 días), opcionalmente de un ?tipo_habitacion.
+    Solo lee la tabla resumen_diario.
+    """
+    if request.user.rol not in ['ADMIN', 'SUPERVISOR']:
+        return Response({"error": "Sin permisos para ver reportes"}, status=status.HTTP_403_FORBIDDEN)
+
+    hoy = timezone.localdate()
+    desde = parse_date(request.query_params.get('desde', '')) or hoy - timedelta(days=29)
+    hasta = parse_date(request.query_params.get('hasta', '')) or hoy
+    if desde > hasta or (hasta - desde).days >= MAX_DIAS:
+        return Response({"error": f"Rango de fechas no válido (máximo {MAX_DIAS} días)"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    tipo = None
+    if request.query_params.get('tipo_habitacion'):
+        try:
+            tipo = tipos_habitacion.por_nombre(request.query_params['tipo_habitacion']).pk
+        except tipos_habitacion.modelo.DoesNotExist:
+            return Response({"error": "Tipo de habitación no encontrado"}, status=status.HTTP_400_BAD_REQUEST)
+
+    datos = indicadores(desde, hasta, tipo)
+    return Response({"desde": desde, "hasta": hasta, **datos}, status=status.HTTP_200_OK)
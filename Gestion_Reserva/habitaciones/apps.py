@@ -1,13 +1,11 @@
 from django.apps import AppConfig
 
-import asyncio
 
 class HabitacionesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'habitaciones'
 
     def ready(self):
-        from .gestion_sse import poll_habitaciones
-        loop = asyncio.get_event_loop()
-        loop.create_task(poll_habitaciones(3))  # Cada 3 segundos
-    
\ No newline at end of file
+        from . import signals  # noqa: F401
+        from . import catalogos  # noqa: F401 (invalidación de catálogos)
+        from . import disponibilidad  # noqa: F401 (registra las señales del índice)
@@ -0,0 +1,180 @@
+"""
+Bus de eventos de habitaciones entre procesos.
+
+Quien modifica una habitación publica el cambio una sola vez en el bus y cada
+proceso (worker ASGI) lo retransmite a sus propios clientes SSE y WebSocket a
+través de ``gestion_sse.notify_subscribers``. El backend se elige con el
+setting ``HABITACIONES_BUS``:
+
+- ``memoria``: un solo proceso, sin infraestructura (por defecto).
+- ``sqlite``: los eventos se guardan en la tabla ``evento_habitacion`` y cada
+  proceso con clientes conectados lee los nuevos por id. Sirve para varios
+  workers en una misma máquina sin Redis, y numera los eventos globalmente.
+- ``channels``: usa el channel layer configurado en ``CHANNEL_LAYERS``
+  (channels_redis para varios procesos o máquinas; con ``InMemoryChannelLayer``
+  no arranca, porque esa capa no sale del proceso). Los eventos se numeran con
+  la misma tabla que ``sqlite``, así un cliente que reconecta a otro worker con
+  ``Last-Event-ID`` retoma desde el mismo id.
+
+``publicar`` se llama dentro de la transacción del cambio: los backends con
+tabla guardan el evento en ella (se confirma junto con el cambio) y lo que
+sale del proceso se envía tras el commit.
+
+El relevo de cada proceso solo corre mientras haya clientes conectados.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from . import gestion_sse
+
+logger = logging.getLogger(__name__)
+
+RETENCION = getattr(settings, 'HABITACIONES_BUS_RETENCION', 10000)
+LOTE = 500
+
+
+def registrar_evento(cambios):
+    """Guarda el evento en ``evento_habitacion`` y devuelve su id, común a todos los procesos."""
+    from .models import EventoHabitacion
+    evento = EventoHabitacion.objects.create(cambios=cambios)
+    if evento.pk % LOTE == 0:
+        EventoHabitacion.objects.filter(pk__lte=evento.pk - RETENCION).delete()
+    return evento.pk
+
+
+def ultimo_evento():
+    from .models import EventoHabitacion
+    return EventoHabitacion.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+class BusMemoria:
+    """Entrega directa dentro del proceso."""
+
+    def publicar(self, cambios):
+        transaction.on_commit(lambda: gestion_sse.notify_subscribers(cambios))
+
+    async def asegurar_relevo(self):
+        pass
+
+
+class BusRelevo:
+    """Base para los backends que necesitan una tarea de relevo por proceso."""
+
+    def __init__(self):
+        self._tarea = None
+        self._lock = None   # (loop, asyncio.Lock): un lock solo sirve en su propio loop
+
+    async def asegurar_relevo(self):
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock[0] is not loop:
+            self._lock = (loop, asyncio.Lock())
+        # Dos conexiones simultáneas no deben iniciar dos relevos mientras se prepara el primero
+        async with self._lock[1]:
+            if self._tarea is None or self._tarea.done():
+                await self._preparar()
+                self._tarea = loop.create_task(self._relevo())
+
+    async def _preparar(self):
+        pass
+
+    async def _relevo(self):
+        raise NotImplementedError
+
+
+class BusSQLite(BusRelevo):
+    INTERVALO = getattr(settings, 'HABITACIONES_BUS_INTERVALO', 0.5)
+
+    def __init__(self):
+        super().__init__()
+        self._ultimo_leido = 0
+
+    def publicar(self, cambios):
+        registrar_evento(cambios)
+
+    @staticmethod
+    def _leer_desde(ultimo, limite):
+        from .models import EventoHabitacion
+        return list(
+            EventoHabitacion.objects.filter(pk__gt=ultimo)
+            .order_by('pk').values_list('pk', 'cambios')[:limite]
+        )
+
+    async def _preparar(self):
+        # Tras un periodo sin relevo pudieron perderse eventos: se continúa
+        # desde el último id de la tabla y los clientes anteriores hacen reset.
+        self._ultimo_leido = await sync_to_async(ultimo_evento)()
+        gestion_sse.reiniciar(self._ultimo_leido)
+
+    async def _relevo(self):
+        while gestion_sse.subscribers:
+            await asyncio.sleep(self.INTERVALO)
+            try:
+                eventos = await sync_to_async(self._leer_desde)(self._ultimo_leido, LOTE)
+            except Exception:
+                logger.exception("Error leyendo eventos de habitaciones")
+                continue
+            for evento_id, cambios in eventos:
+                gestion_sse.notify_subscribers(cambios, evento_id=evento_id)
+                self._ultimo_leido = evento_id
+
+
+class BusChannels(BusRelevo):
+    GRUPO = 'habitaciones'
+    RENOVAR_GRUPO = 3600  # segundos; los channel layers expiran la membresía
+
+    def __init__(self):
+        super().__init__()
+        self._capa = None
+        self._canal = None
+        capa = getattr(settings, 'CHANNEL_LAYERS', {}).get('default', {}).get('BACKEND', '')
+        if capa.endswith('InMemoryChannelLayer'):
+            raise ImproperlyConfigured(
+                "HABITACIONES_BUS='channels' necesita un channel layer compartido entre procesos "
+                "(por ejemplo channels_redis); InMemoryChannelLayer no sale del proceso."
+            )
+
+    @property
+    def capa(self):
+        if self._capa is None:
+            from channels.layers import get_channel_layer
+            self._capa = get_channel_layer()
+        return self._capa
+
+    def publicar(self, cambios):
+        evento_id = registrar_evento(cambios)
+        mensaje = {'type': 'habitaciones.cambio', 'cambios': cambios, 'evento_id': evento_id}
+        transaction.on_commit(lambda: async_to_sync(self.capa.group_send)(self.GRUPO, mensaje))
+
+    async def _preparar(self):
+        # Primero el grupo y después el último id: nada posterior a ese id se
+        # pierde, y lo anterior que llegue por el canal se descarta.
+        self._canal = await self.capa.new_channel()
+        await self.capa.group_add(self.GRUPO, self._canal)
+        gestion_sse.reiniciar(await sync_to_async(ultimo_evento)())
+
+    async def _relevo(self):
+        canal = self._canal
+        try:
+            while gestion_sse.subscribers:
+                try:
+                    mensaje = await asyncio.wait_for(self.capa.receive(canal), self.RENOVAR_GRUPO)
+                except asyncio.TimeoutError:
+                    await self.capa.group_add(self.GRUPO, canal)
+                    continue
+                gestion_sse.notify_subscribers(mensaje['cambios'], evento_id=mensaje['evento_id'])
+        finally:
+            await self.capa.group_discard(self.GRUPO, canal)
+
+
+BACKENDS = {
+    'memoria': BusMemoria,
+    'sqlite': BusSQLite,
+    'channels': BusChannels,
+}
+
+bus = BACKENDS[getattr(settings, 'HABITACIONES_BUS', 'memoria')]()
@@ -0,0 +1,110 @@
+"""
+Registro en memoria de los catálogos de referencia.
+
+EstadoHabitacion, TipoHabitacion, EstadoReserva y TipoReserva son tablas
+pequeñas que casi nunca cambian, pero se consultan en cada transición. Cada
+catálogo se carga una vez por proceso y responde búsquedas por pk y por nombre
+sin ir a la base de datos.
+
+Al guardar o eliminar una fila se incrementa una versión compartida en la base
+de datos (``habitaciones.versiones``);
+los demás procesos la comparan como máximo cada ``CATALOGOS_VERIFICAR_SEGUNDOS``
+y recargan el catálogo si cambió.
+
+Las instancias devueltas son compartidas: se pueden asignar a claves foráneas,
+pero no deben modificarse.
+"""
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from .versiones import obtener_version, incrementar_version
+
+VERIFICAR_SEGUNDOS = getattr(settings, 'CATALOGOS_VERIFICAR_SEGUNDOS', 5)
+
+
+class Catalogo:
+    def __init__(self, modelo):
+        self.modelo_label = modelo
+        self.clave_version = f'catalogo:{modelo.lower()}:version'
+        self._lock = threading.Lock()
+        self._version = None
+        self._verificado = 0
+        self._por_pk = {}
+        self._por_nombre = {}
+        self._filas = []
+
+    @property
+    def modelo(self):
+        return apps.get_model(self.modelo_label)
+
+    def _vigente(self):
+        ahora = time.monotonic()
+        if self._version is not None and ahora - self._verificado < VERIFICAR_SEGUNDOS:
+            return
+        with self._lock:
+            version = obtener_version(self.clave_version)
+            if version != self._version:
+                filas = list(self.modelo.objects.order_by('pk'))
+                self._filas = filas
+                self._por_pk = {fila.pk: fila for fila in filas}
+                self._por_nombre = {fila.nombre: fila for fila in filas}
+                self._version = version
+            self._verificado = ahora
+
+    @property
+    def version(self):
+        self._vigente()
+        return self._version
+
+    def todos(self):
+        self._vigente()
+        return list(self._filas)
+
+    def get(self, pk):
+        """Equivale a ``Modelo.objects.get(pk=pk)``; lanza ``DoesNotExist`` si no existe."""
+        self._vigente()
+        try:
+            fila = self._por_pk.get(self.modelo._meta.pk.to_python(pk))
+        except ValidationError:
+            fila = None
+        if fila is None:
+            raise self.modelo.DoesNotExist(f"{self.modelo.__name__} con pk={pk} no existe")
+        return fila
+
+    def por_nombre(self, nombre):
+        """Equivale a ``Modelo.objects.get(nombre=nombre)``."""
+        self._vigente()
+        try:
+            return self._por_nombre[nombre]
+        except KeyError:
+            raise self.modelo.DoesNotExist(f"{self.modelo.__name__} con nombre={nombre!r} no existe")
+
+    def invalidar(self):
+        incrementar_version(self.clave_version)
+        self._version = None
+
+
+estados_habitacion = Catalogo('habitaciones.EstadoHabitacion')
+tipos_habitacion = Catalogo('habitaciones.TipoHabitacion')
+estados_reserva = Catalogo('reservas.EstadoReserva')
+tipos_reserva = Catalogo('reservas.TipoReserva')
+
+CATALOGOS = [estados_habitacion, tipos_habitacion, estados_reserva, tipos_reserva]
+
+
+def _conectar(catalogo):
+    def invalidar(sender, **kwargs):
+        catalogo._version = None
+        transaction.on_commit(catalogo.invalidar)
+    post_save.connect(invalidar, sender=catalogo.modelo_label, weak=False)
+    post_delete.connect(invalidar, sender=catalogo.modelo_label, weak=False)
+
+
+for _catalogo in CATALOGOS:
+    _conectar(_catalogo)
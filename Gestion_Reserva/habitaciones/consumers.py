@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+from channels.generic.websocket import AsyncWebsocketConsumer
+
+from .gestion_sse import mensajes
+
+
+class HabitacionesDashboardConsumer(AsyncWebsocketConsumer):
+    """Versión WebSocket del feed del dashboard de habitaciones.
+
+    Envía los mismos mensajes que el SSE como JSON: ``{"id", "evento", "cambios"}``.
+    Para retomar tras una reconexión se puede pasar ``?last_event_id=``.
+
+    Requiere un token de acceso (``?token=`` o ``Authorization: Bearer``, ver
+    ``usuarios.websocket``); sin él la conexión se cierra con el código 4401.
+    """
+
+    async def connect(self):
+        usuario = self.scope.get('user')
+        if usuario is None or not usuario.is_authenticated:
+            await self.close(code=4401)
+            return
+        await self.accept()
+        query = dict(
+            parte.split('=', 1) for parte in self.scope.get('query_string', b'').decode().split('&') if '=' in parte
+        )
+        self.tarea = asyncio.ensure_future(self.enviar_cambios(query.get('last_event_id')))
+
+    async def enviar_cambios(self, last_event_id):
+        async for mensaje in mensajes(last_event_id):
+            if mensaje is None:
+                await self.send(text_data=json.dumps({'evento': 'heartbeat'}))
+            else:
+                await self.send(text_data=json.dumps({
+                    'id': mensaje.id,
+                    'evento': mensaje.evento or 'cambios',
+                    'cambios': mensaje.cambios,
+                }))
+
+    async def disconnect(self, code):
+        tarea = getattr(self, 'tarea', None)
+        if tarea:
+            tarea.cancel()
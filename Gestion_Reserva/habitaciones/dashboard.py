@@ -0,0 +1,123 @@
+"""
+Proyección de habitaciones para el dashboard, guardada en la caché.
+
+Cada habitación tiene su propia entrada (``habitaciones_dashboard:hab:<codigo>``),
+más la lista de códigos. Al guardar una habitación solo se reescribe su
+entrada y se incrementa la versión compartida (``habitaciones.versiones``),
+que sirve de ETag para los clientes. La versión se incrementa dentro de la
+transacción del cambio, así se confirma con él y ningún error posterior al
+commit puede dejarla sin avanzar; la caché se actualiza tras el commit.
+
+La caché puede ser propia del proceso, así que junto a las entradas se guarda
+la versión con la que se calcularon (``CLAVE_FILAS``). Si otro proceso cambió
+habitaciones, la versión compartida ya no coincide y la proyección se
+reconstruye en la siguiente lectura.
+"""
+from django.core.cache import cache
+
+from .catalogos import estados_habitacion, tipos_habitacion
+from .models import Habitacion
+from .versiones import obtener_version, incrementar_version
+
+CLAVE_VERSION = 'habitaciones_dashboard:version'
+CLAVE_CODIGOS = 'habitaciones_dashboard:codigos'
+CLAVE_FILAS = 'habitaciones_dashboard:filas_version'
+PREFIJO = 'habitaciones_dashboard:hab:'
+
+CAMPOS = (
+    'codigo',
+    'numero_habitacion',
+    'piso',
+    'precio_actual',
+    'id_estado__nombre',
+    'id_estado__permite_reserva',
+    'id_tipo__nombre',
+)
+
+
+def proyectar(habitacion):
+    """Fila del dashboard a partir de una instancia (mismas claves que values())."""
+    estado = estados_habitacion.get(habitacion.id_estado_id)
+    return {
+        'codigo': habitacion.codigo,
+        'numero_habitacion': habitacion.numero_habitacion,
+        'piso': habitacion.piso,
+        'precio_actual': habitacion.precio_actual,
+        'id_estado__nombre': estado.nombre,
+        'id_estado__permite_reserva': estado.permite_reserva,
+        'id_tipo__nombre': tipos_habitacion.get(habitacion.id_tipo_id).nombre,
+    }
+
+
+def _guardar_filas(filas):
+    cache.set_many({PREFIJO + fila['codigo']: fila for fila in filas}, None)
+
+
+def avanzar_version():
+    """Incrementa la versión compartida y devuelve la nueva. Se llama dentro de
+    la transacción que modifica las habitaciones."""
+    return incrementar_version(CLAVE_VERSION)
+
+
+def _registrar_version(nueva):
+    """Registra un cambio propio ya confirmado. Si otro proceso cambió
+    habitaciones desde la última lectura, las entradas de esta caché dejan de
+    ser válidas."""
+    if cache.get(CLAVE_FILAS) == nueva - 1:
+        cache.set(CLAVE_FILAS, nueva, None)
+    else:
+        cache.delete(CLAVE_FILAS)
+
+
+def reconstruir():
+    """Recalcula la proyección completa con una sola consulta."""
+    # La versión se lee antes: si cambia mientras tanto, se reconstruye otra vez
+    version_actual = obtener_version(CLAVE_VERSION)
+    filas = list(Habitacion.objects.order_by('codigo').values(*CAMPOS))
+    _guardar_filas(filas)
+    cache.set_many({CLAVE_CODIGOS: [fila['codigo'] for fila in filas], CLAVE_FILAS: version_actual}, None)
+    return version_actual, filas
+
+
+def actualizar_habitacion(habitacion, version):
+    """Reescribe solo la entrada de la habitación indicada."""
+    _guardar_filas([proyectar(habitacion)])
+    codigos = cache.get(CLAVE_CODIGOS)
+    if codigos is not None and habitacion.codigo not in codigos:
+        cache.set(CLAVE_CODIGOS, sorted(codigos + [habitacion.codigo]), None)
+    _registrar_version(version)
+
+
+def quitar_habitacion(codigo, version):
+    cache.delete(PREFIJO + codigo)
+    codigos = cache.get(CLAVE_CODIGOS)
+    if codigos is not None and codigo in codigos:
+        cache.set(CLAVE_CODIGOS, [c for c in codigos if c != codigo], None)
+    _registrar_version(version)
+
+
+def reproyectar_estado(id_estado, version):
+    """Actualiza las habitaciones que tienen el estado indicado (cambio de catálogo)."""
+    _guardar_filas(Habitacion.objects.filter(id_estado=id_estado).values(*CAMPOS))
+    _registrar_version(version)
+
+
+def reproyectar_tipo(id_tipo, version):
+    _guardar_filas(Habitacion.objects.filter(id_tipo=id_tipo).values(*CAMPOS))
+    _registrar_version(version)
+
+
+def version():
+    return obtener_version(CLAVE_VERSION)
+
+
+def leer():
+    """Devuelve (version, filas). Si falta alguna entrada se reconstruye todo."""
+    version_actual = obtener_version(CLAVE_VERSION)
+    guardado = cache.get_many([CLAVE_CODIGOS, CLAVE_FILAS])
+    codigos = guardado.get(CLAVE_CODIGOS)
+    if codigos is not None and guardado.get(CLAVE_FILAS) == version_actual:
+        filas = cache.get_many([PREFIJO + codigo for codigo in codigos])
+        if len(filas) == len(codigos):
+            return version_actual, [filas[PREFIJO + codigo] for codigo in codigos]
+    return reconstruir()
@@ -0,0 +1,248 @@
+"""
+Motor de disponibilidad de habitaciones.
+
+Mantiene en memoria, por proceso, las noches ocupadas de cada habitación
+leídas de ``NocheHabitacion``: la misma tabla que consulta
+``habitaciones_libres_db``, de modo que el índice y la base de datos usan la
+misma definición (una habitación está libre si no tiene ninguna noche ocupada
+en el rango, ver ``reservas.ocupacion``). Se cargan las noches desde ayer;
+una búsqueda que empieza antes se responde con la base de datos.
+
+Quien modifica las noches o los datos de una habitación registra el cambio en
+``CambioDisponibilidad`` dentro de su misma transacción (``registrar_cambios``),
+así el cambio se confirma junto con las noches o no se confirma. Antes de cada
+búsqueda el índice lee los cambios posteriores al último que aplicó (una
+consulta) y recarga solo esas habitaciones. Un cambio sin habitación (tipos
+de habitación, ``invalidar``) o un atraso de más de ``RETENCION`` cambios
+reconstruye el índice completo.
+
+En PostgreSQL los ids pueden confirmarse fuera de orden: los que faltan entre
+dos cambios leídos se vuelven a buscar durante ``HUECO_SEGUNDOS``.
+"""
+import bisect
+import logging
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import Max, Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import CambioDisponibilidad, Habitacion, TipoHabitacion
+
+logger = logging.getLogger(__name__)
+
+RETENCION = getattr(settings, 'DISPONIBILIDAD_RETENCION', 10000)
+LOTE_PURGA = 500
+HUECO_SEGUNDOS = 60
+
+
+def _parsear_fecha(valor):
+    """Convierte el valor recibido en la petición a un datetime con zona horaria,
+    con la misma interpretación que hace el ORM al filtrar un DateTimeField."""
+    if isinstance(valor, datetime):
+        fecha = valor
+    else:
+        fecha = parse_datetime(str(valor))
+        if fecha is None:
+            solo_fecha = parse_date(str(valor))
+            if solo_fecha is None:
+                raise ValueError(f"Fecha no válida: {valor}")
+            fecha = datetime.combine(solo_fecha, dt_time.min)
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+    return fecha
+
+
+def _rango(fecha_checkin, fecha_checkout):
+    from reservas.ocupacion import rango_noches
+    return rango_noches(_parsear_fecha(fecha_checkin), _parsear_fecha(fecha_checkout))
+
+
+def registrar_cambios(codigos):
+    """Registra que cambiaron las noches o los datos de las habitaciones
+    indicadas (None: todas). Se llama dentro de la transacción del cambio."""
+    cambios = CambioDisponibilidad.objects.bulk_create(
+        [CambioDisponibilidad(habitacion=codigo) for codigo in set(codigos)]
+    )
+    if any(cambio.pk % LOTE_PURGA == 0 for cambio in cambios):
+        CambioDisponibilidad.objects.filter(pk__lte=cambios[-1].pk - RETENCION).delete()
+
+
+class IndiceDisponibilidad:
+    """Noches ocupadas por habitación."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._ultimo = None       # id del último cambio aplicado; None: sin cargar
+        self._huecos = {}         # id de cambio aún no leído -> momento en que se detectó
+        self._desde = None        # primera noche cargada
+        self._habitaciones = {}   # codigo -> (nombre de tipo en minúsculas, capacidad)
+        self._noches = {}         # codigo -> [fecha] ordenada
+
+    # --- Construcción ---
+
+    def reconstruir(self):
+        """Carga el índice completo desde la base de datos."""
+        with self._lock:
+            # Se lee antes que las noches: un cambio intermedio se vuelve a aplicar
+            ultimo = CambioDisponibilidad.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+            self._ultimo = None
+            self._desde = timezone.localdate() - timedelta(days=1)
+            self._habitaciones = {}
+            self._noches = {}
+            self._cargar()
+            self._huecos = {}
+            self._ultimo = ultimo
+
+    def _cargar(self, codigos=None):
+        """Lee las habitaciones indicadas (None: todas) y sus noches."""
+        NocheHabitacion = apps.get_model('reservas', 'NocheHabitacion')
+        habitaciones = Habitacion.objects.values_list('codigo', 'id_tipo__nombre', 'id_tipo__capacidad_maxima')
+        noches = NocheHabitacion.objects.filter(fecha__gte=self._desde)
+        if codigos is not None:
+            habitaciones = habitaciones.filter(codigo__in=codigos)
+            noches = noches.filter(habitacion__in=codigos)
+        habitaciones = list(habitaciones)
+        noches = list(noches.order_by('habitacion_id', 'fecha').values_list('habitacion_id', 'fecha'))
+
+        for codigo in codigos or ():
+            # Las eliminadas no vuelven en la consulta
+            self._habitaciones.pop(codigo, None)
+            self._noches.pop(codigo, None)
+        for codigo, tipo, capacidad in habitaciones:
+            self._habitaciones[codigo] = (tipo.lower(), capacidad)
+        for codigo, fecha in noches:
+            self._noches.setdefault(codigo, []).append(fecha)
+
+    def invalidar(self):
+        """Fuerza la reconstrucción del índice en todos los procesos."""
+        registrar_cambios([None])
+        with self._lock:
+            self._ultimo = None
+
+    def _asegurar_vigente(self):
+        if self._ultimo is None:
+            self.reconstruir()
+            return
+        ahora = time.monotonic()
+        self._huecos = {id_: desde for id_, desde in self._huecos.items() if ahora - desde < HUECO_SEGUNDOS}
+        pendientes = Q(id__gt=self._ultimo)
+        if self._huecos:
+            pendientes |= Q(id__in=list(self._huecos))
+        cambios = dict(CambioDisponibilidad.objects.filter(pendientes).values_list('id', 'habitacion'))
+        if not cambios:
+            return
+
+        ultimo = max(self._ultimo, *cambios)
+        codigos = set(cambios.values())
+        if None in codigos or ultimo - self._ultimo >= RETENCION:
+            self.reconstruir()
+            return
+        self._cargar(codigos)
+        for id_ in cambios:
+            self._huecos.pop(id_, None)
+        self._huecos.update(
+            (id_, ahora) for id_ in range(self._ultimo + 1, ultimo) if id_ not in cambios
+        )
+        self._ultimo = ultimo
+
+    # --- Consulta ---
+
+    def _libre(self, codigo, desde, hasta):
+        noches = self._noches.get(codigo)
+        if not noches:
+            return True
+        posicion = bisect.bisect_left(noches, desde)
+        return posicion == len(noches) or noches[posicion] >= hasta
+
+    def habitaciones_libres(self, tipo_habitacion, numero_huespedes, fecha_checkin, fecha_checkout):
+        """Devuelve los códigos de las habitaciones del tipo indicado, con capacidad
+        suficiente y sin noches ocupadas en el rango. None si el rango empieza
+        antes de las noches cargadas."""
+        desde, hasta = _rango(fecha_checkin, fecha_checkout)
+        tipo = str(tipo_habitacion).lower()
+        huespedes = int(numero_huespedes)
+        with self._lock:
+            try:
+                self._asegurar_vigente()
+            except Exception:
+                self._ultimo = None
+                raise
+            if desde < self._desde:
+                return None
+            return sorted(
+                codigo for codigo, (nombre, capacidad) in self._habitaciones.items()
+                if nombre == tipo and capacidad >= huespedes and self._libre(codigo, desde, hasta)
+            )
+
+
+indice = IndiceDisponibilidad()
+
+
+def habitaciones_libres_db(tipo_habitacion, numero_huespedes, fecha_checkin, fecha_checkout):
+    """Consulta equivalente directamente contra la base de datos: excluye las
+    habitaciones con alguna noche ocupada en el rango (tabla noche_habitacion)."""
+    from reservas.ocupacion import habitaciones_ocupadas
+    habitaciones = Habitacion.objects.filter(
+        id_tipo__nombre__iexact=tipo_habitacion,
+        id_tipo__capacidad_maxima__gte=numero_huespedes
+    )
+    ocupadas = habitaciones_ocupadas(_parsear_fecha(fecha_checkin), _parsear_fecha(fecha_checkout))
+    return habitaciones.exclude(codigo__in=ocupadas)
+
+
+def buscar_habitaciones_libres(tipo_habitacion, numero_huespedes, fecha_checkin, fecha_checkout):
+    """Devuelve un queryset de habitaciones libres usando el índice en memoria.
+
+    Si el índice no puede responder se usa la consulta a la base de datos. Con
+    ``DISPONIBILIDAD_VERIFICAR = True`` se contrastan ambos resultados y ante
+    cualquier diferencia se invalida el índice y se responde con la base de datos.
+    """
+    try:
+        codigos = indice.habitaciones_libres(tipo_habitacion, numero_huespedes, fecha_checkin, fecha_checkout)
+    except Exception:
+        logger.exception("Índice de disponibilidad no disponible, se usa la base de datos")
+        codigos = None
+    if codigos is None:
+        return habitaciones_libres_db(tipo_habitacion, numero_huespedes, fecha_checkin, fecha_checkout)
+
+    if getattr(settings, 'DISPONIBILIDAD_VERIFICAR', False):
+        esperadas = habitaciones_libres_db(tipo_habitacion, numero_huespedes, fecha_checkin, fecha_checkout)
+        codigos_db = sorted(esperadas.values_list('codigo', flat=True))
+        if codigos_db != codigos:
+            logger.warning("Índice de disponibilidad desincronizado: %s != %s", codigos, codigos_db)
+            indice.invalidar()
+            return esperadas
+
+    return Habitacion.objects.filter(codigo__in=codigos).order_by('codigo')
+
+
+# --- Señales que registran cambios (las noches los registran en reservas.ocupacion) ---
+
+@receiver(post_delete, sender='reservas.Reserva')
+def reserva_eliminada(sender, instance, **kwargs):
+    # Sus noches se borran en cascada, sin pasar por reservas.ocupacion
+    registrar_cambios([instance.codigo_habitacion_id])
+
+
+@receiver(post_save, sender=Habitacion)
+def habitacion_guardada(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'id_tipo' not in update_fields:
+        return
+    registrar_cambios([instance.codigo])
+
+
+@receiver(post_delete, sender=Habitacion)
+def habitacion_eliminada(sender, instance, **kwargs):
+    registrar_cambios([instance.codigo])
+
+
+@receiver(post_save, sender=TipoHabitacion)
+def tipo_modificado(sender, **kwargs):
+    registrar_cambios([None])
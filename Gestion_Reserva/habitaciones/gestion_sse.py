@@ -1,34 +1,192 @@
+"""
+Difusión de cambios de habitaciones por SSE.
 
-from habitaciones.models import Habitacion
-from asgiref.sync import sync_to_async
+Cada cambio recibe un id creciente y se guarda en un buffer circular
+compartido. Los suscriptores no tienen cola propia: solo guardan el último id
+entregado y un aviso que se activa cuando llegan eventos nuevos. Así la memoria
+por conexión es constante y un cliente lento no frena a los demás.
+
+Si un suscriptor se atrasa, los eventos pendientes se fusionan en un solo
+mensaje (queda el último estado de cada habitación). Si se atrasó más de lo
+que guarda el buffer, o reconecta con un ``Last-Event-ID`` que ya no está
+disponible, recibe un evento ``reset`` para que recargue el estado completo.
+Los ids pueden tener huecos (los numera la base de datos y una transacción
+deshecha no publica nada): solo cuenta si el buffer ya descartó eventos
+posteriores al último que recibió el cliente.
+
+Los cambios llegan aquí a través del bus (``habitaciones.bus``), que los
+reparte a todos los procesos; este módulo solo atiende a los clientes
+conectados al proceso actual (SSE y WebSocket).
+"""
+from collections import deque
+from django.conf import settings
+from collections import namedtuple
 import asyncio
 import json
+import threading
+import time
+
+BUFFER_EVENTOS = getattr(settings, 'SSE_BUFFER_EVENTOS', 1000)
+HEARTBEAT_SEGUNDOS = getattr(settings, 'SSE_HEARTBEAT_SEGUNDOS', 15)
+RETRY_MS = getattr(settings, 'SSE_RETRY_MS', 3000)
+
+_lock = threading.Lock()
+_eventos = deque(maxlen=BUFFER_EVENTOS)  # Mensaje con el texto SSE ya formateado
+# Lo fija el bus: ids globales cuando el backend los provee, o ids locales que
+# parten del reloj para no confundirse con los de un proceso anterior.
+_ultimo_id = None
+# Último id que ya no está en el buffer: quien recibió hasta aquí o más no perdió nada
+_descartado = None
+
+Mensaje = namedtuple('Mensaje', ['id', 'evento', 'cambios', 'sse'])
+
+# Event loop -> suscriptores que viven en él
+subscribers = {}
+
+
+def _id_inicial():
+    return int(time.time() * 1000)
+
+
+def _mensaje(evento_id, cambios, evento=None):
+    lineas = [f'id: {evento_id}']
+    if evento:
+        lineas.append(f'event: {evento}')
+    lineas.append(f"data: {json.dumps({'cambios': cambios})}")
+    return Mensaje(evento_id, evento, cambios, '\n'.join(lineas) + '\n\n')
+
+
+class Suscriptor:
+    def __init__(self, loop, ultimo_id):
+        self.loop = loop
+        self.aviso = asyncio.Event()
+        self.ultimo_id = ultimo_id
+
+    def pendientes(self):
+        """Devuelve el mensaje con todo lo que este suscriptor aún no recibió,
+        o None si está al día."""
+        with _lock:
+            if self.ultimo_id >= _ultimo_id:
+                return None
+            if self.ultimo_id < _descartado:
+                self.ultimo_id = _ultimo_id
+                return _mensaje(_ultimo_id, [], evento='reset')
+            nuevos = [e for e in reversed(_eventos) if e.id > self.ultimo_id]
+        nuevos.reverse()
+        self.ultimo_id = nuevos[-1].id
+        if len(nuevos) == 1:
+            return nuevos[0]
+        fusionados = {}
+        for mensaje in nuevos:
+            for cambio in mensaje.cambios:
+                fusionados.pop(cambio['codigo'], None)
+                fusionados[cambio['codigo']] = cambio
+        return _mensaje(self.ultimo_id, list(fusionados.values()))
 
-subscribers = set()
 
-async def notify_subscribers(data):
-    for queue in subscribers.copy():
-        await queue.put(data)  # Ahora sí es asyncio.Queue, no una función
+def _despertar(loop):
+    for suscriptor in list(subscribers.get(loop, ())):
+        suscriptor.aviso.set()
+
+
+def reiniciar(ultimo_id):
+    """Descarta el buffer y continúa la secuencia desde ``ultimo_id``. Los
+    clientes que reconecten con ids anteriores recibirán un reset."""
+    global _ultimo_id, _descartado
+    with _lock:
+        _eventos.clear()
+        _ultimo_id = _descartado = ultimo_id
+
+
+def notify_subscribers(cambios, evento_id=None):
+    """Registra un evento y avisa a los suscriptores locales. Se puede llamar
+    desde cualquier hilo: se agenda un único aviso por event loop.
+
+    ``evento_id`` lo entrega el bus cuando numera los eventos globalmente; los
+    ids repetidos o anteriores al último se ignoran.
+    """
+    global _ultimo_id, _descartado
+    with _lock:
+        if _ultimo_id is None:
+            _ultimo_id = _descartado = _id_inicial() if evento_id is None else evento_id - 1
+        if evento_id is None:
+            evento_id = _ultimo_id + 1
+        elif evento_id <= _ultimo_id:
+            return
+        if len(_eventos) == _eventos.maxlen:
+            _descartado = _eventos[0].id
+        _ultimo_id = evento_id
+        _eventos.append(_mensaje(evento_id, cambios))
+        loops = list(subscribers)
+    for loop in loops:
+        try:
+            loop.call_soon_threadsafe(_despertar, loop)
+        except RuntimeError:  # El loop ya se cerró
+            with _lock:
+                subscribers.pop(loop, None)
+
+
+def subscribe(last_event_id=None):
+    """Registra un suscriptor en el loop actual y devuelve (suscriptor, unsubscribe)."""
+    global _ultimo_id, _descartado
+    loop = asyncio.get_running_loop()
+    with _lock:
+        if _ultimo_id is None:
+            _ultimo_id = _descartado = _id_inicial()
+        try:
+            ultimo_id = int(last_event_id)
+        except (TypeError, ValueError):
+            ultimo_id = _ultimo_id
+        suscriptor = Suscriptor(loop, ultimo_id)
+        subscribers.setdefault(loop, set()).add(suscriptor)
+    if ultimo_id != _ultimo_id:
+        suscriptor.aviso.set()
 
-def subscribe(queue):
-    subscribers.add(queue)
     def unsubscribe():
-        subscribers.discard(queue)
-    return unsubscribe
-
-async def poll_habitaciones(interval=5):
-    last_state = {}
-    while True:
-        await asyncio.sleep(interval)
-        habitaciones = await sync_to_async(list)(
-            Habitacion.objects.values('codigo', 'id_estado_id')
-        )
-        cambios = []
-        for h in habitaciones:
-            cod = h['codigo']
-            estado = h['id_estado_id']
-            if cod not in last_state or last_state[cod] != estado:
-                cambios.append({'codigo': cod, 'estado': estado})
-            last_state[cod] = estado
-        if cambios:
-            await notify_subscribers(json.dumps({'cambios': cambios}))
\ No newline at end of file
+        with _lock:
+            locales = subscribers.get(loop)
+            if locales is not None:
+                locales.discard(suscriptor)
+                if not locales:
+                    subscribers.pop(loop, None)
+    return suscriptor, unsubscribe
+
+
+async def mensajes(last_event_id=None):
+    """Generador de mensajes para un cliente local. Entrega None cada
+    ``HEARTBEAT_SEGUNDOS`` sin novedades para que el transporte envíe un latido."""
+    from .bus import bus
+    await bus.asegurar_relevo()
+    suscriptor, unsubscribe = subscribe(last_event_id)
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(suscriptor.aviso.wait(), HEARTBEAT_SEGUNDOS)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            suscriptor.aviso.clear()
+            mensaje = suscriptor.pendientes()
+            if mensaje:
+                yield mensaje
+    finally:
+        # Se ejecuta también ante desconexión, cancelación o cierre del generador
+        unsubscribe()
+
+
+async def event_stream(last_event_id=None):
+    """Generador SSE: eventos pendientes, fusionados si hace falta, y heartbeats."""
+    stream = mensajes(last_event_id)
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        async for mensaje in stream:
+            yield mensaje.sse if mensaje else ': heartbeat\n\n'
+    finally:
+        await stream.aclose()
+
+
+def publicar_cambio(codigo, estado):
+    """Publica en el bus el cambio de estado de una habitación. Se llama dentro
+    de la transacción del cambio; los clientes lo reciben tras el commit."""
+    from .bus import bus
+    bus.publicar([{'codigo': codigo, 'estado': estado}])
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habitaciones', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoHabitacion',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('cambios', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'evento_habitacion',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habitaciones', '0002_evento_habitacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionCompartida',
+            fields=[
+                ('clave', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('valor', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'version_compartida',
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habitaciones', '0003_version_compartida'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioDisponibilidad',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('habitacion', models.CharField(blank=True, max_length=10, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'cambio_disponibilidad',
+            },
+        ),
+    ]
@@ -42,6 +42,20 @@ class Habitacion(models.Model):
     def __str__(self):
         return self.numero_habitacion
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._estado_guardado = instancia.__dict__.get('id_estado_id')
+        return instancia
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Publicar en el feed del dashboard solo si el estado cambió
+        if self.id_estado_id != getattr(self, '_estado_guardado', None):
+            from .gestion_sse import publicar_cambio
+            publicar_cambio(self.codigo, self.id_estado_id)
+            self._estado_guardado = self.id_estado_id
+
     class Meta:
         db_table = 'habitacion'
         indexes = [
@@ -49,3 +63,33 @@ class Habitacion(models.Model):
             models.Index(fields=['id_estado'], name='idx_habitacion_estado'),
             models.Index(fields=['piso'], name='idx_habitacion_piso'),
         ]
+
+class EventoHabitacion(models.Model):
+    """Cambio de estado publicado en el bus SQLite (ver habitaciones.bus)."""
+    id = models.BigAutoField(primary_key=True)
+    cambios = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'evento_habitacion'
+
+
+class VersionCompartida(models.Model):
+    """Contador de versión compartido por todos los procesos (ver habitaciones.versiones)."""
+    clave = models.CharField(primary_key=True, max_length=100)
+    valor = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'version_compartida'
+
+
+class CambioDisponibilidad(models.Model):
+    """Habitación cuyas noches o datos cambiaron, para el índice de
+    disponibilidad (ver habitaciones.disponibilidad). Sin habitación, el
+    cambio afecta a todas."""
+    id = models.BigAutoField(primary_key=True)
+    habitacion = models.CharField(max_length=10, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'cambio_disponibilidad'
@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .consumers import HabitacionesDashboardConsumer
+
+websocket_urlpatterns = [
+    path('ws/habitaciones-dashboard/', HabitacionesDashboardConsumer.as_asgi()),
+]
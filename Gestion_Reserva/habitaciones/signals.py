@@ -1,38 +1,30 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Habitacion, EstadoHabitacion
-from django.core.cache import cache
+from .models import Habitacion, EstadoHabitacion, TipoHabitacion
+from . import dashboard
+
+# La versión del dashboard avanza dentro de la transacción; la caché, tras el commit
 
 @receiver(post_save, sender=Habitacion)
 def actualizar_cache_habitaciones(sender, instance, **kwargs):
-    print("Signal HABITACION activado")
-    habitaciones = list(
-        Habitacion.objects.select_related('id_estado', 'id_tipo')
-        .values(
-            'codigo',
-            'numero_habitacion',
-            'piso',
-            'precio_actual',
-            'id_estado__nombre',
-            'id_estado__permite_reserva',
-            'id_tipo__nombre'
-        )
-    )
-    cache.set("habitaciones_dashboard", habitaciones)
+    version = dashboard.avanzar_version()
+    transaction.on_commit(lambda: dashboard.actualizar_habitacion(instance, version))
+
+@receiver(post_delete, sender=Habitacion)
+def quitar_habitacion_cache(sender, instance, **kwargs):
+    codigo = instance.codigo
+    version = dashboard.avanzar_version()
+    transaction.on_commit(lambda: dashboard.quitar_habitacion(codigo, version))
 
 @receiver(post_save, sender=EstadoHabitacion)
 def actualizar_cache_por_estado(sender, instance, **kwargs):
-    print("Signal HABITACION - ESTADO activado") 
-    habitaciones = list(
-        Habitacion.objects.select_related('id_estado', 'id_tipo')
-        .values(
-            'codigo',
-            'numero_habitacion',
-            'piso',
-            'precio_actual',
-            'id_estado__nombre',
-            'id_estado__permite_reserva',
-            'id_tipo__nombre'
-        )
-    )
-    cache.set("habitaciones_dashboard", habitaciones)
\ No newline at end of file
+    id_estado = instance.pk
+    version = dashboard.avanzar_version()
+    transaction.on_commit(lambda: dashboard.reproyectar_estado(id_estado, version))
+
+@receiver(post_save, sender=TipoHabitacion)
+def actualizar_cache_por_tipo(sender, instance, **kwargs):
+    id_tipo = instance.pk
+    version = dashboard.avanzar_version()
+    transaction.on_commit(lambda: dashboard.reproyectar_tipo(id_tipo, version))
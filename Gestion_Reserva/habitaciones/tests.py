@@ -1,3 +1,355 @@
-from django.test import TestCase
+import asyncio
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from reservas.models import Reserva
+from usuarios.models import Usuario
+from . import catalogos, dashboard, gestion_sse, versiones
+from .bus import BusChannels, BusSQLite, ultimo_evento
+from .disponibilidad import buscar_habitaciones_libres, indice, habitaciones_libres_db
+from .models import Habitacion, EstadoHabitacion
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+FIXTURES = [
+    str(BASE_DIR / 'huespedes/Tipos_De_Documento/fixtures_tipodocumento.json'),
+    str(BASE_DIR / 'habitaciones/EstadoHabitacion/estado_habitacion.json'),
+    str(BASE_DIR / 'habitaciones/TipoHabitacion/tipo_habitacion.json'),
+    str(BASE_DIR / 'habitaciones/Habitacion/habitacion.json'),
+    str(BASE_DIR / 'reservas/EstadoReserva/Estado_Reserva.json'),
+    str(BASE_DIR / 'reservas/TipoReserva/tipo_reserva.json'),
+]
+
+
+class DisponibilidadTests(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        self.huesped = Usuario.objects.create_user('70000001', 'Ana', 'Pérez', password='clave-segura')
+        self.checkin = timezone.now() + timedelta(days=10)
+        self.checkout = self.checkin + timedelta(days=3)
+        indice.reconstruir()
+
+    def reservar(self, codigo, estado=1):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Reserva.objects.create(
+                usuario=self.huesped,
+                codigo_habitacion_id=codigo,
+                id_tipo_reserva_id=2,
+                id_estado_reserva_id=estado,
+                fecha_checkin_programado=self.checkin,
+                fecha_checkout_programado=self.checkout,
+                precio_noche=100,
+            )
+
+    def assertCoincideConDB(self, tipo, huespedes, desde, hasta):
+        esperadas = sorted(habitaciones_libres_db(tipo, huespedes, desde, hasta).values_list('codigo', flat=True))
+        self.assertEqual(indice.habitaciones_libres(tipo, huespedes, desde, hasta), esperadas)
+        return esperadas
+
+    def test_indice_refleja_reservas_creadas_y_canceladas(self):
+        codigo = Habitacion.objects.filter(id_tipo__nombre='Doble').values_list('codigo', flat=True).first()
+        reserva = self.reservar(codigo)
+
+        libres = self.assertCoincideConDB('doble', 2, self.checkin, self.checkout)
+        self.assertNotIn(codigo, libres)
+
+        # Un rango que empieza justo en el checkout no se solapa
+        self.assertIn(codigo, self.assertCoincideConDB('Doble', 1, self.checkout, self.checkout + timedelta(days=1)))
+
+        reserva.id_estado_reserva_id = 3  # Cancelada
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva.save()
+        self.assertIn(codigo, self.assertCoincideConDB('Doble', 2, self.checkin, self.checkout))
+
+    def test_aplica_solo_los_cambios_posteriores(self):
+        codigo = Habitacion.objects.filter(id_tipo__nombre='Doble').values_list('codigo', flat=True).first()
+        # La reserva podría venir de otro proceso: el índice se entera por el registro de cambios
+        self.reservar(codigo)
+        # Cambios nuevos, la habitación afectada y sus noches; sin reconstrucción completa
+        with mock.patch.object(indice, 'reconstruir', side_effect=AssertionError('reconstrucción completa')):
+            with self.assertNumQueries(3):
+                self.assertNotIn(codigo, indice.habitaciones_libres('doble', 2, self.checkin, self.checkout))
+            with self.assertNumQueries(1):
+                indice.habitaciones_libres('doble', 2, self.checkin, self.checkout)
+
+    @override_settings(DISPONIBILIDAD_VERIFICAR=True)
+    def test_indice_y_base_de_datos_usan_las_mismas_noches(self):
+        codigo = Habitacion.objects.filter(id_tipo__nombre='Doble').values_list('codigo', flat=True).first()
+        self.reservar(codigo)
+        rangos = [
+            (self.checkin, self.checkout),
+            # Llega la noche anterior y sale antes del check-in: no comparte ninguna noche
+            (self.checkin - timedelta(hours=20), self.checkin - timedelta(hours=2)),
+            (self.checkout - timedelta(hours=1), self.checkout + timedelta(days=1)),
+            (self.checkout.date().isoformat(), (self.checkout + timedelta(days=1)).date().isoformat()),
+        ]
+        with mock.patch.object(indice, 'invalidar', side_effect=AssertionError('índice desincronizado')):
+            for desde, hasta in rangos:
+                buscar_habitaciones_libres('Doble', 1, desde, hasta)
+        # Un rango anterior a las noches cargadas se responde con la base de datos
+        pasado = timezone.now() - timedelta(days=30)
+        self.assertIsNone(indice.habitaciones_libres('Doble', 1, pasado, pasado + timedelta(days=1)))
+
+    def test_capacidad_y_fechas_en_texto(self):
+        desde = self.checkin.date().isoformat()
+        hasta = self.checkout.date().isoformat()
+        self.assertEqual(self.assertCoincideConDB('Suite', 5, desde, hasta), [])
+        self.assertCoincideConDB('Suite', 4, desde, hasta)
+
+
+class FeedCambiosTests(TestCase):
+    fixtures = FIXTURES
+
+    @mock.patch('habitaciones.gestion_sse.notify_subscribers')
+    def test_publica_solo_cambios_de_estado_confirmados(self, notify):
+        habitacion = Habitacion.objects.get(pk='HAB101')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            habitacion.observaciones = 'Sin cambio de estado'
+            habitacion.save()
+        notify.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            habitacion.id_estado_id = 5
+            habitacion.save()
+        notify.assert_called_once()
+        self.assertEqual(notify.call_args.args[0], [{'codigo': 'HAB101', 'estado': 5}])
+
+
+class DifusionSSETests(SimpleTestCase):
+    def setUp(self):
+        gestion_sse.reiniciar(1000)
+
+    def test_cliente_atrasado_recibe_cambios_fusionados_y_reconecta(self):
+        async def escenario():
+            stream = gestion_sse.event_stream()
+            self.assertTrue((await anext(stream)).startswith('retry:'))
+            lectura = asyncio.ensure_future(anext(stream))
+            await asyncio.sleep(0)
+            gestion_sse.notify_subscribers([{'codigo': 'HAB101', 'estado': 2}])
+            gestion_sse.notify_subscribers([{'codigo': 'HAB102', 'estado': 3}])
+            gestion_sse.notify_subscribers([{'codigo': 'HAB101', 'estado': 5}])
+            mensaje = await lectura
+            await stream.aclose()
+            self.assertEqual(gestion_sse.subscribers, {})
+
+            # Reconexión con Last-Event-ID: solo lo que faltaba
+            primer_id = gestion_sse._ultimo_id - 1
+            replay = gestion_sse.event_stream(primer_id)
+            await anext(replay)
+            pendiente = await anext(replay)
+            await replay.aclose()
+
+            # Un id más viejo que el buffer provoca un reset
+            viejo = gestion_sse.event_stream(1)
+            await anext(viejo)
+            reset = await anext(viejo)
+            await viejo.aclose()
+            return mensaje, pendiente, reset
+
+        mensaje, pendiente, reset = asyncio.run(escenario())
+        self.assertIn('"codigo": "HAB101", "estado": 5', mensaje)
+        self.assertIn('"codigo": "HAB102", "estado": 3', mensaje)
+        self.assertNotIn('"estado": 2', mensaje)
+        self.assertNotIn('HAB102', pendiente)
+        self.assertIn('event: reset', reset)
+
+    def test_hueco_en_los_ids_no_provoca_reset(self):
+        # El id 1001 se deshizo con su transacción: no se perdió nada
+        gestion_sse.notify_subscribers([{'codigo': 'HAB101', 'estado': 2}], evento_id=1002)
+
+        async def escenario():
+            stream = gestion_sse.event_stream(1000)
+            await anext(stream)
+            mensaje = await anext(stream)
+            await stream.aclose()
+            return mensaje
+
+        mensaje = asyncio.run(escenario())
+        self.assertTrue(mensaje.startswith('id: 1002\n'))
+        self.assertNotIn('event: reset', mensaje)
+
+
+class BusSQLiteTests(TransactionTestCase):
+    def test_relevo_entrega_eventos_con_ids_globales(self):
+        bus = BusSQLite()
+        bus.INTERVALO = 0.01
+
+        async def escenario():
+            stream = gestion_sse.mensajes()
+            lectura = asyncio.ensure_future(anext(stream))
+            await asyncio.sleep(0.05)
+            await sync_to_async(bus.publicar)([{'codigo': 'HAB101', 'estado': 2}])
+            mensaje = await asyncio.wait_for(lectura, 5)
+            await stream.aclose()
+            return mensaje
+
+        with mock.patch('habitaciones.bus.bus', bus):
+            mensaje = asyncio.run(escenario())
+        self.assertEqual(mensaje.cambios, [{'codigo': 'HAB101', 'estado': 2}])
+        self.assertEqual(mensaje.id, ultimo_evento())
+
+    def test_conexiones_simultaneas_inician_un_solo_relevo(self):
+        bus = BusSQLite()
+        relevos = []
+
+        async def preparar():
+            await asyncio.sleep(0.05)
+
+        async def relevo():
+            relevos.append(1)
+            await asyncio.sleep(0.1)
+
+        async def escenario():
+            await asyncio.gather(*(bus.asegurar_relevo() for _ in range(5)))
+            await bus._tarea
+
+        with mock.patch.object(bus, '_preparar', preparar), mock.patch.object(bus, '_relevo', relevo):
+            asyncio.run(escenario())
+        self.assertEqual(relevos, [1])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels_redis.core.RedisChannelLayer'}})
+class BusChannelsTests(TransactionTestCase):
+    def test_eventos_con_los_ids_de_la_tabla(self):
+        from channels.layers import InMemoryChannelLayer
+        bus = BusChannels()
+        bus._capa = InMemoryChannelLayer()  # Hace de capa compartida entre procesos
+
+        async def escenario():
+            stream = gestion_sse.mensajes()
+            lectura = asyncio.ensure_future(anext(stream))
+            await asyncio.sleep(0.05)
+            await sync_to_async(bus.publicar)([{'codigo': 'HAB101', 'estado': 2}])
+            mensaje = await asyncio.wait_for(lectura, 5)
+            await stream.aclose()
+            return mensaje
+
+        with mock.patch('habitaciones.bus.bus', bus):
+            mensaje = asyncio.run(escenario())
+        # Otro worker numera el mismo evento igual: Last-Event-ID sirve en cualquiera
+        self.assertEqual(mensaje.cambios, [{'codigo': 'HAB101', 'estado': 2}])
+        self.assertEqual(mensaje.id, ultimo_evento())
+
+    def test_no_arranca_con_la_capa_en_memoria(self):
+        with override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}):
+            with self.assertRaises(ImproperlyConfigured):
+                BusChannels()
+
+
+class DashboardWebsocketTests(TestCase):
+    fixtures = FIXTURES
+
+    def conectar(self, ruta, origen='http://localhost:5173'):
+        """Abre la conexión contra la aplicación ASGI completa y devuelve el primer mensaje enviado."""
+        from Gestion_Reserva.asgi import application
+
+        ruta, _, query = ruta.partition('?')
+        scope = {
+            'type': 'websocket', 'path': ruta, 'query_string': query.encode(),
+            'headers': [(b'host', b'localhost'), (b'origin', origen.encode())], 'subprotocols': [],
+        }
+
+        async def escenario():
+            entrada, salida = asyncio.Queue(), asyncio.Queue()
+            await entrada.put({'type': 'websocket.connect'})
+            app = asyncio.ensure_future(application(scope, entrada.get, salida.put))
+            respuesta = await asyncio.wait_for(salida.get(), 5)
+            await entrada.put({'type': 'websocket.disconnect', 'code': 1000})
+            await asyncio.wait_for(app, 5)
+            return respuesta
+
+        return async_to_sync(escenario)()
+
+    def test_sin_token_se_rechaza(self):
+        for ruta in ('/ws/habitaciones-dashboard/', '/ws/habitaciones-dashboard/?token=invalido'):
+            self.assertEqual(self.conectar(ruta), {'type': 'websocket.close', 'code': 4401})
+
+    def test_con_token_se_acepta(self):
+        usuario = Usuario.objects.create_user('70000001', 'Ana', 'Pérez', password='clave-segura', rol='RECEPCIONISTA')
+        token = AccessToken.for_user(usuario)
+        self.assertEqual(self.conectar(f'/ws/habitaciones-dashboard/?token={token}')['type'], 'websocket.accept')
+
+    def test_origen_ajeno_se_rechaza(self):
+        usuario = Usuario.objects.create_user('70000001', 'Ana', 'Pérez', password='clave-segura', rol='RECEPCIONISTA')
+        token = AccessToken.for_user(usuario)
+        for origen in ('https://otro-sitio.example', 'http://localhost'):
+            respuesta = self.conectar(f'/ws/habitaciones-dashboard/?token={token}', origen=origen)
+            self.assertEqual(respuesta['type'], 'websocket.close')
+
+
+class DashboardCacheTests(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_guardar_habitacion_actualiza_solo_su_entrada_y_el_etag(self):
+        respuesta = self.client.get('/api/habitaciones/dashboard/')
+        self.assertEqual(respuesta.status_code, 200)
+        etag = respuesta['ETag']
+        self.assertEqual(
+            self.client.get('/api/habitaciones/dashboard/', HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+
+        habitacion = Habitacion.objects.select_related('id_estado', 'id_tipo').get(pk='HAB101')
+        habitacion.id_estado = EstadoHabitacion.objects.get(pk=5)
+        catalogos.estados_habitacion.todos()
+        catalogos.tipos_habitacion.todos()
+        # El UPDATE de la habitación, su cambio de disponibilidad y la versión compartida del dashboard
+        with self.assertNumQueries(3), self.captureOnCommitCallbacks(execute=True):
+            habitacion.save()
+
+        respuesta = self.client.get('/api/habitaciones/dashboard/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        fila = next(f for f in respuesta.json() if f['codigo'] == 'HAB101')
+        self.assertEqual(fila['id_estado__nombre'], 'Limpieza')
+
+    def test_escritura_de_otro_proceso_invalida_la_cache_local(self):
+        etag = self.client.get('/api/habitaciones/dashboard/')['ETag']
+        # Otro worker guarda la habitación: actualiza su propia caché y la versión compartida
+        Habitacion.objects.filter(pk='HAB101').update(id_estado=5)
+        versiones.incrementar_version(dashboard.CLAVE_VERSION)
+
+        respuesta = self.client.get('/api/habitaciones/dashboard/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        fila = next(f for f in respuesta.json() if f['codigo'] == 'HAB101')
+        self.assertEqual(fila['id_estado__nombre'], 'Limpieza')
+        self.assertEqual(
+            self.client.get('/api/habitaciones/dashboard/', HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304
+        )
+
+
+class CatalogosTests(TestCase):
+    fixtures = FIXTURES
+
+    def test_busquedas_sin_consultas_e_invalidacion_al_guardar(self):
+        catalogos.estados_habitacion.todos()
+        catalogos.estados_reserva.todos()
+        with self.assertNumQueries(0):
+            self.assertEqual(catalogos.estados_habitacion.get('5').nombre, 'Limpieza')
+            self.assertEqual(catalogos.estados_reserva.por_nombre('Cancelada').pk, 3)
+        with self.assertRaises(EstadoHabitacion.DoesNotExist):
+            catalogos.estados_habitacion.get(99)
+
+        respuesta = self.client.get('/api/habitaciones/estados/')
+        etag = respuesta['ETag']
+        self.assertEqual(self.client.get('/api/habitaciones/estados/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        estado = EstadoHabitacion.objects.get(pk=5)
+        estado.descripcion = 'En limpieza'
+        with self.captureOnCommitCallbacks(execute=True):
+            estado.save()
+        respuesta = self.client.get('/api/habitaciones/estados/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('En limpieza', [e['descripcion'] for e in respuesta.json()])
@@ -7,7 +7,8 @@ from .views import (
     tipos_habitacion,
     buscar_disponibilidad,
     finalizar_limpieza,
-    habitaciones_dashboard_sse
+    habitaciones_dashboard_sse,
+    habitaciones_dashboard
 )
 
 urlpatterns = [
@@ -21,5 +22,6 @@ urlpatterns = [
     # Información de referencia
     path('estados/', estados_habitacion, name='estados_habitacion'),
     path('tipos/', tipos_habitacion, name='tipos_habitacion'),
+    path('dashboard/', habitaciones_dashboard, name='habitaciones_dashboard'),
     path('sse/habitaciones-dashboard/', habitaciones_dashboard_sse, name='habitaciones_dashboard_sse'),
 ]
@@ -0,0 +1,35 @@
+"""
+Versiones compartidas entre procesos, guardadas en la base de datos.
+
+Se usan para invalidar datos que cada proceso guarda en memoria (catálogos,
+proyección del dashboard, niveles de fidelidad): quien escribe incrementa
+la versión y los demás procesos la comparan con la que conocen.
+
+Van en la tabla ``version_compartida`` y no en la caché de Django porque la
+caché configurada (``LocMemCache``) es propia de cada proceso: un contador en
+ella nunca ve las escrituras de otro worker. Leer una versión es una consulta
+por clave primaria; incrementarla, un solo ``INSERT ... ON CONFLICT DO UPDATE
+... RETURNING`` (SQLite 3.35+ o PostgreSQL), atómico aunque dos procesos
+escriban a la vez.
+"""
+from django.db import connection
+
+from .models import VersionCompartida
+
+
+def obtener_version(clave):
+    """Versión actual; 0 si nunca se incrementó."""
+    valor = VersionCompartida.objects.filter(clave=clave).values_list('valor', flat=True).first()
+    return valor or 0
+
+
+def incrementar_version(clave):
+    """Incrementa la versión y devuelve el nuevo valor."""
+    tabla = connection.ops.quote_name(VersionCompartida._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {tabla} (clave, valor) VALUES (%s, 1) '
+            f'ON CONFLICT (clave) DO UPDATE SET valor = {tabla}.valor + 1 RETURNING valor',
+            [clave],
+        )
+        return cursor.fetchone()[0]
@@ -11,7 +11,10 @@ from django.core.cache import cache
 from django.http import JsonResponse
 from django.http import HttpResponse, StreamingHttpResponse
 from asgiref.sync import sync_to_async
-from .gestion_sse import subscribe
+from .gestion_sse import event_stream
+from .disponibilidad import buscar_habitaciones_libres
+from . import dashboard
+from .catalogos import estados_habitacion as catalogo_estados, tipos_habitacion as catalogo_tipos
 
 
 import asyncio
@@ -44,6 +47,16 @@ def listar_habitaciones(request):
     serializer = HabitacionSerializer(habitaciones, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
+
+@api_view(['GET'])
+def habitaciones_dashboard(request):
+    """Proyección del dashboard servida desde la caché, con ETag por versión - Acceso público"""
+    etag = f'"{dashboard.version()}"'
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    version, habitaciones = dashboard.leer()
+    return Response(habitaciones, status=status.HTTP_200_OK, headers={'ETag': f'"{version}"'})
+
 @api_view(['GET'])
 def habitaciones_disponibles(request):
     """Lista solo las habitaciones disponibles para reservar - Acceso público"""
@@ -67,7 +80,7 @@ def cambiar_estado_habitacion(request, codigo_habitacion):
                        status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        nuevo_estado = EstadoHabitacion.objects.get(pk=nuevo_estado_id)
+        nuevo_estado = catalogo_estados.get(nuevo_estado_id)
         habitacion.id_estado = nuevo_estado
         
         # Si se marca como disponible después de limpieza, actualizar fecha
@@ -85,28 +98,41 @@ def cambiar_estado_habitacion(request, codigo_habitacion):
     except EstadoHabitacion.DoesNotExist:
         return Response({"error": "Estado no válido"}, status=status.HTTP_400_BAD_REQUEST)
 
+# Catálogo -> (etag, datos ya serializados)
+_respuestas_catalogo = {}
+
+
+def _respuesta_catalogo(request, catalogo, serializar):
+    """Respuesta de un catálogo cacheado; la versión del catálogo es el ETag."""
+    etag = f'"{catalogo.version}"'
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    cacheada = _respuestas_catalogo.get(catalogo.modelo_label)
+    if cacheada is None or cacheada[0] != etag:
+        cacheada = (etag, [serializar(fila) for fila in catalogo.todos()])
+        _respuestas_catalogo[catalogo.modelo_label] = cacheada
+    return Response(cacheada[1], status=status.HTTP_200_OK, headers={'ETag': etag})
+
 @api_view(['GET'])
 def estados_habitacion(request):
     """Lista todos los estados de habitación disponibles - Acceso público"""
-    estados = EstadoHabitacion.objects.all()
-    return Response([{
+    return _respuesta_catalogo(request, catalogo_estados, lambda estado: {
         "id": estado.id_estado,
         "nombre": estado.nombre,
         "descripcion": estado.descripcion,
         "permite_reserva": estado.permite_reserva
-    } for estado in estados], status=status.HTTP_200_OK)
+    })
 
 @api_view(['GET'])
 def tipos_habitacion(request):
     """Lista todos los tipos de habitación disponibles - Acceso público"""
-    tipos = TipoHabitacion.objects.all()
-    return Response([{
+    return _respuesta_catalogo(request, catalogo_tipos, lambda tipo: {
         "id": tipo.id_tipo,
         "nombre": tipo.nombre,
         "descripcion": tipo.descripcion,
         "capacidad_maxima": tipo.capacidad_maxima,
         "precio_base": tipo.precio_base
-    } for tipo in tipos], status=status.HTTP_200_OK)
+    })
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -121,16 +147,9 @@ def buscar_disponibilidad(request):
     if not (fecha_checkin and fecha_checkout and tipo_habitacion and numero_huespedes):
         return Response({'detail': 'Faltan datos.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    habitaciones = Habitacion.objects.filter(
-        id_tipo__nombre__iexact=tipo_habitacion,
-        id_tipo__capacidad_maxima__gte=numero_huespedes
-    )
-
-    habitaciones_disponibles = habitaciones.exclude(
-        reserva__fecha_checkin_programado__lt=fecha_checkout,
-        reserva__fecha_checkout_programado__gt=fecha_checkin,
-        reserva__id_estado_reserva__nombre__in=['Pendiente', 'Confirmada', 'Ocupada']
-    ).distinct()
+    habitaciones_disponibles = buscar_habitaciones_libres(
+        tipo_habitacion, numero_huespedes, fecha_checkin, fecha_checkout
+    ).select_related('id_tipo', 'id_estado')
 
     serializer = HabitacionSerializer(habitaciones_disponibles, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
@@ -140,46 +159,31 @@ def buscar_disponibilidad(request):
 def finalizar_limpieza(request, codigo_habitacion):
     if request.user.rol not in ['ADMIN', 'RECEPCIONISTA', 'SUPERVISOR']:
         return Response({"error": "Sin permisos para finalizar limpieza"}, status=403)
-    try:
-        habitacion = Habitacion.objects.get(codigo=codigo_habitacion)
-        estado_limpieza = EstadoHabitacion.objects.get(nombre='Limpieza')
-        estado_disponible = EstadoHabitacion.objects.get(nombre='Disponible')
-        # Verificar que la habitación esté en estado "Limpieza"
-        if habitacion.id_estado != estado_limpieza:
-            return Response(
-                {"error": "La habitación no está en estado de Limpieza."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        habitacion.id_estado = estado_disponible
-        habitacion.save()
-        return Response({
-            "message": "Limpieza finalizada, habitación disponible",
-            "habitacion": {
-                "codigo": habitacion.codigo,
-                "numero": habitacion.numero_habitacion,
-                "estado": habitacion.id_estado.nombre
-            }
-        }, status=200)
-    except Habitacion.DoesNotExist:
-        return Response({"error": "Habitación no encontrada"}, status=404)
+    from reservas.transiciones import finalizar_limpieza as finalizar
+    get_object_or_404(Habitacion, codigo=codigo_habitacion)
+    habitacion = finalizar(codigo_habitacion)
+    # Verificar que la habitación esté en estado "Limpieza"
+    if habitacion is None:
+        return Response(
+            {"error": "La habitación no está en estado de Limpieza."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return Response({
+        "message": "Limpieza finalizada, habitación disponible",
+        "habitacion": {
+            "codigo": habitacion.codigo,
+            "numero": habitacion.numero_habitacion,
+            "estado": habitacion.id_estado.nombre
+        }
+    }, status=200)
 
 # SSE para mostrar habitaciones para el dashboard en tiempo real
 async def habitaciones_dashboard_sse(request):
-    queue = asyncio.Queue()
-
-    unsubscribe = subscribe(queue)
-
-    async def event_stream():
-        try:
-            while True:
-                data = await queue.get()
-                yield f'data: {data}\n\n'
-        except asyncio.CancelledError:
-            unsubscribe()
-
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
     response = StreamingHttpResponse(
-        event_stream(),
+        event_stream(last_event_id),
         content_type='text/event-stream'
     )
     response['Cache-Control'] = 'no-cache'
-    return response
\ No newline at end of file
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import CuentaCobrar
+from .models import CuentaCobrar, EventoPasarela
 
 admin.site.register(CuentaCobrar)
+admin.site.register(EventoPasarela)
 # Register your models here.
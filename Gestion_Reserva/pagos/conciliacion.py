@@ -0,0 +1,284 @@
+"""
+Conciliación de los cobros de la pasarela con el libro de pagos.
+
+Los registros del proveedor (PaymentIntent) se leen como un flujo, de un
+archivo exportado (``desde_archivo``) o de la API de la pasarela
+(``desde_pasarela``, página por página), y se procesan por lotes de
+``lote`` registros: cada lote hace dos consultas, las cuentas por
+``payment_intent_id`` (índice ``idx_cuenta_payment_intent``) y los
+movimientos de tarjeta por referencia, más una por ``metadata.cuenta_id``
+para los intentos que la cuenta aún no tiene guardados. La memoria depende
+del tamaño del lote, no del total de registros.
+
+Cada registro queda en una de las clases de ``CLASES``. Con ``aplicar`` se
+corrigen en bloque las que tienen una sola corrección posible:
+
+- ``pago_no_registrado``: se insertan los movimientos que faltan y se
+  actualizan los acumulados de las cuentas con un solo ``UPDATE``.
+- ``estado_desfasado``: la cuenta pasa a PAGADO.
+
+Las cuentas que quedan pagadas confirman sus reservas pendientes como al
+procesar el webhook. Las demás clases solo se informan para revisión manual.
+"""
+import csv
+import itertools
+import json
+import uuid
+from collections import Counter, namedtuple
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from . import movimientos, pasarelas, procesador
+from .models import CuentaCobrar, MovimientoPago
+
+TAMANO_LOTE = 1000
+MAX_EJEMPLOS = 20
+OBSERVACION = 'Pago con tarjeta (conciliación)'
+
+CONCILIADO = 'conciliado'
+CLASES = {
+    CONCILIADO: "Coincide con el libro",
+    'pago_no_registrado': "Cobrado en la pasarela sin movimiento en el libro (se registra)",
+    'estado_desfasado': "Saldo cubierto pero la cuenta sigue abierta (se marca PAGADO)",
+    'monto_distinto': "El movimiento no coincide con el monto cobrado",
+    'cobro_cuenta_cancelada': "Cobrado en la pasarela para una cuenta cancelada",
+    'pago_sin_respaldo': "Movimiento de tarjeta sin cobro en la pasarela",
+    'pagada_sin_cobro': "Cuenta PAGADO con saldo y sin cobro en la pasarela",
+    'sin_cuenta': "Cobro sin cuenta asociada",
+}
+CORREGIBLES = ('pago_no_registrado', 'estado_desfasado')
+
+# Un PaymentIntent del proveedor; ``monto`` es lo cobrado, en centavos
+RegistroPasarela = namedtuple('RegistroPasarela', 'id estado monto cuenta_id')
+Diferencia = namedtuple('Diferencia', 'clase id_intento cuenta_id estado_pasarela monto_pasarela monto_libro estado_cuenta')
+
+# Nombres de columna aceptados en las exportaciones CSV (en minúsculas)
+COLUMNAS = {
+    'id': ('id', 'payment_intent', 'paymentintent id'),
+    'estado': ('status', 'estado'),
+    'monto': ('amount_received', 'amount received', 'amount'),
+    'cuenta_id': ('cuenta_id', 'cuenta_id (metadata)', 'metadata.cuenta_id'),
+}
+
+
+@dataclass
+class ResultadoConciliacion:
+    registros: int = 0
+    lotes: int = 0
+    corregidos: int = 0
+    reservas_confirmadas: int = 0
+    por_clase: Counter = field(default_factory=Counter)
+    # Primeras MAX_EJEMPLOS diferencias de cada clase
+    ejemplos: dict = field(default_factory=dict)
+
+    @property
+    def diferencias(self):
+        return sum(n for clase, n in self.por_clase.items() if clase != CONCILIADO)
+
+    def __str__(self):
+        return (f"{self.registros} registros en {self.lotes} lotes: {self.diferencias} diferencias, "
+                f"{self.corregidos} corregidas, {self.reservas_confirmadas} reservas confirmadas")
+
+
+# --- Fuentes de registros ---
+
+def _centavos(valor):
+    """Entero: centavos (como la API). Con punto decimal: unidades (como el panel de Stripe)."""
+    valor = str(valor or '0').strip().replace(',', '')
+    if '.' in valor:
+        return int(Decimal(valor) * 100)
+    return int(valor)
+
+
+def _registro(id_intento, estado, monto, cuenta_id):
+    return RegistroPasarela(id_intento, (estado or '').lower(), _centavos(monto), cuenta_id or None)
+
+
+def _leer_csv(archivo):
+    lector = csv.DictReader(archivo)
+    encabezados = {nombre.strip().lower(): nombre for nombre in lector.fieldnames or []}
+    columnas = {}
+    for campo, alias in COLUMNAS.items():
+        columnas[campo] = next((encabezados[a] for a in alias if a in encabezados), None)
+    if not columnas['id'] or not columnas['estado']:
+        raise ValueError("El archivo debe tener las columnas id y status")
+    for fila in lector:
+        yield _registro(*(fila.get(columnas[c]) if columnas[c] else None for c in COLUMNAS))
+
+
+def _leer_jsonl(archivo):
+    for linea in archivo:
+        if not linea.strip():
+            continue
+        objeto = json.loads(linea)
+        monto = objeto.get('amount_received')
+        if monto is None and objeto.get('status') == 'succeeded':
+            monto = objeto.get('amount')
+        yield _registro(objeto['id'], objeto.get('status'), monto, (objeto.get('metadata') or {}).get('cuenta_id'))
+
+
+def desde_archivo(ruta):
+    """PaymentIntent exportados: JSON por línea (objetos de la API) si la
+    extensión es .jsonl, si no CSV con encabezados (ver ``COLUMNAS``)."""
+    with open(ruta, newline='', encoding='utf-8') as archivo:
+        if str(ruta).endswith('.jsonl'):
+            yield from _leer_jsonl(archivo)
+        else:
+            yield from _leer_csv(archivo)
+
+
+def desde_pasarela(pasarela=None, creado_desde=None):
+    for intento in (pasarela or pasarelas.obtener()).listar_intentos(creado_desde=creado_desde):
+        monto = intento.monto_recibido or (intento.monto if intento.estado == 'succeeded' else 0)
+        yield RegistroPasarela(intento.id, intento.estado, monto, intento.metadata.get('cuenta_id'))
+
+
+# --- Conciliación ---
+
+def _uuid(valor):
+    try:
+        return uuid.UUID(str(valor))
+    except ValueError:
+        return None
+
+
+def _cruzar(registros):
+    """Cuentas y movimientos de tarjeta de un lote: {id_intento: cuenta} y
+    {referencia: movimiento}, como dicts."""
+    campos = ('pk', 'payment_intent_id', 'estado', 'saldo_pendiente', 'codigo_reserva_id', 'grupo_id')
+    ids = [r.id for r in registros]
+    cuentas = {c['payment_intent_id']: c for c in CuentaCobrar.objects.filter(payment_intent_id__in=ids).values(*campos)}
+
+    # Intentos que la cuenta no tiene guardados (p. ej. reemplazados por otro)
+    sin_cruzar = {r.id: _uuid(r.cuenta_id) for r in registros if r.id not in cuentas and _uuid(r.cuenta_id)}
+    if sin_cruzar:
+        por_pk = {c['pk']: c for c in CuentaCobrar.objects.filter(pk__in=set(sin_cruzar.values())).values(*campos)}
+        for id_intento, pk in sin_cruzar.items():
+            if pk in por_pk:
+                cuentas[id_intento] = por_pk[pk]
+
+    pagos = {
+        m['referencia']: m
+        for m in MovimientoPago.objects.filter(metodo='tarjeta', referencia__in=ids).values('referencia', 'monto', 'cuenta_id')
+    }
+    return cuentas, pagos
+
+
+def clasificar(registro, cuenta, pago):
+    """Clase de ``CLASES`` para un registro del proveedor, su cuenta y su
+    movimiento de tarjeta (o None)."""
+    if registro.estado == 'succeeded':
+        if cuenta is None:
+            return 'sin_cuenta'
+        if pago is None:
+            return 'cobro_cuenta_cancelada' if cuenta['estado'] == 'CANCELADO' else 'pago_no_registrado'
+        if pago['monto'] != Decimal(registro.monto) / 100:
+            return 'monto_distinto'
+        if cuenta['estado'] in movimientos.ESTADOS_ABIERTOS and cuenta['saldo_pendiente'] <= 0:
+            return 'estado_desfasado'
+        return CONCILIADO
+    if cuenta is None or registro.estado == 'processing':
+        return CONCILIADO  # Otra integración, o el cobro todavía está en curso
+    if pago is not None:
+        return 'pago_sin_respaldo'
+    if cuenta['estado'] == 'PAGADO' and cuenta['saldo_pendiente'] > 0:
+        return 'pagada_sin_cobro'
+    return CONCILIADO
+
+
+def _montos_por_cuenta(pendientes):
+    montos = {}
+    for cuenta, registro in pendientes:
+        montos[cuenta['pk']] = montos.get(cuenta['pk'], 0) + Decimal(registro.monto) / 100
+    return montos
+
+
+def _aplicar_en_bloque(pendientes, desfasadas):
+    ahora = timezone.now()
+    montos = _montos_por_cuenta(pendientes)
+    decimal = models.DecimalField(max_digits=10, decimal_places=2)
+    abono = Case(*[When(pk=pk, then=Value(monto)) for pk, monto in montos.items()], output_field=decimal)
+    with transaction.atomic():
+        MovimientoPago.objects.bulk_create([
+            MovimientoPago(cuenta_id=cuenta['pk'], metodo='tarjeta', monto=Decimal(registro.monto) / 100,
+                           referencia=registro.id, observaciones=OBSERVACION)
+            for cuenta, registro in pendientes
+        ])
+        if montos:
+            CuentaCobrar.objects.filter(pk__in=montos).update(
+                monto_pagado=F('monto_pagado') + abono,
+                saldo_pendiente=F('saldo_pendiente') - abono,
+                payment_intent_id=Case(*[When(pk=c['pk'], then=Value(r.id)) for c, r in pendientes]),
+                updated_at=ahora,
+            )
+        cerradas = CuentaCobrar.objects.filter(
+            pk__in=set(montos) | {c['pk'] for c in desfasadas},
+            estado__in=movimientos.ESTADOS_ABIERTOS, saldo_pendiente__lte=0,
+        )
+        pagadas = list(cerradas.values('pk', 'codigo_reserva_id', 'grupo_id'))
+        cerradas.update(estado='PAGADO', updated_at=ahora)
+    return pagadas
+
+
+def _aplicar(pendientes, desfasadas):
+    """Corrige un lote y devuelve las cuentas que quedaron pagadas."""
+    try:
+        return _aplicar_en_bloque(pendientes, desfasadas)
+    except IntegrityError:
+        # El procesador de eventos registró alguno de estos pagos mientras
+        # tanto: se registran uno a uno (``registrar`` ignora los repetidos)
+        pagadas = []
+        for cuenta, registro in pendientes:
+            if movimientos.registrar(cuenta['pk'], Decimal(registro.monto) / 100, 'tarjeta',
+                                     referencia=registro.id, observaciones=OBSERVACION).pagada:
+                pagadas.append(cuenta)
+        if desfasadas:
+            pagadas += _aplicar_en_bloque([], desfasadas)
+        return pagadas
+
+
+def conciliar(registros, lote=TAMANO_LOTE, aplicar=False, reporte=None):
+    """Concilia un flujo de ``RegistroPasarela``. ``reporte``, si se indica,
+    recibe cada ``Diferencia`` (todas, no solo los ejemplos del resultado)."""
+    resultado = ResultadoConciliacion()
+    registros = iter(registros)
+    while True:
+        bloque = list(itertools.islice(registros, lote))
+        if not bloque:
+            return resultado
+        resultado.lotes += 1
+        resultado.registros += len(bloque)
+        cuentas, pagos = _cruzar(bloque)
+
+        pendientes, desfasadas = [], []
+        for registro in bloque:
+            cuenta, pago = cuentas.get(registro.id), pagos.get(registro.id)
+            clase = clasificar(registro, cuenta, pago)
+            resultado.por_clase[clase] += 1
+            if clase == CONCILIADO:
+                continue
+            if clase == 'pago_no_registrado':
+                pendientes.append((cuenta, registro))
+            elif clase == 'estado_desfasado':
+                desfasadas.append(cuenta)
+            diferencia = Diferencia(
+                clase, registro.id, cuenta and str(cuenta['pk']), registro.estado, Decimal(registro.monto) / 100,
+                pago and pago['monto'], cuenta and cuenta['estado'],
+            )
+            ejemplos = resultado.ejemplos.setdefault(clase, [])
+            if len(ejemplos) < MAX_EJEMPLOS:
+                ejemplos.append(diferencia)
+            if reporte:
+                reporte(diferencia)
+
+        if aplicar and (pendientes or desfasadas):
+            pagadas = _aplicar(pendientes, desfasadas)
+            resultado.corregidos += len(pendientes) + len(desfasadas)
+            for cuenta in pagadas:
+                with transaction.atomic():
+                    confirmadas = procesador.confirmar_reservas(cuenta)
+                resultado.reservas_confirmadas += confirmadas
@@ -0,0 +1,52 @@
+"""
+Eventos de webhook firmados localmente, con el mismo esquema que Stripe.
+
+La cabecera ``Stripe-Signature`` es ``t=<timestamp>,v1=<firma>``, donde la
+firma es el HMAC-SHA256 en hexadecimal de ``"<timestamp>.<payload>"`` con el
+secreto del webhook. ``stripe.Webhook.construct_event`` la verifica sin
+conectarse a Stripe, así que estos eventos sirven para pruebas y para
+reproducir entregas sin la pasarela real.
+"""
+import hashlib
+import hmac
+import json
+import time
+import uuid
+
+
+def evento(tipo, objeto, id_evento=None):
+    """Cuerpo de un evento de Stripe con ``objeto`` en ``data.object``."""
+    return {
+        'id': id_evento or f'evt_{uuid.uuid4().hex}',
+        'object': 'event',
+        'type': tipo,
+        'created': int(time.time()),
+        'data': {'object': objeto},
+    }
+
+
+def payment_intent(cuenta_id, monto_centavos=0, id_intent=None, estado='succeeded'):
+    return {
+        'id': id_intent or f'pi_{uuid.uuid4().hex[:24]}',
+        'object': 'payment_intent',
+        'amount': monto_centavos,
+        'amount_received': monto_centavos if estado == 'succeeded' else 0,
+        'currency': 'usd',
+        'status': estado,
+        'metadata': {'cuenta_id': str(cuenta_id)},
+    }
+
+
+def firmar(payload, secreto, timestamp=None):
+    """Devuelve la cabecera Stripe-Signature para ``payload`` (bytes o str)."""
+    if isinstance(payload, bytes):
+        payload = payload.decode('utf-8')
+    timestamp = int(timestamp if timestamp is not None else time.time())
+    firma = hmac.new(secreto.encode('utf-8'), f'{timestamp}.{payload}'.encode('utf-8'), hashlib.sha256)
+    return f't={timestamp},v1={firma.hexdigest()}'
+
+
+def firmado(datos, secreto, timestamp=None):
+    """Devuelve (payload en bytes, cabecera) listos para enviar al webhook."""
+    payload = json.dumps(datos).encode('utf-8')
+    return payload, firmar(payload, secreto, timestamp)
@@ -0,0 +1,57 @@
+import csv
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from pagos import conciliacion, pasarelas
+
+
+class Command(BaseCommand):
+    help = ("Concilia los PaymentIntent de la pasarela (o de un archivo exportado) con el libro de "
+            "pagos. Sin --aplicar solo informa las diferencias.")
+
+    def add_arguments(self, parser):
+        fuente = parser.add_mutually_exclusive_group(required=True)
+        fuente.add_argument('--archivo', help="Exportación de PaymentIntent (.csv o .jsonl)")
+        fuente.add_argument('--pasarela', action='store_true', help="Leer los intentos de la pasarela configurada")
+        parser.add_argument('--desde', help="Con --pasarela, solo intentos creados desde esta fecha (AAAA-MM-DD)")
+        parser.add_argument('--lote', type=int, default=conciliacion.TAMANO_LOTE, help="Registros por lote")
+        parser.add_argument('--aplicar', action='store_true', help="Corregir las diferencias corregibles")
+        parser.add_argument('--reporte', help="Escribir todas las diferencias en este CSV")
+
+    def handle(self, *args, archivo, pasarela, desde, lote, aplicar, reporte, **options):
+        if archivo:
+            registros = conciliacion.desde_archivo(archivo)
+        else:
+            creado_desde = None
+            if desde:
+                try:
+                    creado_desde = timezone.make_aware(datetime.strptime(desde, '%Y-%m-%d'))
+                except ValueError:
+                    raise CommandError("--desde debe tener el formato AAAA-MM-DD")
+            registros = conciliacion.desde_pasarela(creado_desde=creado_desde)
+
+        salida = open(reporte, 'w', newline='', encoding='utf-8') if reporte else None
+        try:
+            escribir = None
+            if salida:
+                escritor = csv.writer(salida)
+                escritor.writerow(conciliacion.Diferencia._fields)
+                escribir = escritor.writerow
+            resultado = conciliacion.conciliar(registros, lote=lote, aplicar=aplicar, reporte=escribir)
+        except (ValueError, OSError, pasarelas.PasarelaNoDisponible) as e:
+            raise CommandError(str(e))
+        finally:
+            if salida:
+                salida.close()
+
+        for clase, descripcion in conciliacion.CLASES.items():
+            if resultado.por_clase[clase]:
+                self.stdout.write(f"{clase:24} {resultado.por_clase[clase]:>8}  {descripcion}")
+                for diferencia in resultado.ejemplos.get(clase, [])[:5]:
+                    self.stdout.write(f"    {diferencia.id_intento} cuenta={diferencia.cuenta_id} "
+                                      f"pasarela={diferencia.monto_pasarela} libro={diferencia.monto_libro}")
+        if not aplicar and any(resultado.por_clase[c] for c in conciliacion.CORREGIBLES):
+            self.stdout.write("Sin --aplicar no se corrigió nada.")
+        self.stdout.write(self.style.SUCCESS(f"Conciliación: {resultado}"))
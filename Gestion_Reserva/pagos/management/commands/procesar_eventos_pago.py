@@ -0,0 +1,38 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from pagos import procesador
+
+
+class Command(BaseCommand):
+    help = ("Procesa los eventos del webhook de pagos pendientes. Con --continuo queda corriendo "
+            "con --hilos trabajadores.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=procesador.TAMANO_LOTE, help="Eventos por lote")
+        parser.add_argument('--continuo', action='store_true', help="No terminar al vaciar la cola")
+        parser.add_argument('--hilos', type=int, default=2, help="Trabajadores en modo continuo")
+        parser.add_argument('--intervalo', type=int, default=5, help="Segundos de espera con la cola vacía")
+        parser.add_argument('--metricas', action='store_true', help="Solo mostrar el estado de la cola")
+
+    def handle(self, *args, lote, continuo, hilos, intervalo, metricas, **options):
+        if metricas:
+            self.stdout.write(json.dumps(procesador.metricas(), indent=2))
+            return
+        if not continuo:
+            resultado = procesador.procesar(lote=lote)
+            self.stdout.write(self.style.SUCCESS(f"Cola procesada: {resultado}"))
+            return
+
+        trabajadores = procesador.iniciar_procesadores(hilos=hilos, intervalo=intervalo, lote=lote)
+        self.stdout.write(f"{len(trabajadores)} trabajadores en ejecución (Ctrl+C para detener)")
+        try:
+            while any(t.is_alive() for t in trabajadores):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            for trabajador in trabajadores:
+                trabajador.detener()
+            for trabajador in trabajadores:
+                trabajador.join()
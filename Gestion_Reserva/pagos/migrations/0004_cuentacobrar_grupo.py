@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagos', '0003_remove_cuentacobrar_idx_cuenta_reserva_and_more'),
+        ('reservas', '0010_grupo_reserva'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cuentacobrar',
+            name='grupo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='cuentas', to='reservas.gruporeserva'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagos', '0004_cuentacobrar_grupo'),
+        ('reservas', '0011_clave_idempotencia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cuentacobrar',
+            index=models.Index(fields=['estado', 'fecha_vencimiento'], name='idx_cuenta_estado_venc'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:51
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagos', '0005_cuentacobrar_idx_estado_vencimiento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoPasarela',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('proveedor', models.CharField(default='stripe', max_length=20)),
+                ('id_evento', models.CharField(max_length=255, unique=True)),
+                ('tipo', models.CharField(max_length=100)),
+                ('payload', models.JSONField()),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('PROCESANDO', 'Procesando'), ('PROCESADO', 'Procesado'), ('FALLIDO', 'Fallido')], default='PENDIENTE', max_length=20)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('disponible_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('trabajador', models.CharField(blank=True, max_length=32, null=True)),
+                ('ultimo_error', models.TextField(blank=True, null=True)),
+                ('recibido_en', models.DateTimeField(auto_now_add=True)),
+                ('procesado_en', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'evento_pasarela',
+                'indexes': [models.Index(fields=['estado', 'disponible_en'], name='idx_evento_estado_disp')],
+            },
+        ),
+    ]
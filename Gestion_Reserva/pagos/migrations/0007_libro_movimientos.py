@@ -0,0 +1,85 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def poblar_libro(apps, schema_editor):
+    """Calcula saldo_pendiente y registra un movimiento inicial por cada cuenta
+    con monto_pagado, de modo que la suma de movimientos coincida con él."""
+    CuentaCobrar = apps.get_model('pagos', 'CuentaCobrar')
+    MovimientoPago = apps.get_model('pagos', 'MovimientoPago')
+    CuentaCobrar.objects.update(saldo_pendiente=F('monto_total') - F('monto_pagado'))
+
+    pagadas = CuentaCobrar.objects.exclude(monto_pagado=0).order_by('pk').values_list(
+        'pk', 'monto_pagado', 'payment_intent_id', 'codigo_reserva__pago'
+    )
+    referencias = set()
+    filas = []
+    for cuenta_id, pagado, intent, pago in pagadas.iterator(chunk_size=1000):
+        # Con PaymentIntent el pago fue con tarjeta (Stripe); si no, el medio de la reserva
+        referencia = intent if intent and intent not in referencias else None
+        referencias.add(referencia)
+        filas.append(MovimientoPago(
+            cuenta_id=cuenta_id,
+            metodo='tarjeta' if intent else (pago or 'efectivo'),
+            monto=pagado,
+            referencia=referencia,
+            observaciones='Saldo inicial (monto_pagado anterior al libro de pagos)',
+        ))
+        if len(filas) >= 1000:
+            MovimientoPago.objects.bulk_create(filas)
+            filas = []
+    MovimientoPago.objects.bulk_create(filas)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagos', '0006_eventopasarela'),
+        ('reservas', '0011_clave_idempotencia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoPago',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('metodo', models.CharField(choices=[('efectivo', 'Efectivo'), ('yape', 'Yape'), ('plin', 'Plin'), ('tarjeta', 'Tarjeta'), ('transferencia', 'Transferencia')], max_length=20)),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('referencia', models.CharField(blank=True, max_length=255, null=True)),
+                ('observaciones', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'movimiento_pago',
+            },
+        ),
+        migrations.AddField(
+            model_name='cuentacobrar',
+            name='saldo_pendiente',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddIndex(
+            model_name='cuentacobrar',
+            index=models.Index(fields=['dni_huesped', 'estado'], name='idx_cuenta_huesped_estado'),
+        ),
+        migrations.AddField(
+            model_name='movimientopago',
+            name='cuenta',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='movimientos', to='pagos.cuentacobrar'),
+        ),
+        migrations.AddField(
+            model_name='movimientopago',
+            name='registrado_por',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='movimientos_registrados', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='movimientopago',
+            constraint=models.UniqueConstraint(condition=models.Q(('referencia__isnull', False)), fields=('metodo', 'referencia'), name='uniq_movimiento_referencia'),
+        ),
+        migrations.RunPython(poblar_libro, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagos', '0007_libro_movimientos'),
+        ('reservas', '0011_clave_idempotencia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cuentacobrar',
+            index=models.Index(fields=['payment_intent_id'], name='idx_cuenta_payment_intent'),
+        ),
+    ]
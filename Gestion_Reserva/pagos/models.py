@@ -1,6 +1,8 @@
 import uuid
+from decimal import Decimal
 from django.db import models
-from reservas.models import Reserva
+from django.utils import timezone
+from reservas.models import Reserva, GrupoReserva
 from huespedes.models import Huesped
 from django.conf import settings
 
@@ -14,16 +16,16 @@ class CuentaCobrar(models.Model):
     
     id_cuenta = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     codigo_reserva = models.ForeignKey(Reserva, on_delete=models.PROTECT)
+    # Cuenta consolidada de una reserva grupal (codigo_reserva es la primera del grupo)
+    grupo = models.ForeignKey(GrupoReserva, on_delete=models.PROTECT, null=True, blank=True, related_name='cuentas')
     dni_huesped = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
     monto_total = models.DecimalField(max_digits=10, decimal_places=2)
+    # monto_pagado y saldo_pendiente son la suma de los movimientos (MovimientoPago):
+    # solo cambian con UPDATE ... F() desde pagos.movimientos
     monto_pagado = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    saldo_pendiente = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     payment_intent_id = models.CharField(max_length=100, blank=True, null=True)  # Nuevo campo para Stripe
-    
-    # Campo calculado
-    @property
-    def saldo_pendiente(self):
-        return self.monto_total - self.monto_pagado
-    
+
     fecha_vencimiento = models.DateField()
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='PENDIENTE')
     observaciones = models.TextField(blank=True, null=True)
@@ -33,6 +35,87 @@ class CuentaCobrar(models.Model):
     def __str__(self):
         return f"Cuenta #{self.id_cuenta} - {self.estado}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.saldo_pendiente = Decimal(self.monto_total) - Decimal(self.monto_pagado)
+        super().save(*args, **kwargs)
+
     class Meta:
         db_table = 'cuenta_cobrar'
-        # ... índices existentes ...
\ No newline at end of file
+        indexes = [
+            # Barrido de cuentas vencidas (ver reservas.vencimiento) y antigüedad de saldos
+            models.Index(fields=['estado', 'fecha_vencimiento'], name='idx_cuenta_estado_venc'),
+            # Saldo abierto por huésped (ver pagos.movimientos)
+            models.Index(fields=['dni_huesped', 'estado'], name='idx_cuenta_huesped_estado'),
+            # Cruce con los PaymentIntent de la pasarela (ver pagos.conciliacion)
+            models.Index(fields=['payment_intent_id'], name='idx_cuenta_payment_intent'),
+        ]
+
+
+class MovimientoPago(models.Model):
+    """Entrada del libro de pagos de una cuenta. Solo se insertan: una
+    devolución o corrección es otro movimiento con monto negativo."""
+    id = models.BigAutoField(primary_key=True)
+    cuenta = models.ForeignKey(CuentaCobrar, on_delete=models.PROTECT, related_name='movimientos')
+    metodo = models.CharField(max_length=20, choices=Reserva.TIPO_PAGO_CHOICES)
+    monto = models.DecimalField(max_digits=10, decimal_places=2)
+    # Referencia del proveedor (PaymentIntent, operación de Yape, voucher...)
+    referencia = models.CharField(max_length=255, blank=True, null=True)
+    registrado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, null=True, blank=True,
+                                       related_name='movimientos_registrados')
+    observaciones = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'movimiento_pago'
+        constraints = [
+            # La misma operación del proveedor no se registra dos veces
+            models.UniqueConstraint(fields=['metodo', 'referencia'], condition=models.Q(referencia__isnull=False),
+                                    name='uniq_movimiento_referencia'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Los movimientos de pago no se modifican: registra otro movimiento.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Los movimientos de pago no se eliminan: registra otro movimiento.")
+
+    def __str__(self):
+        return f"{self.cuenta_id} {self.metodo} {self.monto}"
+
+
+class EventoPasarela(models.Model):
+    """Evento recibido por webhook de la pasarela de pagos, pendiente de
+    procesar (ver pagos.procesador). ``id_evento`` es el id del proveedor:
+    los reintentos de entrega no crean filas nuevas."""
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('PROCESANDO', 'Procesando'),
+        ('PROCESADO', 'Procesado'),
+        ('FALLIDO', 'Fallido'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    proveedor = models.CharField(max_length=20, default='stripe')
+    id_evento = models.CharField(max_length=255, unique=True)
+    tipo = models.CharField(max_length=100)
+    payload = models.JSONField()
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='PENDIENTE')
+    intentos = models.PositiveIntegerField(default=0)
+    # Próximo intento; en PROCESANDO, hasta cuándo dura la reserva del trabajador
+    disponible_en = models.DateTimeField(default=timezone.now)
+    trabajador = models.CharField(max_length=32, blank=True, null=True)
+    ultimo_error = models.TextField(blank=True, null=True)
+    recibido_en = models.DateTimeField(auto_now_add=True)
+    procesado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'evento_pasarela'
+        indexes = [
+            models.Index(fields=['estado', 'disponible_en'], name='idx_evento_estado_disp'),
+        ]
+
+    def __str__(self):
+        return f"{self.id_evento} ({self.tipo}) - {self.estado}"
@@ -0,0 +1,137 @@
+"""
+Libro de pagos de las cuentas por cobrar.
+
+Cada pago (o devolución, con monto negativo) es una fila de
+``MovimientoPago``; nunca se modifican ni se borran. La cuenta guarda los
+acumulados ``monto_pagado`` y ``saldo_pendiente``, que ``registrar`` mueve
+con ``UPDATE ... SET monto_pagado = monto_pagado + x`` en la misma
+transacción que el movimiento. Así dos pagos simultáneos (un depósito en
+efectivo y la tarjeta al hacer check-out) suman los dos, y los reportes leen
+el saldo sin recorrer los movimientos.
+
+Una referencia del proveedor (el PaymentIntent, la operación de Yape...) solo
+se registra una vez por método: registrarla de nuevo no hace nada.
+
+Los reportes son una sola consulta agrupada cada uno:
+
+- ``saldo_por_huesped``: saldo abierto por huésped (índice
+  ``idx_cuenta_huesped_estado``).
+- ``antiguedad``: saldo abierto por tramo de días de atraso respecto a
+  ``fecha_vencimiento`` (índice ``idx_cuenta_estado_venc``).
+
+Un saldo abierto es una cuenta PENDIENTE o VENCIDO. VENCIDO es deuda real
+(alguna reserva se confirmó o se hospedó); cuando el barrido de
+``reservas.vencimiento`` cancela una reserva abandonada, su cuenta pasa a
+CANCELADO y sale de los reportes.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Min, Sum, Value, When
+from django.utils import timezone
+
+from .models import CuentaCobrar, MovimientoPago
+
+CENTIMOS = Decimal('0.01')
+ESTADOS_ABIERTOS = ('PENDIENTE', 'VENCIDO')
+
+# (nombre, días de atraso hasta); el último tramo no tiene límite
+TRAMOS = (
+    ('por_vencer', 0),
+    ('1_30', 30),
+    ('31_60', 60),
+    ('61_90', 90),
+    ('mas_de_90', None),
+)
+
+Registro = namedtuple('Registro', 'movimiento pagada')
+
+
+class PagoInvalido(ValueError):
+    """El pago no se puede registrar."""
+
+
+def registrar(cuenta, monto, metodo, referencia=None, usuario=None, observaciones=None):
+    """Registra un movimiento y actualiza los acumulados de la cuenta.
+
+    Devuelve ``Registro(movimiento, pagada)``: ``pagada`` indica que este
+    movimiento cubrió el saldo y la cuenta pasó a PAGADO. Si la referencia ya
+    estaba registrada devuelve ``Registro(None, False)`` sin cambiar nada.
+    """
+    monto = Decimal(monto).quantize(CENTIMOS)
+    if not monto:
+        raise PagoInvalido("El monto del pago no puede ser cero.")
+    cuenta_id = getattr(cuenta, 'pk', cuenta)
+    ahora = timezone.now()
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                # Primero la cuenta: toma el lock de escritura y confirma que existe
+                actualizadas = CuentaCobrar.objects.filter(pk=cuenta_id).update(
+                    monto_pagado=F('monto_pagado') + monto,
+                    saldo_pendiente=F('saldo_pendiente') - monto,
+                    updated_at=ahora,
+                )
+                if not actualizadas:
+                    raise PagoInvalido("Cuenta no encontrada.")
+                movimiento = MovimientoPago.objects.create(
+                    cuenta_id=cuenta_id, metodo=metodo, monto=monto, referencia=referencia or None,
+                    registrado_por=usuario, observaciones=observaciones,
+                )
+        except IntegrityError:
+            if not referencia:
+                raise
+            return Registro(None, False)
+
+        pagada = bool(
+            CuentaCobrar.objects.filter(pk=cuenta_id, estado__in=ESTADOS_ABIERTOS, saldo_pendiente__lte=0)
+            .update(estado='PAGADO', updated_at=ahora)
+        )
+    if isinstance(cuenta, CuentaCobrar):
+        cuenta.refresh_from_db(fields=['monto_pagado', 'saldo_pendiente', 'estado', 'updated_at'])
+    return Registro(movimiento, pagada)
+
+
+def saldos_abiertos():
+    return CuentaCobrar.objects.filter(estado__in=ESTADOS_ABIERTOS, saldo_pendiente__gt=0)
+
+
+def saldo_por_huesped(dni=None):
+    """Saldo abierto agrupado por huésped, de mayor a menor."""
+    cuentas = saldos_abiertos()
+    if dni:
+        cuentas = cuentas.filter(dni_huesped=dni)
+    return list(
+        cuentas.values('dni_huesped')
+        .annotate(cuentas=Count('pk'), saldo=Sum('saldo_pendiente'), vencimiento_mas_antiguo=Min('fecha_vencimiento'))
+        .order_by('-saldo', 'dni_huesped')
+    )
+
+
+def antiguedad(hoy=None, dni=None):
+    """Cuentas y saldo abierto por tramo de atraso, en el orden de ``TRAMOS``
+    (los tramos vacíos aparecen con cero)."""
+    hoy = hoy or timezone.localdate()
+    condiciones = [
+        When(fecha_vencimiento__gte=hoy - timedelta(days=dias), then=Value(nombre))
+        for nombre, dias in TRAMOS if dias is not None
+    ]
+    cuentas = saldos_abiertos()
+    if dni:
+        cuentas = cuentas.filter(dni_huesped=dni)
+    filas = {
+        fila['tramo']: fila
+        for fila in cuentas.annotate(tramo=Case(*condiciones, default=Value(TRAMOS[-1][0])))
+        .values('tramo').annotate(cuentas=Count('pk'), saldo=Sum('saldo_pendiente')).order_by()
+    }
+    return [
+        {
+            'tramo': nombre,
+            'cuentas': filas.get(nombre, {}).get('cuentas', 0),
+            'saldo': filas.get(nombre, {}).get('saldo') or Decimal('0.00'),
+        }
+        for nombre, _ in TRAMOS
+    ]
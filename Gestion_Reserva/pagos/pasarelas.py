@@ -0,0 +1,305 @@
+"""
+Pasarelas de pago.
+
+El resto del código no llama a Stripe directamente: usa ``obtener()``, que
+devuelve la pasarela configurada en ``PAGOS_PASARELA``:
+
+- ``stripe``: ``StripeClient`` con una sesión HTTP compartida (conexiones
+  reutilizadas entre peticiones), timeouts estrictos de conexión y lectura
+  (``PAGOS_PASARELA_TIMEOUT_CONEXION`` / ``PAGOS_PASARELA_TIMEOUT``) y un
+  circuito que deja de llamar a Stripe durante ``PAGOS_CIRCUITO_ENFRIAMIENTO``
+  segundos tras ``PAGOS_CIRCUITO_UMBRAL`` fallos seguidos de red o del
+  servidor. Con el circuito abierto las llamadas fallan al instante con
+  ``PasarelaNoDisponible`` en lugar de retener el worker.
+- ``falsa``: pasarela en memoria, sin red, para pruebas y pruebas de carga.
+  ``simular_pago`` marca un intento como pagado y devuelve el evento de
+  webhook correspondiente (ver ``pagos.firmas``).
+
+La clave secreta solo se lee al crear la pasarela, no al importar módulos.
+"""
+import itertools
+import logging
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+
+import requests
+import stripe
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+
+from . import firmas
+
+logger = logging.getLogger(__name__)
+
+# Estados de un PaymentIntent que todavía pueden cobrarse
+ESTADOS_ABIERTOS = ('requires_payment_method', 'requires_confirmation', 'requires_action')
+
+
+class ErrorPasarela(ValueError):
+    """La pasarela rechazó la operación (datos no válidos, tarjeta, etc.)."""
+
+
+class PasarelaNoDisponible(Exception):
+    """La pasarela no respondió a tiempo, falló o el circuito está abierto."""
+
+
+@dataclass
+class Intento:
+    id: str
+    client_secret: str
+    estado: str
+    monto: int                      # En centavos
+    moneda: str = 'usd'
+    metadata: dict = field(default_factory=dict)
+    monto_recibido: int = 0
+
+    @property
+    def abierto(self):
+        return self.estado in ESTADOS_ABIERTOS
+
+
+class Circuito:
+    """Cortocircuito por fallos consecutivos. Abierto, deja pasar una sola
+    llamada de prueba al terminar el enfriamiento; si funciona, se cierra."""
+
+    def __init__(self, umbral=5, enfriamiento=30):
+        self.umbral = umbral
+        self.enfriamiento = enfriamiento
+        self.fallos = 0
+        self.abierto_hasta = None
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        with self._lock:
+            if self.abierto_hasta is None:
+                return True
+            if time.monotonic() >= self.abierto_hasta:
+                # Semiabierto: una llamada de prueba; las demás esperan su resultado
+                self.abierto_hasta = time.monotonic() + self.enfriamiento
+                return True
+            return False
+
+    def exito(self):
+        with self._lock:
+            self.fallos = 0
+            self.abierto_hasta = None
+
+    def fallo(self):
+        with self._lock:
+            self.fallos += 1
+            if self.fallos >= self.umbral:
+                if self.abierto_hasta is None:
+                    logger.warning("Circuito de la pasarela abierto tras %s fallos", self.fallos)
+                self.abierto_hasta = time.monotonic() + self.enfriamiento
+
+
+class PasarelaStripe:
+    # Fallos que indican que Stripe no está disponible (cuentan para el circuito)
+    ERRORES_DISPONIBILIDAD = (stripe.APIConnectionError, stripe.RateLimitError, stripe.APIError)
+
+    def __init__(self, api_key, timeout=10, timeout_conexion=3, reintentos=1, conexiones=20,
+                 umbral=5, enfriamiento=30):
+        sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=conexiones, max_retries=0)
+        sesion.mount('https://', adaptador)
+        self.cliente = stripe.StripeClient(
+            api_key,
+            max_network_retries=reintentos,
+            http_client=stripe.RequestsClient(timeout=(timeout_conexion, timeout), session=sesion),
+        )
+        self.circuito = Circuito(umbral, enfriamiento)
+
+    def _llamar(self, operacion, *args, **kwargs):
+        if not self.circuito.permitir():
+            raise PasarelaNoDisponible("La pasarela de pagos no está disponible temporalmente.")
+        try:
+            resultado = operacion(*args, **kwargs)
+        except self.ERRORES_DISPONIBILIDAD as e:
+            self.circuito.fallo()
+            raise PasarelaNoDisponible(f"Error de comunicación con la pasarela: {e}") from e
+        except stripe.StripeError as e:
+            self.circuito.exito()
+            raise ErrorPasarela(str(e)) from e
+        self.circuito.exito()
+        return resultado
+
+    @staticmethod
+    def _intento(objeto):
+        return Intento(
+            id=objeto.id, client_secret=objeto.client_secret, estado=objeto.status,
+            monto=objeto.amount, moneda=objeto.currency, metadata=dict(objeto.metadata or {}),
+            monto_recibido=objeto.amount_received or 0,
+        )
+
+    def crear_intento(self, monto, metadata, moneda='usd', clave_idempotencia=None):
+        opciones = {'idempotency_key': clave_idempotencia} if clave_idempotencia else {}
+        return self._intento(self._llamar(
+            self.cliente.payment_intents.create,
+            params={
+                'amount': monto,
+                'currency': moneda,
+                'automatic_payment_methods': {'enabled': True},
+                'metadata': metadata,
+            },
+            options=opciones,
+        ))
+
+    def obtener_intento(self, id_intento):
+        return self._intento(self._llamar(self.cliente.payment_intents.retrieve, id_intento))
+
+    def actualizar_monto(self, id_intento, monto):
+        return self._intento(self._llamar(
+            self.cliente.payment_intents.update, id_intento, params={'amount': monto},
+        ))
+
+    def cancelar_intento(self, id_intento):
+        return self._intento(self._llamar(self.cliente.payment_intents.cancel, id_intento))
+
+    def listar_intentos(self, creado_desde=None, pagina=100):
+        """Recorre los PaymentIntent (opcionalmente creados desde ``creado_desde``,
+        un datetime) página por página, sin cargarlos todos en memoria."""
+        params = {'limit': pagina}
+        if creado_desde:
+            params['created'] = {'gte': int(creado_desde.timestamp())}
+        while True:
+            lista = self._llamar(self.cliente.payment_intents.list, params=params)
+            for objeto in lista.data:
+                yield self._intento(objeto)
+            if not lista.has_more or not lista.data:
+                return
+            params['starting_after'] = lista.data[-1].id
+
+    def crear_sesion_checkout(self, monto, nombre, metadata, url_exito, url_cancelado, moneda='usd',
+                              clave_idempotencia=None):
+        """Devuelve la URL de la página de pago. Con la misma ``clave_idempotencia``
+        Stripe devuelve la sesión ya creada en lugar de abrir otra."""
+        opciones = {'idempotency_key': clave_idempotencia} if clave_idempotencia else {}
+        sesion = self._llamar(
+            self.cliente.checkout.sessions.create,
+            params={
+                'payment_method_types': ['card'],
+                'mode': 'payment',
+                'line_items': [{
+                    'price_data': {
+                        'currency': moneda,
+                        'unit_amount': monto,
+                        'product_data': {'name': nombre},
+                    },
+                    'quantity': 1,
+                }],
+                # Para que metadata llegue al webhook en el PaymentIntent
+                'payment_intent_data': {'metadata': metadata},
+                'success_url': url_exito,
+                'cancel_url': url_cancelado,
+            },
+            options=opciones,
+        )
+        return sesion.url
+
+
+class PasarelaFalsa:
+    """Pasarela en memoria con la misma interfaz. ``latencia`` (segundos)
+    simula el tiempo de respuesta del proveedor."""
+
+    def __init__(self, latencia=0):
+        self.latencia = latencia
+        self.intentos = {}
+        self.claves = {}
+        self.llamadas = 0
+        self._contador = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _esperar(self):
+        self.llamadas += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def crear_intento(self, monto, metadata, moneda='usd', clave_idempotencia=None):
+        self._esperar()
+        with self._lock:
+            if clave_idempotencia in self.claves:
+                return self.claves[clave_idempotencia]
+            id_intento = f'pi_falso_{next(self._contador):08d}'
+            intento = Intento(id_intento, f'{id_intento}_secret_{uuid.uuid4().hex[:12]}',
+                              'requires_payment_method', monto, moneda, dict(metadata))
+            self.intentos[id_intento] = intento
+            if clave_idempotencia:
+                self.claves[clave_idempotencia] = intento
+            return intento
+
+    def obtener_intento(self, id_intento):
+        self._esperar()
+        try:
+            return self.intentos[id_intento]
+        except KeyError:
+            raise ErrorPasarela(f"No such payment_intent: '{id_intento}'")
+
+    def actualizar_monto(self, id_intento, monto):
+        intento = self.obtener_intento(id_intento)
+        intento.monto = monto
+        return intento
+
+    def cancelar_intento(self, id_intento):
+        intento = self.obtener_intento(id_intento)
+        if not intento.abierto:
+            raise ErrorPasarela(f"You cannot cancel this PaymentIntent because it has a status of {intento.estado}.")
+        intento.estado = 'canceled'
+        return intento
+
+    def listar_intentos(self, creado_desde=None, pagina=100):
+        yield from list(self.intentos.values())
+
+    def crear_sesion_checkout(self, monto, nombre, metadata, url_exito, url_cancelado, moneda='usd',
+                              clave_idempotencia=None):
+        intento = self.crear_intento(monto, metadata, moneda, clave_idempotencia=clave_idempotencia)
+        return f'https://pasarela.invalid/checkout/{intento.id}'
+
+    def simular_pago(self, id_intento, exito=True):
+        """Cierra el intento y devuelve el evento de webhook que enviaría Stripe."""
+        intento = self.intentos[id_intento]
+        intento.estado = 'succeeded' if exito else 'requires_payment_method'
+        intento.monto_recibido = intento.monto if exito else 0
+        objeto = {
+            'id': intento.id, 'object': 'payment_intent', 'amount': intento.monto,
+            'amount_received': intento.monto if exito else 0, 'currency': intento.moneda,
+            'status': 'succeeded' if exito else 'requires_payment_method', 'metadata': intento.metadata,
+        }
+        tipo = 'payment_intent.succeeded' if exito else 'payment_intent.payment_failed'
+        return firmas.evento(tipo, objeto)
+
+
+PASARELAS = {
+    'stripe': lambda: PasarelaStripe(
+        settings.STRIPE_SECRET_KEY,
+        timeout=getattr(settings, 'PAGOS_PASARELA_TIMEOUT', 10),
+        timeout_conexion=getattr(settings, 'PAGOS_PASARELA_TIMEOUT_CONEXION', 3),
+        reintentos=getattr(settings, 'PAGOS_PASARELA_REINTENTOS', 1),
+        umbral=getattr(settings, 'PAGOS_CIRCUITO_UMBRAL', 5),
+        enfriamiento=getattr(settings, 'PAGOS_CIRCUITO_ENFRIAMIENTO', 30),
+    ),
+    'falsa': lambda: PasarelaFalsa(getattr(settings, 'PAGOS_PASARELA_FALSA_LATENCIA', 0)),
+}
+
+_pasarela = None
+_pasarela_lock = threading.Lock()
+
+
+def obtener():
+    """Pasarela configurada, creada en el primer uso y compartida por el proceso."""
+    global _pasarela
+    if _pasarela is None:
+        with _pasarela_lock:
+            if _pasarela is None:
+                _pasarela = PASARELAS[getattr(settings, 'PAGOS_PASARELA', 'stripe')]()
+    return _pasarela
+
+
+@receiver(setting_changed)
+def _reiniciar(setting, **kwargs):
+    global _pasarela
+    if setting.startswith('PAGOS_PASARELA') or setting.startswith('PAGOS_CIRCUITO') or setting == 'STRIPE_SECRET_KEY':
+        _pasarela = None
@@ -0,0 +1,300 @@
+"""
+Procesamiento de los eventos de la pasarela de pagos.
+
+El webhook (``pagos.webhooks``) solo verifica la firma, inserta el evento en
+``EventoPasarela`` y responde 200. La unicidad de ``id_evento`` hace que las
+reentregas del proveedor no generen trabajo repetido. Los trabajadores drenan
+la tabla por lotes:
+
+1. Reclaman hasta ``lote`` eventos disponibles con un ``UPDATE`` que les
+   pone su marca (``trabajador``) y una reserva de ``RESERVA_TRABAJADOR``
+   segundos. Si un trabajador muere a mitad, el evento vuelve a estar
+   disponible al vencer la reserva.
+2. Cada evento se procesa en su propia transacción, junto con su paso a
+   PROCESADO. Los manejadores son idempotentes: un pago se registra en el
+   libro de la cuenta (``pagos.movimientos``) una sola vez por PaymentIntent.
+3. Si el manejador falla, el evento vuelve a PENDIENTE con espera
+   exponencial; tras ``MAX_INTENTOS`` (o con ``EventoInvalido``) queda
+   FALLIDO para revisión manual.
+
+Los trabajadores corren con el comando ``procesar_eventos_pago`` o, si se
+define ``PAGOS_PROCESADOR_HILOS``, en hilos del propio proceso. ``metricas``
+resume la cola (pendientes, atraso del más antiguo, fallidos).
+"""
+import logging
+import random
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from habitaciones.catalogos import estados_reserva
+from reservas import transiciones
+from reservas.models import Reserva
+from . import movimientos
+from .models import CuentaCobrar, EventoPasarela
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = 50
+MAX_INTENTOS = 8
+ESPERA_BASE = 5         # segundos antes del primer reintento; se duplica en cada uno
+ESPERA_MAXIMA = 3600
+RESERVA_TRABAJADOR = 300
+MOTIVO_PAGO_FALLIDO = "Cancelada automáticamente: el pago fue rechazado por la pasarela."
+
+
+class EventoInvalido(Exception):
+    """El evento no se puede aplicar y reintentarlo no cambiará el resultado."""
+
+
+@dataclass
+class ResultadoProcesamiento:
+    procesados: int = 0
+    reintentos: int = 0
+    fallidos: int = 0
+    lotes: int = 0
+
+    def __str__(self):
+        return (f"{self.procesados} procesados, {self.reintentos} para reintentar, "
+                f"{self.fallidos} fallidos en {self.lotes} lotes")
+
+
+# --- Manejadores (se ejecutan dentro de la transacción del evento) ---
+
+def _cuenta(objeto):
+    cuenta_id = (objeto.get('metadata') or {}).get('cuenta_id')
+    if not cuenta_id:
+        return None
+    try:
+        cuenta = CuentaCobrar.objects.filter(pk=cuenta_id).values('pk', 'codigo_reserva_id', 'grupo_id').first()
+    except ValidationError:
+        # cuenta_id con formato no válido (no es un UUID)
+        cuenta = None
+    if cuenta is None:
+        raise EventoInvalido(f"Cuenta {cuenta_id} no encontrada")
+    return cuenta
+
+
+def _reservas_pendientes(cuenta):
+    # Una cuenta grupal abarca todas las reservas del grupo
+    filtro = {'grupo_id': cuenta['grupo_id']} if cuenta['grupo_id'] else {'pk': cuenta['codigo_reserva_id']}
+    return Reserva.objects.filter(
+        id_estado_reserva=estados_reserva.por_nombre('Pendiente'), **filtro
+    ).select_related('usuario').order_by('pk')
+
+
+def pago_exitoso(objeto):
+    """Registra el cobro en el libro de la cuenta y, si cubre el saldo,
+    confirma sus reservas pendientes."""
+    cuenta = _cuenta(objeto)
+    if cuenta is None:
+        return  # Pagos de otra integración (sin cuenta_id)
+    centavos = objeto.get('amount_received') or objeto.get('amount')
+    if not centavos or not objeto.get('id'):
+        raise EventoInvalido("El PaymentIntent no indica id o monto cobrado")
+    registro = movimientos.registrar(
+        cuenta['pk'], Decimal(centavos) / 100, 'tarjeta', referencia=objeto['id'],
+        observaciones='Pago con tarjeta (Stripe)',
+    )
+    if registro.movimiento is None:
+        return  # Ya aplicado
+    CuentaCobrar.objects.filter(pk=cuenta['pk']).update(payment_intent_id=objeto['id'])
+    if registro.pagada:
+        confirmar_reservas(cuenta)
+    # Si no, fue un pago parcial: el resto llega con otro movimiento
+
+
+def confirmar_reservas(cuenta):
+    """Confirma las reservas pendientes de una cuenta ya pagada. ``cuenta`` es
+    un dict con pk, codigo_reserva_id y grupo_id. Devuelve cuántas confirmó."""
+    confirmadas = 0
+    for reserva in _reservas_pendientes(cuenta):
+        try:
+            transiciones.confirmar(reserva)
+            confirmadas += 1
+        except ValueError as e:
+            # La cuenta queda pagada: el conflicto lo resuelve recepción
+            logger.warning("Cuenta %s pagada pero la reserva %s no se pudo confirmar: %s", cuenta['pk'], reserva.pk, e)
+    return confirmadas
+
+
+def pago_fallido(objeto):
+    """Vence la cuenta pendiente y cancela sus reservas pendientes."""
+    cuenta = _cuenta(objeto)
+    if cuenta is None:
+        return
+    actualizadas = CuentaCobrar.objects.filter(pk=cuenta['pk'], estado='PENDIENTE').update(
+        estado='VENCIDO', updated_at=timezone.now()
+    )
+    if not actualizadas:
+        return  # Ya aplicado, o la cuenta se pagó con otro intento
+    for reserva in _reservas_pendientes(cuenta):
+        transiciones.cancelar(reserva, MOTIVO_PAGO_FALLIDO)
+
+
+MANEJADORES = {
+    'payment_intent.succeeded': pago_exitoso,
+    'payment_intent.payment_failed': pago_fallido,
+}
+
+
+# --- Cola ---
+
+def espera(intentos):
+    """Segundos hasta el siguiente intento, con un 20 % de variación aleatoria."""
+    base = min(ESPERA_MAXIMA, ESPERA_BASE * 2 ** max(0, intentos - 1))
+    return base * random.uniform(0.8, 1.2)
+
+
+def _reclamar(lote, trabajador):
+    ahora = timezone.now()
+    disponibles = EventoPasarela.objects.filter(estado__in=('PENDIENTE', 'PROCESANDO'), disponible_en__lte=ahora)
+    ids = list(disponibles.order_by('disponible_en', 'pk').values_list('pk', flat=True)[:lote])
+    if not ids:
+        return []
+    # Si otro trabajador reclamó alguno entre medio, su disponible_en ya no cumple el filtro
+    disponibles.filter(pk__in=ids).update(
+        estado='PROCESANDO', trabajador=trabajador,
+        disponible_en=ahora + timedelta(seconds=RESERVA_TRABAJADOR),
+    )
+    return list(EventoPasarela.objects.filter(pk__in=ids, estado='PROCESANDO', trabajador=trabajador).order_by('pk'))
+
+
+def _fallar(evento, error, definitivo=False):
+    intentos = evento.intentos + 1
+    max_intentos = getattr(settings, 'PAGOS_EVENTOS_MAX_INTENTOS', MAX_INTENTOS)
+    fallido = definitivo or intentos >= max_intentos
+    EventoPasarela.objects.filter(pk=evento.pk, trabajador=evento.trabajador).update(
+        estado='FALLIDO' if fallido else 'PENDIENTE',
+        intentos=intentos,
+        ultimo_error=str(error)[:2000],
+        disponible_en=timezone.now() + timedelta(seconds=0 if fallido else espera(intentos)),
+    )
+    return fallido
+
+
+def _procesar(evento):
+    """Aplica un evento. Devuelve 'procesado', 'reintento' o 'fallido'."""
+    manejador = MANEJADORES.get(evento.tipo)
+    try:
+        with transaction.atomic():
+            if manejador:
+                manejador(evento.payload.get('data', {}).get('object', {}))
+            EventoPasarela.objects.filter(pk=evento.pk, trabajador=evento.trabajador).update(
+                estado='PROCESADO', intentos=F('intentos') + 1, ultimo_error=None, procesado_en=timezone.now()
+            )
+        return 'procesado'
+    except EventoInvalido as e:
+        logger.warning("Evento %s descartado: %s", evento.id_evento, e)
+        return 'fallido' if _fallar(evento, e, definitivo=True) else 'reintento'
+    except Exception as e:
+        logger.exception("Error al procesar el evento %s (%s)", evento.id_evento, evento.tipo)
+        return 'fallido' if _fallar(evento, e) else 'reintento'
+
+
+def procesar(lote=TAMANO_LOTE, max_lotes=None):
+    """Procesa lotes de eventos disponibles hasta vaciar la cola (o ``max_lotes``)."""
+    trabajador = uuid.uuid4().hex
+    resultado = ResultadoProcesamiento()
+    while max_lotes is None or resultado.lotes < max_lotes:
+        eventos = _reclamar(lote, trabajador)
+        if not eventos:
+            break
+        resultado.lotes += 1
+        for evento in eventos:
+            estado = _procesar(evento)
+            if estado == 'procesado':
+                resultado.procesados += 1
+            elif estado == 'reintento':
+                resultado.reintentos += 1
+            else:
+                resultado.fallidos += 1
+    if resultado.lotes:
+        logger.info("Eventos de pago: %s", resultado)
+    return resultado
+
+
+def metricas():
+    """Estado de la cola: conteos por estado, atraso del evento pendiente más
+    antiguo y latencia de los últimos procesados (segundos)."""
+    ahora = timezone.now()
+    por_estado = dict(EventoPasarela.objects.values_list('estado').annotate(n=Count('pk')).order_by())
+    pendientes = EventoPasarela.objects.filter(estado__in=('PENDIENTE', 'PROCESANDO'))
+    mas_antiguo = pendientes.aggregate(m=Min('recibido_en'))['m']
+    recientes = list(
+        EventoPasarela.objects.filter(estado='PROCESADO')
+        .order_by('-procesado_en').values_list('recibido_en', 'procesado_en')[:100]
+    )
+    latencias = [(procesado - recibido).total_seconds() for recibido, procesado in recientes]
+    return {
+        'por_estado': {estado: por_estado.get(estado, 0) for estado, _ in EventoPasarela.ESTADO_CHOICES},
+        'pendientes': por_estado.get('PENDIENTE', 0) + por_estado.get('PROCESANDO', 0),
+        'reintentando': pendientes.filter(intentos__gt=0).count(),
+        'atraso_segundos': round((ahora - mas_antiguo).total_seconds(), 3) if mas_antiguo else 0,
+        'latencia_media_segundos': round(sum(latencias) / len(latencias), 3) if latencias else None,
+        'latencia_maxima_segundos': round(max(latencias), 3) if latencias else None,
+    }
+
+
+# --- Trabajadores en hilos ---
+
+_aviso = threading.Event()
+
+
+def despertar():
+    """Avisa a los trabajadores en espera de que llegó un evento."""
+    _aviso.set()
+
+
+class Procesador(threading.Thread):
+    """Hilo que drena la cola y espera ``intervalo`` segundos (o un aviso)
+    cuando queda vacía."""
+
+    def __init__(self, intervalo, lote=TAMANO_LOTE, nombre='procesador-pagos'):
+        super().__init__(name=nombre, daemon=True)
+        self.intervalo = intervalo
+        self.lote = lote
+        self.detenido = threading.Event()
+
+    def run(self):
+        while not self.detenido.is_set():
+            try:
+                resultado = procesar(self.lote)
+            except Exception:
+                logger.exception("Error en el procesador de eventos de pago")
+                resultado = None
+            finally:
+                close_old_connections()
+            if not resultado or not resultado.lotes:
+                _aviso.wait(self.intervalo)
+                _aviso.clear()
+
+    def detener(self):
+        self.detenido.set()
+        _aviso.set()
+
+
+_procesadores = []
+_procesadores_lock = threading.Lock()
+
+
+def iniciar_procesadores(hilos=None, intervalo=None, lote=TAMANO_LOTE):
+    """Inicia ``hilos`` trabajadores (por defecto ``PAGOS_PROCESADOR_HILOS``).
+    Devuelve la lista de hilos en ejecución."""
+    hilos = hilos if hilos is not None else getattr(settings, 'PAGOS_PROCESADOR_HILOS', 0)
+    intervalo = intervalo or getattr(settings, 'PAGOS_PROCESADOR_INTERVALO', 5)
+    with _procesadores_lock:
+        _procesadores[:] = [p for p in _procesadores if p.is_alive()]
+        for i in range(len(_procesadores), hilos):
+            procesador = Procesador(intervalo, lote, nombre=f'procesador-pagos-{i + 1}')
+            procesador.start()
+            _procesadores.append(procesador)
+        return list(_procesadores)
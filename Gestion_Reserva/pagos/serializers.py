@@ -0,0 +1,12 @@
+from rest_framework import serializers
+
+from .models import MovimientoPago
+
+
+class MovimientoPagoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MovimientoPago
+        fields = ['id', 'cuenta', 'metodo', 'monto', 'referencia', 'registrado_por', 'observaciones', 'created_at']
+        read_only_fields = ['id', 'cuenta', 'registrado_por', 'created_at']
+        # La unicidad de la referencia la resuelve pagos.movimientos.registrar
+        validators = []
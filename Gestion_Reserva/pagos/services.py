@@ -1,12 +1,17 @@
-import stripe
-from django.conf import settings
+from django.utils import timezone
+
+from . import pasarelas
 from .models import CuentaCobrar
-from reservas.models import Reserva
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
 
-def crear_payment_intent(cuenta_cobrar):
-    """Crea un PaymentIntent en Stripe para una cuenta por cobrar"""
+def _centavos(monto):
+    return int(round(monto * 100))
+
+
+def crear_payment_intent(cuenta_cobrar, pasarela=None):
+    """Devuelve el client_secret de un PaymentIntent para pagar el saldo de la
+    cuenta. Si la cuenta ya tiene un intento abierto se reutiliza (ajustando
+    el monto si cambió) en lugar de crear otro en cada clic."""
     # Validaciones previas al pago
     if cuenta_cobrar.estado != 'PENDIENTE':
         raise ValueError("La cuenta no está pendiente de pago")
@@ -14,27 +19,37 @@ def crear_payment_intent(cuenta_cobrar):
     if cuenta_cobrar.saldo_pendiente <= 0:
         raise ValueError("La cuenta ya está pagada")
 
-    try:
-        # Convertir monto a centavos (Stripe usa centavos)
-        amount = int(cuenta_cobrar.saldo_pendiente * 100)
-
-        # Crear PaymentIntent
-        intent = stripe.PaymentIntent.create(
-            amount=amount,
-            currency='usd',
-            automatic_payment_methods={'enabled': True},
-            metadata={
-                'cuenta_id': str(cuenta_cobrar.id_cuenta),
-                'reserva_id': str(cuenta_cobrar.codigo_reserva.id),
-                'huesped_dni': cuenta_cobrar.dni_huesped.dni
-            }
-        )
-
-        # Guardar el ID del intent en la base de datos
-        cuenta_cobrar.payment_intent_id = intent.id
-        cuenta_cobrar.save()
-
-        return intent.client_secret
-
-    except Exception as e:
-        raise ValueError(f"Error al crear PaymentIntent: {str(e)}")
+    pasarela = pasarela or pasarelas.obtener()
+    monto = _centavos(cuenta_cobrar.saldo_pendiente)
+
+    anterior = None
+    if cuenta_cobrar.payment_intent_id:
+        try:
+            anterior = pasarela.obtener_intento(cuenta_cobrar.payment_intent_id)
+        except pasarelas.ErrorPasarela:
+            anterior = None  # Ya no existe en la pasarela: se crea otro
+    if anterior is not None:
+        if anterior.estado in ('succeeded', 'processing'):
+            raise ValueError("El pago de esta cuenta ya se realizó y se está procesando")
+        if anterior.abierto:
+            if anterior.monto != monto:
+                anterior = pasarela.actualizar_monto(anterior.id, monto)
+            return anterior.client_secret
+
+    # La clave evita dos intentos por un doble clic simultáneo; incluye el
+    # intento anterior para poder crear uno nuevo si aquel se canceló
+    clave = f"cuenta-{cuenta_cobrar.id_cuenta}-{monto}-{cuenta_cobrar.payment_intent_id or 'nuevo'}"
+    intento = pasarela.crear_intento(
+        monto,
+        metadata={
+            'cuenta_id': str(cuenta_cobrar.id_cuenta),
+            'reserva_id': str(cuenta_cobrar.codigo_reserva_id),
+            'huesped_dni': cuenta_cobrar.dni_huesped_id,
+        },
+        clave_idempotencia=clave,
+    )
+
+    # Guardar el ID del intent en la base de datos
+    CuentaCobrar.objects.filter(pk=cuenta_cobrar.pk).update(payment_intent_id=intento.id, updated_at=timezone.now())
+    cuenta_cobrar.payment_intent_id = intento.id
+    return intento.client_secret
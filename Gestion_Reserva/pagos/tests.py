@@ -1,3 +1,331 @@
-from django.test import TestCase
+import csv
+import io
+import itertools
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import stripe
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from habitaciones.models import Habitacion
+from reservas import vencimiento
+from reservas.models import Reserva
+from reservas.tests import ReservasMixin
+from usuarios.models import Usuario
+from . import conciliacion, firmas, movimientos, pasarelas, procesador
+from .models import CuentaCobrar, EventoPasarela
+from .services import crear_payment_intent
+
+SECRETO = 'whsec_pruebas'
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=SECRETO)
+class EventosPasarelaTests(ReservasMixin, TestCase):
+
+    def setUp(self):
+        self.huesped = self.crear_huesped()
+        self.reserva = self.crear_reserva(self.huesped)
+        self.cuenta = CuentaCobrar.objects.create(
+            codigo_reserva=self.reserva,
+            dni_huesped=self.huesped,
+            monto_total=self.reserva.total_pagar,
+            fecha_vencimiento=timezone.localdate() + timedelta(days=2),
+        )
+
+    def enviar(self, datos, secreto=SECRETO):
+        payload, firma = firmas.firmado(datos, secreto)
+        return self.client.post('/api/pagos/webhook/', payload, content_type='application/json',
+                                HTTP_STRIPE_SIGNATURE=firma)
+
+    def evento(self, tipo='payment_intent.succeeded', **kwargs):
+        centavos = int(self.cuenta.monto_total * 100)
+        return firmas.evento(tipo, firmas.payment_intent(self.cuenta.pk, centavos, id_intent='pi_prueba'), **kwargs)
+
+    def test_webhook_solo_encola(self):
+        datos = self.evento(id_evento='evt_1')
+        self.assertEqual(self.enviar(datos).status_code, 200)
+        self.assertEqual(self.enviar(datos).status_code, 200)  # Reentrega del proveedor
+        self.assertEqual(self.enviar(self.evento(), secreto='otro').status_code, 400)
+
+        evento = EventoPasarela.objects.get()
+        self.assertEqual((evento.id_evento, evento.estado), ('evt_1', 'PENDIENTE'))
+        self.cuenta.refresh_from_db()
+        self.assertEqual(self.cuenta.estado, 'PENDIENTE')
+
+    def test_pago_exitoso_idempotente(self):
+        self.enviar(self.evento())
+        self.enviar(self.evento())  # Otro evento del mismo pago
+        resultado = procesador.procesar()
+        self.assertEqual((resultado.procesados, resultado.fallidos), (2, 0))
+
+        self.cuenta.refresh_from_db()
+        self.assertEqual((self.cuenta.estado, self.cuenta.monto_pagado), ('PAGADO', self.cuenta.monto_total))
+        self.assertEqual((self.cuenta.saldo_pendiente, self.cuenta.payment_intent_id), (0, 'pi_prueba'))
+        self.assertEqual(self.cuenta.movimientos.get().referencia, 'pi_prueba')
+        self.reserva.refresh_from_db()
+        self.assertEqual(self.reserva.id_estado_reserva.nombre, 'Confirmada')
+        self.assertEqual(Habitacion.objects.get(pk=self.codigo).id_estado.nombre, 'Reservada')
+        self.assertEqual(Usuario.objects.get(pk=self.huesped.pk).total_visitas, 1)
+        self.assertEqual(procesador.metricas()['por_estado']['PROCESADO'], 2)
+
+    def test_pago_fallido(self):
+        self.enviar(self.evento('payment_intent.payment_failed'))
+        procesador.procesar()
+        self.cuenta.refresh_from_db()
+        self.reserva.refresh_from_db()
+        self.assertEqual(self.cuenta.estado, 'VENCIDO')
+        self.assertEqual(self.reserva.id_estado_reserva.nombre, 'Cancelada')
+        self.assertEqual(self.reserva.motivo_cancelacion, procesador.MOTIVO_PAGO_FALLIDO)
+
+    @override_settings(PAGOS_EVENTOS_MAX_INTENTOS=2)
+    def test_reintentos_con_espera(self):
+        self.enviar(self.evento(id_evento='evt_error'))
+        fallo = mock.Mock(side_effect=RuntimeError('base de datos lenta'))
+        with mock.patch.dict(procesador.MANEJADORES, {'payment_intent.succeeded': fallo}), \
+                self.assertLogs('pagos.procesador', 'ERROR'):
+            self.assertEqual(procesador.procesar().reintentos, 1)
+            evento = EventoPasarela.objects.get()
+            self.assertEqual((evento.estado, evento.intentos), ('PENDIENTE', 1))
+            self.assertGreater(evento.disponible_en, timezone.now())
+            self.assertEqual(procesador.procesar().lotes, 0)  # Aún en espera
+
+            EventoPasarela.objects.update(disponible_en=timezone.now())
+            self.assertEqual(procesador.procesar().fallidos, 1)
+        evento.refresh_from_db()
+        self.assertEqual((evento.estado, evento.ultimo_error), ('FALLIDO', 'base de datos lenta'))
+        self.assertEqual(procesador.metricas()['por_estado']['FALLIDO'], 1)
+
+    def test_cuenta_inexistente_no_se_reintenta(self):
+        datos = firmas.evento('payment_intent.succeeded', firmas.payment_intent('no-es-un-uuid'))
+        self.enviar(datos)
+        with self.assertLogs('pagos.procesador', 'WARNING'):
+            self.assertEqual(procesador.procesar().fallidos, 1)
+        self.assertEqual(EventoPasarela.objects.get().intentos, 1)
+
+    def test_reclamo_vencido_se_retoma(self):
+        self.enviar(self.evento())
+        # Un trabajador que murió tras reclamar el evento
+        EventoPasarela.objects.update(estado='PROCESANDO', trabajador='caido', disponible_en=timezone.now())
+        self.assertEqual(procesador.procesar().procesados, 1)
+
+
+@override_settings(PAGOS_PASARELA='falsa')
+class PasarelaTests(ReservasMixin, TestCase):
+
+    def setUp(self):
+        huesped = self.crear_huesped()
+        self.cuenta = CuentaCobrar.objects.create(
+            codigo_reserva=self.crear_reserva(huesped),
+            dni_huesped=huesped,
+            monto_total=300,
+            fecha_vencimiento=timezone.localdate() + timedelta(days=2),
+        )
+
+    def test_reutiliza_intento_abierto(self):
+        pasarela = pasarelas.obtener()
+        antes = pasarela.llamadas
+        secreto = crear_payment_intent(self.cuenta)
+        self.assertEqual(crear_payment_intent(CuentaCobrar.objects.get(pk=self.cuenta.pk)), secreto)
+        self.assertEqual(pasarela.llamadas - antes, 2)  # Crear y, en el segundo clic, solo consultar
+
+        # Un depósito en efectivo cambió el saldo: se ajusta el mismo intento
+        movimientos.registrar(self.cuenta, 100, 'efectivo')
+        cuenta = CuentaCobrar.objects.get(pk=self.cuenta.pk)
+        self.assertEqual(crear_payment_intent(cuenta), secreto)
+        self.assertEqual(pasarela.intentos[cuenta.payment_intent_id].monto, 20000)
+
+        pasarela.simular_pago(cuenta.payment_intent_id)
+        with self.assertRaises(ValueError):
+            crear_payment_intent(cuenta)
+
+    def test_pagar_cuenta_sin_red(self):
+        respuesta = self.client.get(f'/api/pagos/pagar/{self.cuenta.pk}/')
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertTrue(respuesta['Location'].startswith('https://pasarela.invalid/checkout/'))
+
+    def test_pagar_cuenta_cobra_el_saldo(self):
+        pasarela = pasarelas.obtener()
+        movimientos.registrar(self.cuenta, 100, 'efectivo')  # Depósito en efectivo
+        respuesta = self.client.get(f'/api/pagos/pagar/{self.cuenta.pk}/')
+        id_intento = respuesta['Location'].rsplit('/', 1)[-1]
+        self.assertEqual(pasarela.intentos[id_intento].monto, 20000)
+        # Otro clic con el mismo saldo reutiliza la sesión
+        intentos = len(pasarela.intentos)
+        self.assertEqual(self.client.get(f'/api/pagos/pagar/{self.cuenta.pk}/')['Location'], respuesta['Location'])
+        self.assertEqual(len(pasarela.intentos), intentos)
+
+        antes = pasarela.llamadas
+        movimientos.registrar(self.cuenta, 200, 'yape')
+        self.assertEqual(self.client.get(f'/api/pagos/pagar/{self.cuenta.pk}/').status_code, 400)
+        for estado in ('VENCIDO', 'CANCELADO'):
+            CuentaCobrar.objects.filter(pk=self.cuenta.pk).update(estado=estado, saldo_pendiente=50)
+            self.assertEqual(self.client.get(f'/api/pagos/pagar/{self.cuenta.pk}/').status_code, 400)
+        self.assertEqual(pasarela.llamadas, antes)  # No se llegó a la pasarela
+
+
+class LibroPagosTests(ReservasMixin, TestCase):
+
+    def setUp(self):
+        self.huesped = self.crear_huesped()
+        self.admin = Usuario.objects.create_user('40000001', 'Admin', 'Hotel', password='clave-segura', rol='ADMIN')
+
+    def crear_cuenta(self, monto, vence_hace=0, huesped=None):
+        return CuentaCobrar.objects.create(
+            codigo_reserva=self.crear_reserva(self.huesped, dias=10 + CuentaCobrar.objects.count() * 5),
+            dni_huesped=huesped or self.huesped,
+            monto_total=monto,
+            fecha_vencimiento=timezone.localdate() - timedelta(days=vence_hace),
+        )
+
+    def test_pago_dividido(self):
+        cuenta = self.crear_cuenta(300)
+        cliente = APIClient()
+        cliente.force_authenticate(self.admin)
+        respuesta = cliente.post(f'/api/pagos/cuentas/{cuenta.pk}/movimientos/',
+                                 {'metodo': 'efectivo', 'monto': '120.00'}, format='json')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual((respuesta.data['estado'], respuesta.data['saldo_pendiente']), ('PENDIENTE', 180))
+
+        registro = movimientos.registrar(cuenta, 180, 'tarjeta', referencia='pi_checkout')
+        self.assertTrue(registro.pagada)
+        self.assertEqual((cuenta.estado, cuenta.monto_pagado, cuenta.saldo_pendiente), ('PAGADO', 300, 0))
+        # La misma operación del proveedor no se registra dos veces
+        self.assertIsNone(movimientos.registrar(cuenta, 180, 'tarjeta', referencia='pi_checkout').movimiento)
+        self.assertEqual(cuenta.movimientos.count(), 2)
+        with self.assertRaises(ValueError):
+            cuenta.movimientos.first().delete()
+
+    def test_saldos_y_antiguedad(self):
+        otro = self.crear_huesped('70000002')
+        self.crear_cuenta(100, vence_hace=-2)
+        self.crear_cuenta(200, vence_hace=10)
+        self.crear_cuenta(400, vence_hace=45, huesped=otro)
+        movimientos.registrar(self.crear_cuenta(50, vence_hace=100), 50, 'yape')  # Pagada: no cuenta
+
+        with self.assertNumQueries(1):
+            tramos = {t['tramo']: (t['cuentas'], t['saldo']) for t in movimientos.antiguedad()}
+        self.assertEqual(tramos, {
+            'por_vencer': (1, 100), '1_30': (1, 200), '31_60': (1, 400), '61_90': (0, 0), 'mas_de_90': (0, 0),
+        })
+        with self.assertNumQueries(1):
+            saldos = movimientos.saldo_por_huesped()
+        self.assertEqual([(s['dni_huesped'], s['cuentas'], s['saldo']) for s in saldos],
+                         [('70000002', 1, 400), ('70000001', 2, 300)])
+
+
+    def test_reserva_vencida_y_cancelada_no_queda_como_saldo(self):
+        abandonada = self.crear_cuenta(300, vence_hace=5)
+        movimientos.registrar(abandonada, 100, 'yape')
+        hospedada = self.crear_cuenta(200, vence_hace=40)
+        Reserva.objects.filter(pk=hospedada.codigo_reserva_id).update(id_estado_reserva=4)
+
+        vencimiento.barrer()
+
+        abandonada.refresh_from_db()
+        self.assertEqual((abandonada.estado, abandonada.monto_pagado), ('CANCELADO', 100))
+        self.assertEqual(Reserva.objects.get(pk=abandonada.codigo_reserva_id).id_estado_reserva_id, 3)
+        self.assertEqual(CuentaCobrar.objects.get(pk=hospedada.pk).estado, 'VENCIDO')
+        self.assertEqual([(s['dni_huesped'], s['saldo']) for s in movimientos.saldo_por_huesped()],
+                         [('70000001', 200)])
+        self.assertEqual({t['tramo']: t['saldo'] for t in movimientos.antiguedad() if t['cuentas']}, {'31_60': 200})
+        # Un cobro que llegue igual a la cuenta cancelada no la reabre
+        movimientos.registrar(abandonada, 200, 'tarjeta', referencia='pi_tarde')
+        self.assertEqual(CuentaCobrar.objects.get(pk=abandonada.pk).estado, 'CANCELADO')
+
+
+class ConciliacionTests(ReservasMixin, TestCase):
+
+    def setUp(self):
+        self.huesped = self.crear_huesped()
+        self.pasarela = pasarelas.PasarelaFalsa()
+
+    def crear_cuenta(self, monto=300):
+        return CuentaCobrar.objects.create(
+            codigo_reserva=self.crear_reserva(self.huesped, dias=10 + CuentaCobrar.objects.count() * 5),
+            dni_huesped=self.huesped,
+            monto_total=monto,
+            fecha_vencimiento=timezone.localdate() + timedelta(days=2),
+        )
+
+    def test_clasifica_y_corrige_por_lotes(self):
+        # Cobrada en la pasarela pero el webhook nunca llegó
+        perdida = self.crear_cuenta()
+        crear_payment_intent(perdida, self.pasarela)
+        self.pasarela.simular_pago(perdida.payment_intent_id)
+        # Cobrada y registrada
+        al_dia = self.crear_cuenta()
+        crear_payment_intent(al_dia, self.pasarela)
+        self.pasarela.simular_pago(al_dia.payment_intent_id)
+        movimientos.registrar(al_dia, 300, 'tarjeta', referencia=al_dia.payment_intent_id)
+        # Marcada PAGADO a mano con un intento que no se cobró
+        sin_cobro = self.crear_cuenta()
+        crear_payment_intent(sin_cobro, self.pasarela)
+        CuentaCobrar.objects.filter(pk=sin_cobro.pk).update(estado='PAGADO')
+        ajeno = conciliacion.RegistroPasarela('pi_otra_app', 'succeeded', 5000, None)
+
+        def registros():
+            return itertools.chain(conciliacion.desde_pasarela(self.pasarela), [ajeno])
+
+        with self.assertNumQueries(2 * 2):  # Dos lotes, dos consultas cada uno
+            resultado = conciliacion.conciliar(registros(), lote=2)
+        self.assertEqual((resultado.registros, resultado.lotes, resultado.corregidos), (4, 2, 0))
+        self.assertEqual(dict(resultado.por_clase), {
+            'pago_no_registrado': 1, 'conciliado': 1, 'pagada_sin_cobro': 1, 'sin_cuenta': 1,
+        })
+        self.assertEqual(CuentaCobrar.objects.get(pk=perdida.pk).estado, 'PENDIENTE')
+
+        resultado = conciliacion.conciliar(registros(), lote=2, aplicar=True)
+        self.assertEqual((resultado.corregidos, resultado.reservas_confirmadas), (1, 1))
+        perdida.refresh_from_db()
+        self.assertEqual((perdida.estado, perdida.saldo_pendiente), ('PAGADO', 0))
+        self.assertEqual(perdida.movimientos.get().referencia, perdida.payment_intent_id)
+        self.assertEqual(perdida.codigo_reserva.id_estado_reserva.nombre, 'Confirmada')
+
+        resultado = conciliacion.conciliar(registros(), aplicar=True)
+        self.assertEqual((resultado.por_clase['conciliado'], resultado.corregidos), (2, 0))
+
+    def test_comando_desde_exportacion(self):
+        cuenta = self.crear_cuenta()
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        exportacion, reporte = os.path.join(directorio, 'pagos.csv'), os.path.join(directorio, 'reporte.csv')
+        with open(exportacion, 'w', newline='') as archivo:
+            escritor = csv.writer(archivo)
+            escritor.writerow(['id', 'Status', 'Amount', 'cuenta_id (metadata)'])
+            escritor.writerow(['pi_export', 'succeeded', '300.00', str(cuenta.pk)])
+            escritor.writerow(['pi_parcial', 'succeeded', '5000', str(cuenta.pk)])
+
+        call_command('conciliar_pagos', archivo=exportacion, aplicar=True, reporte=reporte, stdout=io.StringIO())
+        cuenta.refresh_from_db()
+        self.assertEqual((cuenta.monto_pagado, cuenta.saldo_pendiente, cuenta.estado), (350, -50, 'PAGADO'))
+        with open(reporte, newline='') as archivo:
+            filas = list(csv.DictReader(archivo))
+        self.assertEqual([f['clase'] for f in filas], ['pago_no_registrado', 'pago_no_registrado'])
+
+
+class CircuitoTests(SimpleTestCase):
+
+    def test_circuito_abierto_no_llama_a_stripe(self):
+        pasarela = pasarelas.PasarelaStripe('sk_test_prueba', umbral=2, enfriamiento=60)
+        pasarela.cliente = mock.Mock()
+        pasarela.cliente.payment_intents.retrieve.side_effect = stripe.APIConnectionError('timeout')
+        with self.assertLogs('pagos.pasarelas', 'WARNING'):
+            for _ in range(2):
+                with self.assertRaises(pasarelas.PasarelaNoDisponible):
+                    pasarela.obtener_intento('pi_1')
+        with self.assertRaises(pasarelas.PasarelaNoDisponible):
+            pasarela.obtener_intento('pi_1')
+        self.assertEqual(pasarela.cliente.payment_intents.retrieve.call_count, 2)
+
+        # Tras el enfriamiento pasa una llamada de prueba y, si funciona, se cierra
+        pasarela.circuito.abierto_hasta = 0
+        pasarela.cliente.payment_intents.retrieve.side_effect = stripe.InvalidRequestError('No such payment_intent', None)
+        with self.assertRaises(pasarelas.ErrorPasarela):
+            pasarela.obtener_intento('pi_1')
+        self.assertIsNone(pasarela.circuito.abierto_hasta)
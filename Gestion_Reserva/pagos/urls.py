@@ -1,11 +1,15 @@
 from django.urls import path
 from . import views, webhooks
 from django.http import HttpResponse
-from .views import pagar_cuenta
+from .views import antiguedad_saldos, metricas_eventos, pagar_cuenta, registrar_pago_cuenta, saldos_huespedes
 
 urlpatterns = [
     path('webhook/', webhooks.stripe_webhook, name='stripe_webhook'),
     path('pagar/<uuid:cuenta_id>/', pagar_cuenta, name='pagar_cuenta'),
+    path('eventos/metricas/', metricas_eventos, name='metricas_eventos_pago'),
+    path('cuentas/<uuid:cuenta_id>/movimientos/', registrar_pago_cuenta, name='registrar_pago_cuenta'),
+    path('reportes/saldos/', saldos_huespedes, name='saldos_huespedes'),
+    path('reportes/antiguedad/', antiguedad_saldos, name='antiguedad_saldos'),
     path('exito/', lambda r: HttpResponse("✅ Pago exitoso."), name='pago_exito'),
     path('cancelado/', lambda r: HttpResponse("❌ Pago cancelado."), name='pago_cancelado'),
 ]
\ No newline at end of file
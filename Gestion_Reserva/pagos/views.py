@@ -1,4 +1,3 @@
-import stripe
 import json
 from django.shortcuts import redirect, get_object_or_404
 from django.conf import settings
@@ -7,9 +6,15 @@ from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
 from .models import CuentaCobrar
 from django.shortcuts import render
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from django.utils.dateparse import parse_date
+from . import movimientos, pasarelas
+from .serializers import MovimientoPagoSerializer
 from .services import crear_payment_intent
-
-stripe.api_key = settings.STRIPE_SECRET_KEY
+from .procesador import metricas
 
 
 # --- API para iniciar pago de CuentaCobrar ---
@@ -34,6 +39,8 @@ def iniciar_pago_stripe(request, cuenta_id):
         })
     except CuentaCobrar.DoesNotExist:
         return JsonResponse({'error': 'Cuenta no encontrada'}, status=404)
+    except pasarelas.PasarelaNoDisponible as e:
+        return JsonResponse({'error': str(e)}, status=503)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
@@ -48,10 +55,8 @@ def create_payment_intent(request):
 
             booking = Booking.objects.get(id=booking_id)
 
-            intent = stripe.PaymentIntent.create(
-                amount=int(booking.total_price * 100),
-                currency='usd',
-                automatic_payment_methods={'enabled': True},
+            intent = pasarelas.obtener().crear_intento(
+                int(booking.total_price * 100),
                 metadata={
                     'booking_id': booking.id,
                     'user_id': request.user.id
@@ -66,86 +71,93 @@ def create_payment_intent(request):
             return JsonResponse({'error': str(e)}, status=400)
 
 
-# --- Webhook de Stripe protegido ---
-@csrf_exempt
-def stripe_webhook(request):
-    payload = request.body
-    sig_header = request.META.get('HTTP_STRIPE_SIGNATURE', '')
-
+def pagar_cuenta(request, cuenta_id):
+    cuenta = get_object_or_404(CuentaCobrar, id_cuenta=cuenta_id)
+    # Una cuenta VENCIDO ya no admite pago en línea: su reserva se gestiona en recepción
+    if cuenta.estado != 'PENDIENTE':
+        return HttpResponse("La cuenta no está pendiente de pago.", status=400)
+    if cuenta.saldo_pendiente <= 0:
+        return HttpResponse("La cuenta no tiene saldo pendiente.", status=400)
+
+    # Solo se cobra el saldo: los pagos parciales (efectivo, Yape...) ya están en el libro
+    monto = int(round(cuenta.saldo_pendiente * 100))
     try:
-        event = stripe.Webhook.construct_event(
-            payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
+        url = pasarelas.obtener().crear_sesion_checkout(
+            monto,
+            nombre=f'Pago de reserva {cuenta.codigo_reserva_id}',
+            # Para que metadata llegue al webhook
+            metadata={'cuenta_id': str(cuenta.id_cuenta)},
+            url_exito='http://localhost:8000/pagos/exito/',
+            url_cancelado='http://localhost:8000/pagos/cancelado/',
+            # Cada clic con el mismo saldo devuelve la misma sesión
+            clave_idempotencia=f'checkout-{cuenta.id_cuenta}-{monto}',
         )
-    except ValueError:
-        return HttpResponse(status=400)
-    except stripe.error.SignatureVerificationError:
-        return HttpResponse(status=400)
-
-    # Manejar eventos
-    if event['type'] == 'payment_intent.succeeded':
-        payment_intent = event['data']['object']
-        metadata = payment_intent.get('metadata', {})
-
-        if 'booking_id' in metadata:
-            handle_payment_succeeded_booking(payment_intent)
-        elif 'cuenta_id' in metadata:
-            handle_payment_succeeded_cuenta(payment_intent)
-
-    elif event['type'] == 'payment_intent.payment_failed':
-        # Opcional: manejar fallo
-        pass
-
-    return HttpResponse(status=200)
-
-
-# --- Manejo del pago exitoso (booking) ---
-def handle_payment_succeeded_booking(payment_intent):
-    booking_id = payment_intent.metadata['booking_id']
-    try:
-        booking = Booking.objects.get(id=booking_id)
-        booking.payment_status = 'succeeded'
-        booking.save()
-        # Aquí podrías enviar un email de confirmación
-    except Booking.DoesNotExist:
-        pass
-
-
-# --- Manejo del pago exitoso (cuenta) ---
-def handle_payment_succeeded_cuenta(payment_intent):
-    cuenta_id = payment_intent.metadata.get('cuenta_id')
-    print(f"✔️ Procesando pago exitoso para cuenta_id={cuenta_id}")
+    except pasarelas.PasarelaNoDisponible as e:
+        return HttpResponse(str(e), status=503)
+    except pasarelas.ErrorPasarela as e:
+        return HttpResponse(str(e), status=400)
+
+    return redirect(url, code=303)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def metricas_eventos(request):
+    """Estado de la cola de eventos del webhook: pendientes, atraso del más
+    antiguo, fallidos y latencia de procesamiento (ver pagos.procesador)."""
+    if request.user.rol not in ['ADMIN', 'SUPERVISOR']:
+        return Response({"error": "Sin permisos para ver métricas de pagos"}, status=status.HTTP_403_FORBIDDEN)
+    return Response(metricas(), status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def registrar_pago_cuenta(request, cuenta_id):
+    """Registra un pago (o una devolución, con monto negativo) en el libro de
+    la cuenta: depósitos en efectivo, Yape, tarjeta en recepción, etc."""
+    if request.user.rol not in ['ADMIN', 'RECEPCIONISTA']:
+        return Response({"error": "Sin permisos para registrar pagos"}, status=status.HTTP_403_FORBIDDEN)
+
+    if not CuentaCobrar.objects.filter(pk=cuenta_id).exists():
+        return Response({"error": "Cuenta no encontrada"}, status=status.HTTP_404_NOT_FOUND)
+    serializer = MovimientoPagoSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     try:
-        cuenta = CuentaCobrar.objects.get(id_cuenta=cuenta_id)
-        cuenta.estado = 'PAGADO'
-        cuenta.save()
-        print(f"✅ Cuenta {cuenta_id} marcada como PAGADO")
-    except CuentaCobrar.DoesNotExist:
-        print(f"❌ Cuenta con ID {cuenta_id} no encontrada")
-
-
-def pagar_cuenta(request, cuenta_id):
-    cuenta = get_object_or_404(CuentaCobrar, id_cuenta=cuenta_id)
-
-    session = stripe.checkout.Session.create(
-        payment_method_types=['card'],
-        mode='payment',
-        line_items=[{
-            'price_data': {
-                'currency': 'usd',
-                'unit_amount': int(cuenta.monto_total * 100),
-                'product_data': {
-                    'name': f'Pago de reserva {cuenta.codigo_reserva_id}',
-                },
-            },
-            'quantity': 1,
-        }],
-        payment_intent_data={  # 👈 clave para que metadata llegue al webhook
-            'metadata': {
-                'cuenta_id': str(cuenta.id_cuenta)
-            }
-        },
-        success_url='http://localhost:8000/pagos/exito/',
-        cancel_url='http://localhost:8000/pagos/cancelado/',
-    )
-
-    return redirect(session.url, code=303)
\ No newline at end of file
+        registro = movimientos.registrar(cuenta_id, usuario=request.user, **serializer.validated_data)
+    except movimientos.PagoInvalido as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if registro.movimiento is None:
+        return Response({"error": "Esa referencia ya está registrada para este método de pago"},
+                        status=status.HTTP_409_CONFLICT)
+
+    cuenta = CuentaCobrar.objects.get(pk=cuenta_id)
+    return Response({
+        "movimiento": MovimientoPagoSerializer(registro.movimiento).data,
+        "estado": cuenta.estado,
+        "monto_pagado": cuenta.monto_pagado,
+        "saldo_pendiente": cuenta.saldo_pendiente,
+    }, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def saldos_huespedes(request):
+    """Saldo abierto por huésped (opcionalmente de un ?dni)."""
+    if request.user.rol not in ['ADMIN', 'SUPERVISOR', 'RECEPCIONISTA']:
+        return Response({"error": "Sin permisos para ver saldos"}, status=status.HTTP_403_FORBIDDEN)
+    return Response(movimientos.saldo_por_huesped(request.query_params.get('dni')), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def antiguedad_saldos(request):
+    """Saldo abierto por tramos de atraso a la ?fecha indicada (AAAA-MM-DD, por
+    defecto hoy), opcionalmente de un ?dni."""
+    if request.user.rol not in ['ADMIN', 'SUPERVISOR']:
+        return Response({"error": "Sin permisos para ver reportes"}, status=status.HTTP_403_FORBIDDEN)
+    fecha = request.query_params.get('fecha')
+    hoy = parse_date(fecha) if fecha else None
+    if fecha and hoy is None:
+        return Response({"error": "Fecha no válida"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(movimientos.antiguedad(hoy, request.query_params.get('dni')), status=status.HTTP_200_OK)
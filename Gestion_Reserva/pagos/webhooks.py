@@ -1,87 +1,38 @@
-import stripe
 import json
+import logging
+
+import stripe
+from django.conf import settings
+from django.db import transaction
 from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.conf import settings
-from .models import CuentaCobrar
-from reservas.models import Reserva, EstadoReserva
-from habitaciones.models import EstadoHabitacion
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+from . import procesador
+from .models import EventoPasarela
+
+logger = logging.getLogger(__name__)
+
 
 @csrf_exempt
 def stripe_webhook(request):
-    print("📩 Webhook recibido")
+    """Verifica la firma, guarda el evento y responde. El procesamiento lo hacen
+    los trabajadores de pagos.procesador; una reentrega del mismo evento no
+    inserta nada nuevo."""
     payload = request.body
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE', '')
-    event = None
 
     try:
         event = stripe.Webhook.construct_event(
             payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
         )
-    except ValueError as e:
+    except ValueError:
         return HttpResponse(status=400)
-    except stripe.error.SignatureVerificationError as e:
+    except stripe.error.SignatureVerificationError:
         return HttpResponse(status=400)
 
-    # Manejar eventos de pago
-    if event['type'] == 'payment_intent.succeeded':
-        payment_intent = event['data']['object']
-        handle_payment_succeeded(payment_intent)
-    elif event['type'] == 'payment_intent.payment_failed':
-        payment_intent = event['data']['object']
-        handle_payment_failed(payment_intent)
-    
+    EventoPasarela.objects.bulk_create([
+        EventoPasarela(id_evento=event['id'], tipo=event['type'], payload=json.loads(payload)),
+    ], ignore_conflicts=True)
+    logger.debug("Evento %s (%s) recibido", event['id'], event['type'])
+    transaction.on_commit(procesador.despertar)
     return HttpResponse(status=200)
-
-def handle_payment_succeeded(payment_intent):
-    print("✔️ Procesando pago exitoso")
-    cuenta_id = payment_intent.metadata.get('cuenta_id')
-    print(f"➡️ Cuenta ID recibida: {cuenta_id}")
-    try:
-        cuenta = CuentaCobrar.objects.get(id_cuenta=cuenta_id)
-        print(f"💰 Cuenta encontrada: {cuenta}")
-
-        cuenta.monto_pagado = cuenta.monto_total
-        cuenta.estado = 'PAGADO'
-        cuenta.save()
-        print("✅ Cuenta actualizada a PAGADO")
-
-        reserva = cuenta.codigo_reserva
-        reserva.id_estado_reserva = EstadoReserva.objects.get(nombre='Confirmada')
-        reserva.save()
-        print("✅ Reserva actualizada a Confirmada")
-
-        habitacion = reserva.codigo_habitacion
-        habitacion.id_estado = EstadoHabitacion.objects.get(nombre='Ocupada')
-        habitacion.save()
-        print("✅ Habitación actualizada a Ocupada")
-
-    except CuentaCobrar.DoesNotExist:
-        print("❌ Cuenta no encontrada")
-    except Exception as e:
-        print(f"⚠️ Error inesperado: {e}")
-
-def handle_payment_failed(payment_intent):
-    cuenta_id = payment_intent.metadata.get('cuenta_id')
-    try:
-        cuenta = CuentaCobrar.objects.get(id_cuenta=cuenta_id)
-        
-        # Actualizar estado de la cuenta
-        cuenta.estado = 'VENCIDO'
-        cuenta.save()
-        
-        # Actualizar estado de la reserva
-        reserva = cuenta.codigo_reserva
-        reserva.id_estado_reserva = EstadoReserva.objects.get(nombre='Cancelada')  # Asegúrate de tener este estado
-        reserva.save()
-        
-        # Liberar habitación
-        habitacion = reserva.codigo_habitacion
-        habitacion.id_estado = EstadoHabitacion.objects.get(nombre='Disponible')  # Asegúrate de tener este estado
-        habitacion.save()
-        
-    except CuentaCobrar.DoesNotExist:
-        # Registrar el error para seguimiento
-        pass
\ No newline at end of file
@@ -0,0 +1,300 @@
+"""
+Driver de carga sobre la aplicación ASGI, en el mismo proceso.
+
+Cada trabajador (una tarea de asyncio) elige un escenario según su peso y
+envía la petición directamente al ``ASGIHandler`` de Django, sin red de por
+medio: se mide el costo de Django, DRF y la base de datos. La cantidad de
+consultas de cada petición se lee de la cabecera ``Server-Timing`` del
+middleware de instrumentación (ver ``rendimiento.middleware``), que se activa
+solo para el handler del benchmark.
+
+El escenario ``sse`` abre el stream del dashboard, mide hasta el primer
+fragmento y se desconecta. ``pagar_cuenta`` usa la pasarela falsa
+(``pagos.pasarelas``), de modo que el flujo de pago se mide sin red.
+
+``resumir`` calcula p50/p95/p99, throughput y consultas por petición por
+escenario; ``comparar`` contrasta un resultado con una línea base guardada.
+"""
+import asyncio
+import json
+import platform
+import random
+import re
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+from urllib.parse import urlencode
+
+import django
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from habitaciones.catalogos import estados_reserva, tipos_habitacion
+from habitaciones.models import Habitacion
+from pagos.models import CuentaCobrar
+from reservas.models import Reserva
+from usuarios.models import Usuario
+from .datos import ADMIN_DNI
+
+PESOS = {
+    'listar_habitaciones': 20,
+    'buscar_disponibilidad': 30,
+    'crear_reserva': 15,
+    'confirmar_reserva': 10,
+    'listar_todas_las_reservas': 15,
+    'sse': 10,
+    'pagar_cuenta': 5,
+}
+PERCENTILES = (50, 95, 99)
+_CONSULTAS = re.compile(r'desc="(\d+) consultas"')
+
+
+@dataclass
+class Resultado:
+    escenario: str
+    estado: int
+    ms: float
+    consultas: int
+
+
+class Peticion:
+    """Una petición HTTP enviada al handler ASGI."""
+
+    def __init__(self, metodo, ruta, datos=None, token=None, query=None, stream=False):
+        self.metodo = metodo
+        self.ruta = ruta
+        self.cuerpo = json.dumps(datos, default=str).encode() if datos is not None else b''
+        self.query = urlencode(query or {}).encode()
+        self.headers = [
+            (b'host', b'testserver'),
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(self.cuerpo)).encode()),
+        ]
+        if token:
+            self.headers.append((b'authorization', f'Bearer {token}'.encode()))
+        self.stream = stream
+
+    async def enviar(self, app):
+        """Devuelve (estado, consultas). Con ``stream`` termina en el primer fragmento."""
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': self.metodo, 'scheme': 'http', 'path': self.ruta,
+            'raw_path': self.ruta.encode(), 'query_string': self.query, 'root_path': '',
+            'headers': self.headers, 'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+        }
+        fin = asyncio.Event()
+        respuesta = {'estado': 0, 'headers': {}}
+        cuerpo_enviado = False
+
+        async def receive():
+            nonlocal cuerpo_enviado
+            if not cuerpo_enviado:
+                cuerpo_enviado = True
+                return {'type': 'http.request', 'body': self.cuerpo, 'more_body': False}
+            await fin.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(mensaje):
+            if mensaje['type'] == 'http.response.start':
+                respuesta['estado'] = mensaje['status']
+                respuesta['headers'] = {k.decode().lower(): v.decode() for k, v in mensaje['headers']}
+            elif mensaje['type'] == 'http.response.body':
+                if not mensaje.get('more_body') or (self.stream and mensaje.get('body')):
+                    fin.set()
+
+        # En un stream, receive() devuelve http.disconnect tras el primer
+        # fragmento y Django cierra la respuesta por su cuenta
+        await app(scope, receive, send)
+        encontrado = _CONSULTAS.search(respuesta['headers'].get('server-timing', ''))
+        return respuesta['estado'], int(encontrado.group(1)) if encontrado else 0
+
+
+class Escenarios:
+    """Genera la petición de cada escenario a partir de los datos existentes."""
+
+    def __init__(self, rng, muestra=200):
+        self.rng = rng
+        admin = Usuario.objects.get(pk=ADMIN_DNI)
+        self.token_admin = str(AccessToken.for_user(admin))
+        self.tokens_huesped = [
+            str(AccessToken.for_user(u)) for u in Usuario.objects.filter(rol='HUESPED').order_by('dni')[:muestra]
+        ]
+        self.habitaciones = list(Habitacion.objects.values_list('codigo', 'precio_actual'))
+        self.tipos = [t.nombre for t in tipos_habitacion.todos()]
+        pendiente = estados_reserva.por_nombre('Pendiente')
+        self.pendientes = list(
+            Reserva.objects.filter(id_estado_reserva=pendiente, fecha_checkin_programado__gt=timezone.now())
+            .order_by('id').values_list('id', flat=True)[:5000]
+        )
+        rng.shuffle(self.pendientes)
+        self.cuentas = list(
+            CuentaCobrar.objects.filter(estado='PENDIENTE').order_by('pk').values_list('pk', flat=True)[:5000]
+        )
+        self.hoy = timezone.now()
+
+    def _fechas(self, desde, hasta):
+        checkin = self.hoy + timedelta(days=self.rng.randint(desde, hasta))
+        return checkin, checkin + timedelta(days=self.rng.randint(1, 4))
+
+    def listar_habitaciones(self):
+        return Peticion('GET', '/api/habitaciones/listar/')
+
+    def buscar_disponibilidad(self):
+        checkin, checkout = self._fechas(1, 120)
+        return Peticion('POST', '/api/habitaciones/buscar-disponibilidad/', {
+            'fecha_checkin': checkin.isoformat(),
+            'fecha_checkout': checkout.isoformat(),
+            'tipo_habitacion': self.rng.choice(self.tipos),
+            'numero_huespedes': 2,
+        }, token=self.rng.choice(self.tokens_huesped))
+
+    def crear_reserva(self):
+        # Fechas lejanas para que la mayoría no choque con los datos generados
+        codigo, precio = self.rng.choice(self.habitaciones)
+        checkin, checkout = self._fechas(400, 4000)
+        return Peticion('POST', '/api/reservas/crear/', {
+            'codigo_habitacion': codigo,
+            'id_tipo_reserva': 2,
+            'fecha_checkin_programado': checkin.isoformat(),
+            'fecha_checkout_programado': checkout.isoformat(),
+            'numero_huespedes': 1,
+            'precio_noche': str(precio),
+            'pago': 'tarjeta',
+        }, token=self.rng.choice(self.tokens_huesped))
+
+    def confirmar_reserva(self):
+        if not self.pendientes:
+            return None
+        reserva_id = self.pendientes.pop()
+        return Peticion('POST', f'/api/reservas/{reserva_id}/confirmar/', token=self.token_admin)
+
+    def listar_todas_las_reservas(self):
+        return Peticion('GET', '/api/reservas/todas/', token=self.token_admin, query={'page_size': 50})
+
+    def sse(self):
+        return Peticion('GET', '/api/habitaciones/sse/habitaciones-dashboard/', stream=True)
+
+    def pagar_cuenta(self):
+        if not self.cuentas:
+            return None
+        return Peticion('GET', f'/api/pagos/pagar/{self.rng.choice(self.cuentas)}/')
+
+
+def crear_app():
+    """Handler ASGI con la instrumentación de SQL activada."""
+    with override_settings(INSTRUMENTACION_SQL=True,
+                           INSTRUMENTACION_SQL_MAX_CONSULTAS=10 ** 6,
+                           INSTRUMENTACION_SQL_MAX_MS=10 ** 6,
+                           INSTRUMENTACION_SQL_REPETICIONES=10 ** 6):
+        return ASGIHandler()
+
+
+async def ejecutar(app, escenarios, pesos, concurrencia, peticiones=None, duracion=None):
+    """Corre la carga. Termina tras ``peticiones`` en total o ``duracion`` segundos.
+    Devuelve (resultados, segundos)."""
+    nombres = [n for n in pesos if pesos[n] > 0]
+    valores = [pesos[n] for n in nombres]
+    resultados = []
+    inicio = time.perf_counter()
+    limite = inicio + duracion if duracion else None
+    restantes = peticiones
+
+    async def trabajador():
+        nonlocal restantes
+        while True:
+            if limite is not None and time.perf_counter() >= limite:
+                return
+            if restantes is not None:
+                if restantes <= 0:
+                    return
+                restantes -= 1
+            nombre = escenarios.rng.choices(nombres, valores)[0]
+            peticion = getattr(escenarios, nombre)()
+            if peticion is None:
+                continue
+            t0 = time.perf_counter()
+            estado, consultas = await peticion.enviar(app)
+            resultados.append(Resultado(nombre, estado, (time.perf_counter() - t0) * 1000, consultas))
+
+    await asyncio.gather(*[trabajador() for _ in range(concurrencia)])
+    return resultados, time.perf_counter() - inicio
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano sobre valores ordenados."""
+    if not valores:
+        return None
+    indice = max(0, min(len(valores) - 1, -(-p * len(valores) // 100) - 1))
+    return valores[int(indice)]
+
+
+def _estadisticas(filas, segundos):
+    tiempos = sorted(r.ms for r in filas)
+    consultas = [r.consultas for r in filas]
+    datos = {
+        'peticiones': len(filas),
+        'estados': dict(sorted(Counter(str(r.estado) for r in filas).items())),
+        'errores': sum(1 for r in filas if r.estado >= 500 or r.estado == 0),
+        'rps': round(len(filas) / segundos, 2) if segundos else None,
+        'media_ms': round(sum(tiempos) / len(tiempos), 2) if tiempos else None,
+        'consultas_media': round(sum(consultas) / len(consultas), 2) if consultas else None,
+        'consultas_p50': percentil(sorted(consultas), 50),
+        'consultas_max': max(consultas) if consultas else None,
+    }
+    for p in PERCENTILES:
+        valor = percentil(tiempos, p)
+        datos[f'p{p}_ms'] = round(valor, 2) if valor is not None else None
+    return datos
+
+
+def resumir(resultados, segundos, parametros=None):
+    por_escenario = defaultdict(list)
+    for resultado in resultados:
+        por_escenario[resultado.escenario].append(resultado)
+    return {
+        'fecha': timezone.now().isoformat(),
+        'entorno': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'base_de_datos': connection.vendor,
+        },
+        'parametros': parametros or {},
+        'segundos': round(segundos, 3),
+        'total': _estadisticas(resultados, segundos),
+        'escenarios': {nombre: _estadisticas(filas, segundos) for nombre, filas in sorted(por_escenario.items())},
+    }
+
+
+def comparar(actual, base, tolerancia=0.2):
+    """Lista de regresiones de ``actual`` frente a ``base``: p95 más de un
+    ``tolerancia`` peor, o más consultas en la petición típica (la mediana: el
+    máximo varía con las cachés frías del arranque)."""
+    regresiones = []
+    for nombre, datos in actual['escenarios'].items():
+        anterior = base.get('escenarios', {}).get(nombre)
+        if not anterior:
+            continue
+        if anterior.get('p95_ms') and datos['p95_ms'] > anterior['p95_ms'] * (1 + tolerancia):
+            regresiones.append(f"{nombre}: p95 {anterior['p95_ms']} ms -> {datos['p95_ms']} ms")
+        if anterior.get('consultas_p50') is not None and datos['consultas_p50'] > anterior['consultas_p50']:
+            regresiones.append(f"{nombre}: consultas {anterior['consultas_p50']} -> {datos['consultas_p50']}")
+    return regresiones
+
+
+def correr(concurrencia=8, peticiones=None, duracion=None, semilla=42, pesos=None):
+    """Prepara los escenarios, ejecuta la carga y devuelve el resumen."""
+    pesos = pesos or PESOS
+    escenarios = Escenarios(random.Random(semilla))
+    app = crear_app()
+    # Como en un servidor ASGI, las vistas síncronas corren en el hilo de
+    # asgiref (con su propia conexión), no en el hilo que lanza la carga.
+    with override_settings(PAGOS_PASARELA='falsa'):
+        resultados, segundos = asyncio.run(ejecutar(app, escenarios, pesos, concurrencia, peticiones, duracion))
+    return resumir(resultados, segundos, {
+        'concurrencia': concurrencia, 'peticiones': peticiones, 'duracion': duracion,
+        'semilla': semilla, 'pesos': pesos,
+    })
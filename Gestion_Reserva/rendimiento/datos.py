@@ -0,0 +1,211 @@
+"""
+Generador de datos para los benchmarks.
+
+Parte de los fixtures del proyecto (catálogos, las 28 habitaciones de
+``habitaciones/Habitacion/habitacion.json`` y los estados de
+``reservas/EstadoReserva``) y los replica hasta el volumen pedido:
+
+- Habitaciones: copias de las 28 plantillas en bloques (``H001101``,
+  ``H001102``, ...) con el mismo tipo, piso y precio.
+- Usuarios: huéspedes con DNI ``9xxxxxxx`` y una sola contraseña hasheada
+  (``CLAVE``), más el administrador ``ADMIN_DNI``.
+- Reservas: por habitación, estadías consecutivas sin solapamiento, unas 3/4
+  en el pasado (Finalizada o Cancelada) y el resto en el futuro (Pendiente,
+  Confirmada o Cancelada). Cada una con sus noches (``NocheHabitacion``) y
+  su ``CuentaCobrar``; las pagadas, con su movimiento en el libro de pagos.
+
+Todo es determinista para una misma ``semilla`` y se inserta con
+``bulk_create`` por lotes; al final se recalcula el resumen diario.
+"""
+import json
+import random
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+from analitica import resumen
+from habitaciones.catalogos import estados_reserva
+from habitaciones.disponibilidad import indice
+from habitaciones.models import Habitacion
+from pagos.models import CuentaCobrar, MovimientoPago
+from reservas.models import NocheHabitacion, Reserva
+from reservas.ocupacion import noches
+from usuarios.models import Usuario
+
+BASE_DIR = Path(settings.BASE_DIR)
+FIXTURES = [
+    BASE_DIR / 'huespedes/Tipos_De_Documento/fixtures_tipodocumento.json',
+    BASE_DIR / 'habitaciones/EstadoHabitacion/estado_habitacion.json',
+    BASE_DIR / 'habitaciones/TipoHabitacion/tipo_habitacion.json',
+    BASE_DIR / 'habitaciones/Habitacion/habitacion.json',
+    BASE_DIR / 'reservas/EstadoReserva/Estado_Reserva.json',
+    BASE_DIR / 'reservas/TipoReserva/tipo_reserva.json',
+]
+
+ADMIN_DNI = '10000001'
+CLAVE = 'benchmark'
+PAGOS = [codigo for codigo, _ in Reserva.TIPO_PAGO_CHOICES]
+FRACCION_PASADO = 0.75
+ESTADIA_MEDIA = 4.5  # noches + días libres entre estadías
+
+
+def _plantillas():
+    with open(BASE_DIR / 'habitaciones/Habitacion/habitacion.json', encoding='utf-8') as archivo:
+        return [fila for fila in json.load(archivo) if fila['model'] == 'habitaciones.habitacion']
+
+
+def _habitaciones(cantidad):
+    """Crea las habitaciones que faltan hasta ``cantidad``. Devuelve todas."""
+    plantillas = _plantillas()
+    existentes = set(Habitacion.objects.values_list('codigo', flat=True))
+    nuevas = []
+    bloque = 1
+    while len(existentes) + len(nuevas) < cantidad:
+        for plantilla in plantillas:
+            if len(existentes) + len(nuevas) >= cantidad:
+                break
+            campos = plantilla['fields']
+            codigo = f"H{bloque:03d}{campos['numero_habitacion']}"
+            if codigo in existentes:
+                continue
+            nuevas.append(Habitacion(
+                codigo=codigo,
+                numero_habitacion=f"{bloque}-{campos['numero_habitacion']}",
+                piso=campos['piso'],
+                id_tipo_id=campos['id_tipo'],
+                id_estado_id=1,
+                precio_actual=Decimal(campos['precio_actual']),
+            ))
+        bloque += 1
+    Habitacion.objects.bulk_create(nuevas, batch_size=1000)
+    return list(Habitacion.objects.order_by('codigo').values_list('codigo', 'precio_actual'))[:cantidad]
+
+
+def _usuarios(cantidad):
+    if not Usuario.objects.filter(pk=ADMIN_DNI).exists():
+        Usuario.objects.create_user(ADMIN_DNI, 'Admin', 'Benchmark', password=CLAVE, rol='ADMIN', is_staff=True)
+    clave = make_password(CLAVE)
+    dnis = [f'9{i:07d}' for i in range(cantidad)]
+    existentes = set(Usuario.objects.filter(pk__in=dnis).values_list('dni', flat=True))
+    Usuario.objects.bulk_create([
+        Usuario(dni=dni, nombres=f'Huésped {dni}', apellidos='Benchmark', rol='HUESPED', password=clave)
+        for dni in dnis if dni not in existentes
+    ], batch_size=2000)
+    return dnis
+
+
+def _estado(rng, checkin, checkout, ahora):
+    if checkout <= ahora:
+        return 'Finalizada' if rng.random() < 0.85 else 'Cancelada'
+    if checkin <= ahora:
+        return 'Confirmada'
+    sorteo = rng.random()
+    return 'Pendiente' if sorteo < 0.4 else 'Confirmada' if sorteo < 0.9 else 'Cancelada'
+
+
+def _estadias(rng, habitaciones, por_habitacion, ahora):
+    """Genera (codigo, precio, checkin, checkout, estado) sin solapamientos por habitación."""
+    inicio = timezone.localdate(ahora) - timedelta(days=int(por_habitacion * ESTADIA_MEDIA * FRACCION_PASADO))
+    hora = time(14)
+    for codigo, precio in habitaciones:
+        dia = inicio + timedelta(days=rng.randint(0, 3))
+        for _ in range(por_habitacion):
+            noches_estadia = rng.randint(1, 5)
+            checkin = timezone.make_aware(datetime.combine(dia, hora))
+            checkout = checkin + timedelta(days=noches_estadia, hours=-2)
+            yield codigo, precio, checkin, checkout, _estado(rng, checkin, checkout, ahora)
+            dia += timedelta(days=noches_estadia + rng.randint(0, 2))
+
+
+def _insertar_lote(filas, usuarios, rng, ahora):
+    pk_estado = {e.nombre: e.pk for e in estados_reserva.todos()}
+    reservas = []
+    for codigo, precio, checkin, checkout, estado in filas:
+        reserva = Reserva(
+            usuario_id=rng.choice(usuarios),
+            codigo_habitacion_id=codigo,
+            id_tipo_reserva_id=2,
+            id_estado_reserva_id=pk_estado[estado],
+            fecha_checkin_programado=checkin,
+            fecha_checkout_programado=checkout,
+            fecha_checkin_real=checkin if estado in ('Finalizada', 'Confirmada') and checkin <= ahora else None,
+            fecha_checkout_real=checkout if estado == 'Finalizada' else None,
+            numero_huespedes=1,
+            precio_noche=precio,
+            pago=rng.choice(PAGOS),
+        )
+        reserva.calcular_montos()
+        reservas.append(reserva)
+
+    estados_cuenta = {'Pendiente': 'PENDIENTE', 'Confirmada': 'PAGADO', 'Finalizada': 'PAGADO', 'Cancelada': 'CANCELADO'}
+    with transaction.atomic():
+        Reserva.objects.bulk_create(reservas)
+        NocheHabitacion.objects.bulk_create([
+            NocheHabitacion(habitacion_id=reserva.codigo_habitacion_id, fecha=fecha, reserva=reserva)
+            for reserva, fila in zip(reservas, filas) if fila[4] != 'Cancelada'
+            for fecha in noches(reserva.fecha_checkin_programado, reserva.fecha_checkout_programado)
+        ])
+        cuentas = []
+        for reserva, fila in zip(reservas, filas):
+            pagado = reserva.total_pagar if fila[4] in ('Confirmada', 'Finalizada') else 0
+            cuentas.append(CuentaCobrar(
+                codigo_reserva=reserva,
+                dni_huesped_id=reserva.usuario_id,
+                monto_total=reserva.total_pagar,
+                monto_pagado=pagado,
+                saldo_pendiente=reserva.total_pagar - pagado,
+                fecha_vencimiento=timezone.localdate(fila[2]) - timedelta(days=1),
+                estado=estados_cuenta[fila[4]],
+            ))
+        CuentaCobrar.objects.bulk_create(cuentas)
+        MovimientoPago.objects.bulk_create([
+            MovimientoPago(cuenta=cuenta, metodo=reserva.pago, monto=cuenta.monto_pagado)
+            for cuenta, reserva in zip(cuentas, reservas) if cuenta.monto_pagado
+        ])
+    return len(reservas)
+
+
+def generar(habitaciones=2000, usuarios=100000, reservas=300000, semilla=42, lote=5000, salida=None):
+    """Carga los fixtures y genera el volumen pedido. Devuelve un dict con los conteos."""
+    escribir = salida or (lambda mensaje: None)
+    rng = random.Random(semilla)
+    ahora = timezone.now()
+
+    call_command('loaddata', *[str(f) for f in FIXTURES], verbosity=0)
+    filas_habitaciones = _habitaciones(habitaciones)
+    escribir(f"Habitaciones: {len(filas_habitaciones)}")
+    dnis = _usuarios(usuarios)
+    escribir(f"Huéspedes: {len(dnis)}")
+
+    por_habitacion = max(1, -(-reservas // len(filas_habitaciones)))
+    creadas = 0
+    pendientes = []
+    for fila in _estadias(rng, filas_habitaciones, por_habitacion, ahora):
+        if creadas + len(pendientes) >= reservas:
+            break
+        pendientes.append(fila)
+        if len(pendientes) >= lote:
+            creadas += _insertar_lote(pendientes, dnis, rng, ahora)
+            pendientes = []
+            escribir(f"Reservas: {creadas}")
+    if pendientes:
+        creadas += _insertar_lote(pendientes, dnis, rng, ahora)
+    escribir(f"Reservas: {creadas}")
+
+    if creadas:
+        # El resumen cuenta noches: hasta el último check-out, no el último check-in
+        primera = Reserva.objects.order_by('fecha_checkin_programado').values_list('fecha_checkin_programado', flat=True)
+        ultima = Reserva.objects.order_by('-fecha_checkout_programado').values_list('fecha_checkout_programado', flat=True)
+        resumen.recalcular(timezone.localdate(primera.first()), timezone.localdate(ultima.first()))
+    indice.invalidar()
+    return {
+        'habitaciones': len(filas_habitaciones),
+        'usuarios': len(dnis),
+        'reservas': creadas,
+    }
@@ -0,0 +1,139 @@
+"""
+Benchmark de escrituras concurrentes sobre la base de datos configurada.
+
+Cada hilo repite la transacción de ``crear_reserva``: lee la habitación,
+guarda la reserva con sus noches y crea la cuenta por cobrar. Entre una
+escritura y otra se llama a ``close_old_connections``, como al terminar una
+petición, de modo que ``CONN_MAX_AGE`` decide si la conexión se reutiliza o
+se abre otra (y se vuelven a aplicar los PRAGMA).
+
+Los hilos usan habitaciones distintas y fechas lejanas: los conflictos que
+aparezcan son de la base de datos ("database is locked"), no de
+solapamiento de noches. Al terminar se borra todo lo creado.
+
+Para comparar perfiles se ejecuta el comando ``benchmark_escritura`` con
+cada ``DB_PERFIL`` sobre la misma base de datos (ver
+``Gestion_Reserva.basedatos``).
+"""
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from habitaciones.catalogos import estados_reserva
+from habitaciones.models import Habitacion
+from pagos.models import CuentaCobrar
+from reservas.models import Reserva
+from usuarios.models import Usuario
+from .carga import percentil
+
+# Lejos de los datos generados por generar_datos_benchmark
+INICIO = datetime(2100, 1, 1)
+
+
+def _escribir(codigo, precio, dni, checkin):
+    with transaction.atomic():
+        Habitacion.objects.filter(pk=codigo).values_list('id_estado_id', flat=True).get()
+        reserva = Reserva(
+            usuario_id=dni,
+            codigo_habitacion_id=codigo,
+            id_tipo_reserva_id=2,
+            id_estado_reserva=estados_reserva.por_nombre('Pendiente'),
+            fecha_checkin_programado=checkin,
+            fecha_checkout_programado=checkin + timedelta(days=1),
+            numero_huespedes=1,
+            precio_noche=precio,
+        )
+        reserva.save()
+        CuentaCobrar.objects.create(
+            codigo_reserva=reserva,
+            dni_huesped_id=dni,
+            monto_total=reserva.total_pagar,
+            fecha_vencimiento=checkin.date(),
+            estado='PENDIENTE',
+        )
+    return reserva.pk
+
+
+def _modo_journal():
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        return cursor.fetchone()[0]
+
+
+def ejecutar(hilos=8, escrituras=200, semilla=42):
+    """Corre ``escrituras`` transacciones por hilo. Devuelve el resumen."""
+    rng = random.Random(semilla)
+    habitaciones = list(Habitacion.objects.order_by('codigo').values_list('codigo', 'precio_actual')[:hilos])
+    if len(habitaciones) < hilos:
+        raise ValueError(f"Se necesitan al menos {hilos} habitaciones.")
+    dnis = list(Usuario.objects.filter(rol='HUESPED').values_list('dni', flat=True)[:100])
+    if not dnis:
+        raise ValueError("Se necesita al menos un huésped.")
+    journal = _modo_journal()
+    # Las noches son fechas locales: una reserva por día y habitación
+    inicio = timezone.make_aware(INICIO.replace(hour=14))
+
+    tiempos, bloqueos, creadas = [], [], []
+    lock = threading.Lock()
+    barrera = threading.Barrier(hilos)
+
+    def trabajador(codigo, precio, dnis_hilo):
+        propios_tiempos, propios_bloqueos, propias = [], 0, []
+        try:
+            barrera.wait()
+            for i in range(escrituras):
+                t0 = time.perf_counter()
+                try:
+                    propias.append(_escribir(codigo, precio, dnis_hilo[i % len(dnis_hilo)],
+                                             inicio + timedelta(days=i)))
+                    propios_tiempos.append((time.perf_counter() - t0) * 1000)
+                except OperationalError:
+                    propios_bloqueos += 1
+                close_old_connections()
+        finally:
+            connection.close()
+        with lock:
+            tiempos.extend(propios_tiempos)
+            bloqueos.append(propios_bloqueos)
+            creadas.extend(propias)
+
+    ejecucion = [
+        threading.Thread(target=trabajador, args=(codigo, precio, rng.sample(dnis, min(len(dnis), 10))))
+        for codigo, precio in habitaciones
+    ]
+    t0 = time.perf_counter()
+    for hilo in ejecucion:
+        hilo.start()
+    for hilo in ejecucion:
+        hilo.join()
+    segundos = time.perf_counter() - t0
+
+    _limpiar(creadas)
+    tiempos.sort()
+    datos = connection.settings_dict
+    return {
+        'perfil': getattr(settings, 'DB_PERFIL', 'desarrollo'),
+        'journal_mode': journal,
+        'transaction_mode': datos['OPTIONS'].get('transaction_mode') or 'DEFERRED',
+        'conn_max_age': datos['CONN_MAX_AGE'],
+        'hilos': hilos,
+        'intentos': hilos * escrituras,
+        'escrituras': len(creadas),
+        'bloqueos': sum(bloqueos),
+        'segundos': round(segundos, 3),
+        'escrituras_por_segundo': round(len(creadas) / segundos, 2) if segundos else None,
+        **{f'p{p}_ms': round(percentil(tiempos, p), 2) if tiempos else None for p in (50, 95, 99)},
+    }
+
+
+def _limpiar(ids):
+    for inicio in range(0, len(ids), 500):
+        lote = ids[inicio:inicio + 500]
+        with transaction.atomic():
+            CuentaCobrar.objects.filter(codigo_reserva__in=lote).delete()
+            Reserva.objects.filter(pk__in=lote).delete()
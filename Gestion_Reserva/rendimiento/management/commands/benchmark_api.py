@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rendimiento.carga import PESOS, comparar as comparar_resultados, correr
+
+
+class Command(BaseCommand):
+    help = ("Ejecuta carga concurrente sobre los endpoints principales a través de la aplicación ASGI "
+            "y reporta p50/p95/p99, throughput y consultas por petición.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrencia', type=int, default=8)
+        parser.add_argument('--peticiones', type=int, default=None, help="Total de peticiones")
+        parser.add_argument('--duracion', type=float, default=None, help="Segundos (si no se indica --peticiones)")
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--escenarios', nargs='+', choices=sorted(PESOS), help="Solo estos escenarios")
+        parser.add_argument('--salida', help="Archivo JSON donde guardar el resultado (línea base)")
+        parser.add_argument('--comparar', help="Línea base JSON contra la que comparar")
+        parser.add_argument('--tolerancia', type=float, default=0.2, help="Aumento de p95 permitido (0.2 = 20%%)")
+
+    def handle(self, *args, concurrencia, peticiones, duracion, semilla, escenarios, salida,
+               comparar, tolerancia, **options):
+        if peticiones is None and duracion is None:
+            duracion = 30
+        pesos = {n: p for n, p in PESOS.items() if not escenarios or n in escenarios}
+        resultado = correr(concurrencia=concurrencia, peticiones=peticiones, duracion=duracion,
+                           semilla=semilla, pesos=pesos)
+
+        self.stdout.write(f"{'escenario':<28}{'n':>7}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'sql':>7}")
+        filas = list(resultado['escenarios'].items()) + [('total', resultado['total'])]
+        for nombre, datos in filas:
+            self.stdout.write(
+                f"{nombre:<28}{datos['peticiones']:>7}{datos['rps']:>9}{datos['p50_ms']:>9}"
+                f"{datos['p95_ms']:>9}{datos['p99_ms']:>9}{datos['consultas_media']:>7}"
+            )
+        if salida:
+            with open(salida, 'w', encoding='utf-8') as archivo:
+                json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Resultado guardado en {salida}")
+
+        if comparar:
+            with open(comparar, encoding='utf-8') as archivo:
+                regresiones = comparar_resultados(resultado, json.load(archivo), tolerancia)
+            if regresiones:
+                raise CommandError("Regresiones frente a la línea base:\n" + '\n'.join(regresiones))
+            self.stdout.write(self.style.SUCCESS("Sin regresiones frente a la línea base"))
@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rendimiento.escritura import ejecutar
+
+
+class Command(BaseCommand):
+    help = ("Mide el throughput de escrituras concurrentes (crear reserva + cuenta) con la configuración "
+            "de base de datos actual. Ejecutar con cada DB_PERFIL para comparar.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8)
+        parser.add_argument('--escrituras', type=int, default=200, help="Transacciones por hilo")
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--salida', help="Archivo JSON donde guardar el resultado")
+        parser.add_argument('--comparar', help="Resultado JSON anterior contra el que comparar")
+
+    def handle(self, *args, hilos, escrituras, semilla, salida, comparar, **options):
+        try:
+            resultado = ejecutar(hilos=hilos, escrituras=escrituras, semilla=semilla)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        anterior = None
+        if comparar:
+            with open(comparar, encoding='utf-8') as archivo:
+                anterior = json.load(archivo)
+        for clave, valor in resultado.items():
+            linea = f"{clave:<24}{valor}"
+            if anterior and clave in anterior and anterior[clave] != valor:
+                linea += f"  (antes: {anterior[clave]})"
+            self.stdout.write(linea)
+
+        if salida:
+            with open(salida, 'w', encoding='utf-8') as archivo:
+                json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Resultado guardado en {salida}")
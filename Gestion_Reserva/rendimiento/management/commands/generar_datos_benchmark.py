@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from reservas.models import Reserva
+from rendimiento.datos import generar
+
+
+class Command(BaseCommand):
+    help = "Genera habitaciones, huéspedes, reservas y cuentas para los benchmarks (usar una base de datos aparte)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--habitaciones', type=int, default=2000)
+        parser.add_argument('--usuarios', type=int, default=100000)
+        parser.add_argument('--reservas', type=int, default=300000)
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--lote', type=int, default=5000, help="Reservas por transacción")
+
+    def handle(self, *args, habitaciones, usuarios, reservas, semilla, lote, **options):
+        if Reserva.objects.exists():
+            raise CommandError("La base de datos ya tiene reservas: genera los datos sobre una base vacía.")
+        conteos = generar(
+            habitaciones=habitaciones, usuarios=usuarios, reservas=reservas,
+            semilla=semilla, lote=lote, salida=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Datos generados: {conteos}"))
@@ -0,0 +1,102 @@
+"""
+Instrumentación de las consultas SQL de cada petición.
+
+Con ``INSTRUMENTACION_SQL = True`` el middleware envuelve todas las conexiones
+con ``connection.execute_wrapper`` y, por petición, registra:
+
+- cantidad de consultas y tiempo total en la base de datos;
+- las ``INSTRUMENTACION_SQL_LENTAS`` sentencias más lentas;
+- las formas de SQL repetidas al menos ``INSTRUMENTACION_SQL_REPETICIONES``
+  veces (N+1). La forma es el SQL con parámetros, sin los valores, y con las
+  listas ``IN (%s, %s, ...)`` reducidas a ``IN (...)``.
+
+La respuesta lleva la cabecera ``Server-Timing`` (``db`` y ``app``), que las
+herramientas de desarrollo del navegador muestran en la pestaña de red. Las
+peticiones que superan ``INSTRUMENTACION_SQL_MAX_CONSULTAS`` o
+``INSTRUMENTACION_SQL_MAX_MS``, o que tienen N+1, se registran con
+``logger.warning``.
+
+Desactivado, el middleware lanza ``MiddlewareNotUsed`` y Django lo quita de
+la cadena: no tiene costo alguno. Las consultas que hace un
+``StreamingHttpResponse`` al enviarse no se cuentan.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_LISTA_PARAMETROS = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+
+
+def forma(sql):
+    """SQL sin la cantidad de elementos de las listas de parámetros."""
+    return _LISTA_PARAMETROS.sub('(...)', sql)
+
+
+class RegistroConsultas:
+    """``execute_wrapper`` que mide cada sentencia."""
+
+    def __init__(self):
+        self.cantidad = 0
+        self.segundos = 0.0
+        self.formas = Counter()
+        self.tiempos = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.cantidad += 1
+            self.segundos += duracion
+            self.formas[forma(sql)] += 1
+            self.tiempos.append((duracion, sql))
+
+    def lentas(self, cantidad):
+        return sorted(self.tiempos, key=lambda t: t[0], reverse=True)[:cantidad]
+
+    def repetidas(self, minimo):
+        return [(sql, veces) for sql, veces in self.formas.most_common() if veces >= minimo]
+
+
+class InstrumentacionSQLMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTACION_SQL', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.max_consultas = getattr(settings, 'INSTRUMENTACION_SQL_MAX_CONSULTAS', 50)
+        self.max_ms = getattr(settings, 'INSTRUMENTACION_SQL_MAX_MS', 500)
+        self.repeticiones = getattr(settings, 'INSTRUMENTACION_SQL_REPETICIONES', 5)
+        self.cantidad_lentas = getattr(settings, 'INSTRUMENTACION_SQL_LENTAS', 3)
+
+    def __call__(self, request):
+        registro = RegistroConsultas()
+        inicio = time.perf_counter()
+        with ExitStack() as pila:
+            for conexion in connections.all():
+                pila.enter_context(conexion.execute_wrapper(registro))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - inicio) * 1000
+        db_ms = registro.segundos * 1000
+
+        response['Server-Timing'] = (
+            f'db;dur={db_ms:.1f};desc="{registro.cantidad} consultas", app;dur={total_ms - db_ms:.1f}'
+        )
+        repetidas = registro.repetidas(self.repeticiones)
+        if repetidas or registro.cantidad > self.max_consultas or total_ms > self.max_ms:
+            lineas = [
+                f"{request.method} {request.path}: {registro.cantidad} consultas, "
+                f"{db_ms:.1f} ms en la base de datos, {total_ms:.1f} ms en total"
+            ]
+            lineas += [f"  posible N+1 ({veces} veces): {sql}" for sql, veces in repetidas]
+            lineas += [f"  lenta ({d * 1000:.1f} ms): {sql}" for d, sql in registro.lentas(self.cantidad_lentas)]
+            logger.warning('\n'.join(lineas))
+        return response
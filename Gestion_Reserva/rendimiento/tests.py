@@ -0,0 +1,111 @@
+import tempfile
+from pathlib import Path
+
+from django.db import connection
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from Gestion_Reserva import basedatos
+from habitaciones.models import Habitacion
+from habitaciones.tests import FIXTURES
+from pagos.models import CuentaCobrar
+from reservas.models import NocheHabitacion, Reserva
+from reservas.ocupacion import noches
+from usuarios.models import Usuario
+from .carga import Resultado, comparar, percentil, resumir
+from .datos import generar
+from .middleware import RegistroConsultas, forma
+
+
+class InstrumentacionSQLTests(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(
+            Usuario.objects.create_user('40000001', 'Admin', 'Hotel', password='clave-segura', rol='ADMIN')
+        )
+
+    def test_formas_repetidas(self):
+        registro = RegistroConsultas()
+        with connection.execute_wrapper(registro):
+            for codigo in ('HAB101', 'HAB102', 'HAB103'):
+                Habitacion.objects.get(pk=codigo)
+            list(Habitacion.objects.filter(pk__in=['HAB101', 'HAB102']))
+        self.assertEqual(registro.cantidad, 4)
+        [(sql, veces)] = registro.repetidas(3)
+        self.assertEqual(veces, 3)
+        self.assertIn('"habitacion"."codigo" = %s', sql)
+        self.assertEqual(forma('WHERE id IN (%s, %s, %s)'), forma('WHERE id IN (%s)'))
+
+    @override_settings(INSTRUMENTACION_SQL=True, INSTRUMENTACION_SQL_MAX_CONSULTAS=0)
+    def test_server_timing_y_presupuesto(self):
+        with self.assertLogs('rendimiento.middleware', 'WARNING') as logs:
+            respuesta = self.cliente.get('/api/reservas/listar/')
+        self.assertRegex(respuesta['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ consultas", app;dur=[\d.]+$')
+        self.assertIn('GET /api/reservas/listar/', logs.output[0])
+
+    def test_desactivado(self):
+        respuesta = self.cliente.get('/api/reservas/listar/')
+        self.assertNotIn('Server-Timing', respuesta)
+
+
+class BenchmarkTests(TestCase):
+
+    def test_generar_datos(self):
+        conteos = generar(habitaciones=40, usuarios=30, reservas=120, lote=50)
+        self.assertEqual(conteos, {'habitaciones': 40, 'usuarios': 30, 'reservas': 120})
+        self.assertEqual(Habitacion.objects.count(), 40)
+        self.assertEqual(CuentaCobrar.objects.count(), 120)
+        # Las noches generadas no chocan con la restricción única por habitación y fecha
+        self.assertEqual(
+            NocheHabitacion.objects.count(),
+            sum(len(noches(r.fecha_checkin_programado, r.fecha_checkout_programado))
+                for r in Reserva.objects.exclude(id_estado_reserva__nombre='Cancelada')),
+        )
+
+    def test_resumen_y_comparacion(self):
+        resultados = [Resultado('listar', 200, float(ms), 3) for ms in range(1, 101)]
+        resultados.append(Resultado('crear', 500, 10.0, 12))
+        resumen = resumir(resultados, 2.0)
+        listar = resumen['escenarios']['listar']
+        self.assertEqual((listar['p50_ms'], listar['p95_ms'], listar['p99_ms']), (50.0, 95.0, 99.0))
+        self.assertEqual(resumen['escenarios']['crear']['errores'], 1)
+        self.assertEqual(resumen['total']['rps'], 50.5)
+        self.assertIsNone(percentil([], 95))
+
+        self.assertEqual(comparar(resumen, resumen), [])
+        peor = resumir([Resultado('listar', 200, float(ms) * 2, 4) for ms in range(1, 101)], 2.0)
+        self.assertEqual(comparar(peor, resumen), [
+            'listar: p95 95.0 ms -> 190.0 ms', 'listar: consultas 3 -> 4',
+        ])
+
+
+class PerfilBaseDatosTests(SimpleTestCase):
+    # La conexión del test es a un archivo temporal propio, no a la base de pruebas
+    databases = {'default'}
+
+    def test_perfil_produccion(self):
+        with tempfile.TemporaryDirectory() as directorio:
+            conexiones = ConnectionHandler({
+                'default': basedatos.sqlite(Path(directorio) / 'perfil.sqlite3', perfil='produccion', cache_mb=8),
+            })
+            conexion = conexiones['default']
+            try:
+                with conexion.cursor() as cursor:
+                    valores = {}
+                    for pragma in ('journal_mode', 'synchronous', 'cache_size', 'busy_timeout'):
+                        cursor.execute(f'PRAGMA {pragma}')
+                        valores[pragma] = cursor.fetchone()[0]
+            finally:
+                conexion.close()
+        # synchronous=1 es NORMAL; busy_timeout sale de 'timeout' (segundos)
+        self.assertEqual(valores, {'journal_mode': 'wal', 'synchronous': 1, 'cache_size': -8192, 'busy_timeout': 20000})
+        self.assertEqual(conexion.transaction_mode, 'IMMEDIATE')
+        self.assertEqual(conexion.settings_dict['CONN_MAX_AGE'], 600)
+
+    def test_perfil_invalido(self):
+        self.assertNotIn('OPTIONS', basedatos.sqlite('db.sqlite3'))
+        with self.assertRaises(ValueError):
+            basedatos.sqlite('db.sqlite3', perfil='rapido')
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ReservasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reservas'
+
+    def ready(self):
+        from .vencimiento import iniciar_barredor
+        iniciar_barredor()
@@ -0,0 +1,154 @@
+"""
+Exportación de reservas en NDJSON o CSV.
+
+Las filas se leen con ``values()`` e ``iterator(chunk_size=...)`` y se
+escriben una a una en un ``StreamingHttpResponse``: la memoria del worker no
+depende de la cantidad de reservas. Los nombres de estado y tipo de reserva
+salen de los catálogos en memoria.
+
+Bajo ASGI, Django no recorre un generador síncrono en streaming: lo convierte
+en lista (toda la exportación en memoria) antes de enviarlo. Para ese caso
+``en_lotes`` lo envuelve en un iterador asíncrono que lee cada lote con
+``sync_to_async``.
+"""
+import csv
+import itertools
+import json
+
+from asgiref.sync import sync_to_async
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_date
+
+from habitaciones.catalogos import estados_reserva, tipos_reserva
+from .models import Reserva
+
+TAMANO_LOTE = 2000
+
+CAMPOS_CONSULTA = (
+    'id',
+    'codigo_habitacion_id',
+    'codigo_habitacion__numero_habitacion',
+    'codigo_habitacion__id_tipo__nombre',
+    'usuario__dni',
+    'usuario__nombres',
+    'usuario__apellidos',
+    'id_tipo_reserva_id',
+    'id_estado_reserva_id',
+    'fecha_reserva',
+    'fecha_checkin_programado',
+    'fecha_checkout_programado',
+    'fecha_checkin_real',
+    'fecha_checkout_real',
+    'numero_huespedes',
+    'precio_noche',
+    'descuento_aplicado',
+    'impuestos',
+    'total_noches',
+    'subtotal',
+    'total_pagar',
+    'pago',
+)
+
+COLUMNAS = [
+    'id', 'codigo_habitacion', 'habitacion_numero', 'habitacion_tipo',
+    'usuario_dni', 'usuario_nombres', 'usuario_apellidos', 'tipo_reserva', 'estado_reserva',
+    'fecha_reserva', 'fecha_checkin_programado', 'fecha_checkout_programado',
+    'fecha_checkin_real', 'fecha_checkout_real', 'numero_huespedes', 'precio_noche',
+    'descuento', 'impuestos', 'total_noches', 'subtotal', 'total_pagar', 'pago',
+]
+
+
+def filtrar(params):
+    """Queryset de reservas según los filtros de la petición. Lanza ValueError
+    si algún filtro no es válido."""
+    reservas = Reserva.objects.all()
+    for param, lookup in (('desde', 'fecha_checkin_programado__date__gte'),
+                          ('hasta', 'fecha_checkin_programado__date__lte')):
+        if params.get(param):
+            fecha = parse_date(params[param])
+            if fecha is None:
+                raise ValueError(f"Fecha no válida en '{param}': {params[param]}")
+            reservas = reservas.filter(**{lookup: fecha})
+    try:
+        if params.get('estado'):
+            reservas = reservas.filter(id_estado_reserva=estados_reserva.por_nombre(params['estado']).pk)
+        if params.get('tipo'):
+            reservas = reservas.filter(id_tipo_reserva=tipos_reserva.por_nombre(params['tipo']).pk)
+    except (estados_reserva.modelo.DoesNotExist, tipos_reserva.modelo.DoesNotExist) as e:
+        raise ValueError(str(e))
+    if params.get('tipo_habitacion'):
+        reservas = reservas.filter(codigo_habitacion__id_tipo__nombre__iexact=params['tipo_habitacion'])
+    if params.get('habitacion'):
+        reservas = reservas.filter(codigo_habitacion=params['habitacion'])
+    return reservas
+
+
+def filas(reservas):
+    """Genera un dict por reserva con las columnas de ``COLUMNAS``."""
+    nombres_estado = {e.pk: e.nombre for e in estados_reserva.todos()}
+    nombres_tipo = {t.pk: t.nombre for t in tipos_reserva.todos()}
+    consulta = reservas.order_by('fecha_checkin_programado', 'id').values_list(*CAMPOS_CONSULTA)
+    for valores in consulta.iterator(chunk_size=TAMANO_LOTE):
+        r = dict(zip(CAMPOS_CONSULTA, valores))
+        yield {
+            'id': r['id'],
+            'codigo_habitacion': r['codigo_habitacion_id'],
+            'habitacion_numero': r['codigo_habitacion__numero_habitacion'],
+            'habitacion_tipo': r['codigo_habitacion__id_tipo__nombre'],
+            'usuario_dni': r['usuario__dni'],
+            'usuario_nombres': r['usuario__nombres'],
+            'usuario_apellidos': r['usuario__apellidos'],
+            'tipo_reserva': nombres_tipo.get(r['id_tipo_reserva_id']),
+            'estado_reserva': nombres_estado.get(r['id_estado_reserva_id']),
+            'fecha_reserva': r['fecha_reserva'],
+            'fecha_checkin_programado': r['fecha_checkin_programado'],
+            'fecha_checkout_programado': r['fecha_checkout_programado'],
+            'fecha_checkin_real': r['fecha_checkin_real'],
+            'fecha_checkout_real': r['fecha_checkout_real'],
+            'numero_huespedes': r['numero_huespedes'],
+            'precio_noche': r['precio_noche'],
+            'descuento': r['descuento_aplicado'],
+            'impuestos': r['impuestos'],
+            'total_noches': r['total_noches'],
+            'subtotal': r['subtotal'],
+            'total_pagar': r['total_pagar'],
+            'pago': r['pago'],
+        }
+
+
+def ndjson(reservas):
+    for fila in filas(reservas):
+        yield json.dumps(fila, cls=DjangoJSONEncoder) + '\n'
+
+
+class _Eco:
+    """Archivo falso para csv.writer: devuelve la línea en lugar de guardarla."""
+    def write(self, valor):
+        return valor
+
+
+def csv_lineas(reservas):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(COLUMNAS)
+    for fila in filas(reservas):
+        yield escritor.writerow([
+            '' if fila[c] is None else (fila[c].isoformat() if hasattr(fila[c], 'isoformat') else fila[c])
+            for c in COLUMNAS
+        ])
+
+
+async def en_lotes(lineas, lote=None):
+    """Iterador asíncrono sobre un generador de líneas (``ndjson`` o
+    ``csv_lineas``). Cada fragmento son ``lote`` líneas leídas en el hilo de
+    la base de datos; el generador se cierra aunque el cliente se desconecte."""
+    lote = lote or TAMANO_LOTE
+    siguiente = sync_to_async(lambda: ''.join(itertools.islice(lineas, lote)), thread_sensitive=True)
+    try:
+        while True:
+            bloque = await siguiente()
+            if not bloque:
+                return
+            yield bloque
+    finally:
+        await sync_to_async(lineas.close, thread_sensitive=True)()
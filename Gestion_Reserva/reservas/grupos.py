@@ -0,0 +1,144 @@
+"""
+Reservas grupales: varias habitaciones en una sola transacción.
+
+La validación trabaja por conjuntos (una consulta para las habitaciones y otra
+para las noches ocupadas) y las inserciones usan ``bulk_create``. Así el costo
+en consultas es el mismo para 2 que para 40 habitaciones. Si alguna habitación
+no se puede reservar no se crea nada.
+
+Como ``bulk_create`` no llama a ``save()`` ni emite ``post_save``, aquí se
+calculan los montos, se registran las noches (NocheHabitacion) con su cambio
+de disponibilidad y, tras el commit, se envía ``transicion_reserva`` con la
+transición ``'crear'`` para que los resúmenes se actualicen.
+"""
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from habitaciones.catalogos import estados_habitacion, estados_reserva, tipos_habitacion
+from habitaciones.disponibilidad import registrar_cambios
+from habitaciones.models import Habitacion
+from pagos.models import CuentaCobrar
+from .models import GrupoReserva, HistorialReserva, NocheHabitacion, Reserva, calcular_descuento
+from .ocupacion import MENSAJE_SOLAPAMIENTO, noches, rango_noches
+from .signals import transicion_reserva
+
+MAX_HABITACIONES = 100
+DIAS_VENCIMIENTO = 2
+ESTADOS_NO_RESERVABLES = ('Ocupada', 'Reservada', 'Limpieza')
+
+
+class GrupoInvalido(ValueError):
+    """Errores de validación de una reserva grupal, uno por habitación."""
+    def __init__(self, errores):
+        self.errores = errores if isinstance(errores, list) else [errores]
+        super().__init__('; '.join(self.errores))
+
+
+def _validar(usuario, usuario_admin, tipo_reserva, solicitudes, fecha_checkin, fecha_checkout):
+    """Devuelve las habitaciones (en el orden pedido) o lanza GrupoInvalido con
+    todos los problemas encontrados."""
+    if usuario.rol != 'HUESPED':
+        raise GrupoInvalido('El usuario debe tener rol HUESPED.')
+    if usuario_admin is not None and usuario_admin.rol != 'ADMIN':
+        raise GrupoInvalido('El usuario_admin debe tener rol ADMIN.')
+    if tipo_reserva.requiere_presencia and usuario_admin is None:
+        raise GrupoInvalido('Las reservas presenciales deben tener un administrador asignado.')
+    if fecha_checkout <= fecha_checkin:
+        raise GrupoInvalido('La fecha de check-out debe ser posterior a la de check-in.')
+    if not solicitudes or len(solicitudes) > MAX_HABITACIONES:
+        raise GrupoInvalido(f'Se deben reservar entre 1 y {MAX_HABITACIONES} habitaciones.')
+
+    codigos = [s['codigo_habitacion'] for s in solicitudes]
+    if len(set(codigos)) != len(codigos):
+        raise GrupoInvalido('Hay habitaciones repetidas en la solicitud.')
+
+    habitaciones = Habitacion.objects.in_bulk(codigos)
+    errores = []
+    for solicitud in solicitudes:
+        codigo = solicitud['codigo_habitacion']
+        habitacion = habitaciones.get(codigo)
+        if habitacion is None:
+            errores.append(f'{codigo}: la habitación no existe.')
+            continue
+        capacidad = tipos_habitacion.get(habitacion.id_tipo_id).capacidad_maxima
+        if solicitud['numero_huespedes'] > capacidad:
+            errores.append(f'{codigo}: {solicitud["numero_huespedes"]} huéspedes supera la capacidad máxima ({capacidad}).')
+        estado = estados_habitacion.get(habitacion.id_estado_id).nombre
+        if estado in ESTADOS_NO_RESERVABLES:
+            errores.append(f"{codigo}: la habitación está en estado '{estado}'.")
+
+    desde, hasta = rango_noches(fecha_checkin, fecha_checkout)
+    ocupadas = NocheHabitacion.objects.filter(
+        habitacion__in=list(habitaciones), fecha__gte=desde, fecha__lt=hasta
+    ).values_list('habitacion_id', flat=True).distinct()
+    errores.extend(f'{codigo}: {MENSAJE_SOLAPAMIENTO}' for codigo in sorted(ocupadas))
+
+    if errores:
+        raise GrupoInvalido(errores)
+    return [habitaciones[codigo] for codigo in codigos]
+
+
+def crear_grupo(usuario, solicitudes, fecha_checkin, fecha_checkout, tipo_reserva,
+                pago='efectivo', usuario_admin=None, nombre=None, observaciones=None):
+    """Crea el grupo, sus reservas (Pendiente), el historial y una cuenta por
+    cobrar consolidada. ``solicitudes`` es una lista de dicts con
+    ``codigo_habitacion`` y ``numero_huespedes``.
+
+    Devuelve (grupo, reservas, cuenta). Lanza GrupoInvalido si la solicitud no es válida.
+    """
+    habitaciones = _validar(usuario, usuario_admin, tipo_reserva, solicitudes, fecha_checkin, fecha_checkout)
+    pendiente = estados_reserva.por_nombre('Pendiente')
+
+    reservas = []
+    for solicitud, habitacion in zip(solicitudes, habitaciones):
+        reserva = Reserva(
+            usuario=usuario,
+            usuario_admin=usuario_admin,
+            codigo_habitacion=habitacion,
+            id_tipo_reserva=tipo_reserva,
+            id_estado_reserva=pendiente,
+            fecha_checkin_programado=fecha_checkin,
+            fecha_checkout_programado=fecha_checkout,
+            numero_huespedes=solicitud['numero_huespedes'],
+            precio_noche=habitacion.precio_actual,
+            pago=pago,
+            observaciones=observaciones,
+        )
+        reserva.calcular_montos()
+        reserva.descuento_aplicado = calcular_descuento(usuario, reserva.subtotal)
+        reserva.calcular_montos()
+        reservas.append(reserva)
+
+    fechas = noches(fecha_checkin, fecha_checkout)
+    with transaction.atomic():
+        grupo = GrupoReserva.objects.create(usuario=usuario, usuario_admin=usuario_admin, nombre=nombre)
+        for reserva in reservas:
+            reserva.grupo = grupo
+        Reserva.objects.bulk_create(reservas)
+        try:
+            # Una reserva concurrente pudo tomar alguna noche después de validar
+            with transaction.atomic():
+                NocheHabitacion.objects.bulk_create([
+                    NocheHabitacion(habitacion_id=reserva.codigo_habitacion_id, fecha=fecha, reserva=reserva)
+                    for reserva in reservas for fecha in fechas
+                ])
+        except IntegrityError:
+            raise GrupoInvalido(MENSAJE_SOLAPAMIENTO)
+        registrar_cambios(reserva.codigo_habitacion_id for reserva in reservas)
+        HistorialReserva.objects.bulk_create([
+            HistorialReserva(huesped=usuario, reserva=reserva) for reserva in reservas
+        ])
+        cuenta = CuentaCobrar.objects.create(
+            codigo_reserva=reservas[0],
+            grupo=grupo,
+            dni_huesped=usuario,
+            monto_total=sum(reserva.total_pagar for reserva in reservas),
+            fecha_vencimiento=timezone.localdate() + timedelta(days=DIAS_VENCIMIENTO),
+            estado='PENDIENTE',
+        )
+        transaction.on_commit(
+            lambda: transicion_reserva.send(sender=Reserva, transicion='crear', reservas=reservas)
+        )
+    return grupo, reservas, cuenta
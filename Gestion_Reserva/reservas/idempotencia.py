@@ -0,0 +1,148 @@
+"""
+Soporte de la cabecera ``Idempotency-Key`` en los endpoints que crean reservas.
+
+Un cliente que reintenta un POST con la misma clave recibe la respuesta
+guardada de la primera ejecución, sin volver a validar ni escribir nada.
+
+1. Antes de ejecutar la vista se inserta la clave sin respuesta. La
+   restricción única (usuario, clave) actúa de lock: solo una petición la
+   obtiene.
+2. Un duplicado que llega mientras la primera sigue en curso recibe 409 con
+   ``Retry-After`` en el acto, sin ocupar un worker esperando. Al reintentar
+   obtiene la respuesta guardada.
+3. Si la misma clave llega con otro cuerpo, la respuesta es 422.
+4. La vista y el guardado de su respuesta van en una sola transacción: lo
+   que la vista escribe se confirma junto con la respuesta o no se confirma.
+   Las respuestas 5xx y las excepciones deshacen la transacción y liberan la
+   clave para que el cliente pueda reintentar.
+5. Si el proceso muere con la petición en curso (OOM, deploy), la clave
+   queda sin respuesta y sin nada escrito. Pasados
+   ``IDEMPOTENCIA_RECLAMO_SEGUNDOS`` desde ``reclamada_en``, un reintento con
+   el mismo cuerpo la retoma con un ``UPDATE`` condicional (solo uno lo
+   consigue) y ejecuta la vista. Si la petición original seguía viva, al
+   terminar ya no es dueña del reclamo: deshace lo suyo y responde 409, así
+   nunca se confirman dos ejecuciones de la misma clave.
+
+Las claves vencen a las ``IDEMPOTENCIA_TTL_HORAS`` y se purgan poco a poco
+al insertar nuevas.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import ClaveIdempotencia
+
+CABECERA = 'Idempotency-Key'
+LOTE_PURGA = 100
+
+
+def _hash(request):
+    cuerpo = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{cuerpo}'.encode()).hexdigest()
+
+
+def _reservar(usuario, clave, hash_peticion):
+    """Inserta la clave. Devuelve (reclamada_en, None) si se obtuvo, o
+    (None, fila existente)."""
+    ahora = timezone.now()
+    expira = ahora + timedelta(hours=getattr(settings, 'IDEMPOTENCIA_TTL_HORAS', 24))
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                fila = ClaveIdempotencia.objects.create(
+                    usuario=usuario, clave=clave, hash_peticion=hash_peticion, expira=expira
+                )
+        except IntegrityError:
+            existente = ClaveIdempotencia.objects.filter(usuario=usuario, clave=clave).first()
+            if existente is None:
+                continue  # Se eliminó entre medio
+            if existente.expira <= ahora:
+                existente.delete()
+                continue
+            if _retomar(existente, hash_peticion, ahora, expira):
+                return ahora, None
+            return None, existente
+        if fila.pk % LOTE_PURGA == 0:
+            ClaveIdempotencia.objects.filter(expira__lte=ahora).delete()
+        return fila.reclamada_en, None
+    return None, ClaveIdempotencia.objects.get(usuario=usuario, clave=clave)
+
+
+def _retomar(fila, hash_peticion, ahora, expira):
+    """Toma una clave en curso cuyo reclamo venció. Devuelve True si se obtuvo."""
+    plazo = timedelta(seconds=getattr(settings, 'IDEMPOTENCIA_RECLAMO_SEGUNDOS', 60))
+    if fila.estado_http is not None or fila.hash_peticion != hash_peticion or fila.reclamada_en > ahora - plazo:
+        return False
+    return bool(ClaveIdempotencia.objects.filter(
+        pk=fila.pk, estado_http__isnull=True, reclamada_en=fila.reclamada_en,
+    ).update(reclamada_en=ahora, expira=expira))
+
+
+def _repetir(fila):
+    respuesta = Response(fila.respuesta, status=fila.estado_http)
+    respuesta['Idempotent-Replayed'] = 'true'
+    return respuesta
+
+
+def _en_curso():
+    respuesta = Response({"error": "Una petición con esta clave sigue en proceso"},
+                         status=status.HTTP_409_CONFLICT)
+    respuesta['Retry-After'] = '1'
+    return respuesta
+
+
+def idempotente(vista):
+    """Decorador para vistas de DRF (debajo de ``@api_view``)."""
+    @functools.wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        clave = request.headers.get(CABECERA)
+        if not clave:
+            return vista(request, *args, **kwargs)
+        if len(clave) > 255:
+            return Response({"error": f"La cabecera {CABECERA} es demasiado larga"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        hash_peticion = _hash(request)
+        reclamo, existente = _reservar(request.user, clave, hash_peticion)
+        if existente is not None:
+            if existente.hash_peticion != hash_peticion:
+                return Response(
+                    {"error": f"La {CABECERA} ya se usó con otra petición"},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            if existente.estado_http is None:
+                return _en_curso()
+            return _repetir(existente)
+
+        # Solo guarda la respuesta quien sigue siendo dueño del reclamo
+        propia = ClaveIdempotencia.objects.filter(
+            usuario=request.user, clave=clave, reclamada_en=reclamo, estado_http__isnull=True,
+        )
+        try:
+            with transaction.atomic():
+                respuesta = vista(request, *args, **kwargs)
+                if respuesta.status_code >= 500 or not hasattr(respuesta, 'data'):
+                    transaction.set_rollback(True)
+                # Se guarda el JSON tal como se envió para que la repetición sea idéntica
+                elif not propia.update(
+                    estado_http=respuesta.status_code,
+                    respuesta=json.loads(JSONRenderer().render(respuesta.data)),
+                ):
+                    # Otra petición retomó la clave: lo escrito aquí no se confirma
+                    transaction.set_rollback(True)
+                    return _en_curso()
+        except Exception:
+            propia.delete()
+            raise
+        if respuesta.status_code >= 500 or not hasattr(respuesta, 'data'):
+            propia.delete()
+        return respuesta
+    return envoltura
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from reservas.models import Reserva
+
+CAMPOS = ['total_noches', 'subtotal', 'total_pagar']
+
+
+class Command(BaseCommand):
+    help = "Recalcula total_noches, subtotal y total_pagar de las reservas guardadas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help="Reservas por transacción")
+
+    def handle(self, *args, lote, **options):
+        ultimo = 0
+        actualizadas = 0
+        columnas = [
+            'id', 'fecha_checkin_programado', 'fecha_checkout_programado',
+            'precio_noche', 'descuento_aplicado', 'impuestos', *CAMPOS,
+        ]
+        while True:
+            reservas = list(Reserva.objects.filter(pk__gt=ultimo).order_by('pk').only(*columnas)[:lote])
+            if not reservas:
+                break
+            cambiadas = []
+            for reserva in reservas:
+                anterior = tuple(getattr(reserva, c) for c in CAMPOS)
+                reserva.calcular_montos()
+                if tuple(getattr(reserva, c) for c in CAMPOS) != anterior:
+                    cambiadas.append(reserva)
+            with transaction.atomic():
+                Reserva.objects.bulk_update(cambiadas, CAMPOS)
+            actualizadas += len(cambiadas)
+            ultimo = reservas[-1].pk
+        self.stdout.write(self.style.SUCCESS(f"Reservas actualizadas: {actualizadas}"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from reservas.vencimiento import TAMANO_LOTE, barrer
+
+
+class Command(BaseCommand):
+    help = "Cancela las reservas pendientes cuya cuenta por cobrar venció sin pago y libera sus noches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help="Cuentas por transacción")
+
+    def handle(self, *args, lote, **options):
+        resultado = barrer(lote=lote)
+        self.stdout.write(self.style.SUCCESS(f"Barrido terminado: {resultado}"))
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:08
+
+import django.db.models.deletion
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+MAX_SOLAPAMIENTOS = 20
+
+
+def registrar_noches(apps, schema_editor):
+    """Registra las noches de las reservas activas existentes. Si ya había
+    reservas solapadas la migración falla y las lista: hay que cancelarlas o
+    moverlas de habitación antes de migrar, no se descarta ninguna noche."""
+    Reserva = apps.get_model('reservas', 'Reserva')
+    NocheHabitacion = apps.get_model('reservas', 'NocheHabitacion')
+    activas = Reserva.objects.filter(
+        id_estado_reserva__nombre__in=['Pendiente', 'Confirmada']
+    ).order_by('id').values_list('id', 'codigo_habitacion_id', 'fecha_checkin_programado', 'fecha_checkout_programado')
+    ocupadas = {}       # (habitación, fecha) -> reserva
+    solapamientos = []
+    filas = []
+    for reserva_id, codigo, checkin, checkout in activas.iterator(chunk_size=1000):
+        desde = timezone.localdate(checkin)
+        hasta = max(timezone.localdate(checkout), desde + timedelta(days=1))
+        for i in range((hasta - desde).days):
+            fecha = desde + timedelta(days=i)
+            anterior = ocupadas.setdefault((codigo, fecha), reserva_id)
+            if anterior != reserva_id:
+                solapamientos.append(f'{codigo} {fecha}: reservas {anterior} y {reserva_id}')
+                continue
+            filas.append(NocheHabitacion(habitacion_id=codigo, fecha=fecha, reserva_id=reserva_id))
+        if len(filas) >= 1000 and not solapamientos:
+            NocheHabitacion.objects.bulk_create(filas)
+            filas = []
+    if solapamientos:
+        detalle = '\n'.join(solapamientos[:MAX_SOLAPAMIENTOS])
+        if len(solapamientos) > MAX_SOLAPAMIENTOS:
+            detalle += f'\n... y {len(solapamientos) - MAX_SOLAPAMIENTOS} noches más'
+        raise RuntimeError(
+            f'Hay {len(solapamientos)} noches con reservas activas solapadas. Cancela o mueve '
+            f'de habitación una de cada par y vuelve a migrar:\n{detalle}'
+        )
+    NocheHabitacion.objects.bulk_create(filas)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habitaciones', '0002_evento_habitacion'),
+        ('reservas', '0006_reserva_pago'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NocheHabitacion',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('fecha', models.DateField()),
+                ('habitacion', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='noches', to='habitaciones.habitacion')),
+                ('reserva', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='noches', to='reservas.reserva')),
+            ],
+            options={
+                'db_table': 'noche_habitacion',
+                'indexes': [models.Index(fields=['fecha'], name='idx_noche_fecha')],
+                'constraints': [models.UniqueConstraint(fields=('habitacion', 'fecha'), name='uniq_noche_habitacion')],
+            },
+        ),
+        migrations.RunPython(registrar_noches, migrations.RunPython.noop),
+    ]
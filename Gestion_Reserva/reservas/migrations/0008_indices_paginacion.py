@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habitaciones', '0002_evento_habitacion'),
+        ('reservas', '0007_noche_habitacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['fecha_reserva', 'id'], name='idx_reserva_fecha_id'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['fecha_checkin_programado', 'id'], name='idx_reserva_checkin_id'),
+        ),
+    ]
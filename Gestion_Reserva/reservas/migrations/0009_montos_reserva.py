@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0008_indices_paginacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reserva',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='reserva',
+            name='total_noches',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='reserva',
+            name='total_pagar',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+    ]
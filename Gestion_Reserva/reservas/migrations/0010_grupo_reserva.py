@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0009_montos_reserva'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GrupoReserva',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('nombre', models.CharField(blank=True, max_length=100, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='grupos_reserva', to=settings.AUTH_USER_MODEL)),
+                ('usuario_admin', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='grupos_administrados', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'grupo_reserva',
+            },
+        ),
+        migrations.AddField(
+            model_name='reserva',
+            name='grupo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='reservas', to='reservas.gruporeserva'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0010_grupo_reserva'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('clave', models.CharField(max_length=255)),
+                ('hash_peticion', models.CharField(max_length=64)),
+                ('estado_http', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('respuesta', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expira', models.DateTimeField()),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'clave_idempotencia',
+                'indexes': [models.Index(fields=['expira'], name='idx_idempotencia_expira')],
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'clave'), name='uniq_clave_idempotencia')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:17
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0011_clave_idempotencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='claveidempotencia',
+            name='reclamada_en',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
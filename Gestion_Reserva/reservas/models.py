@@ -1,12 +1,38 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.conf import settings
+from django.utils import timezone
 from decimal import Decimal
 
 from habitaciones.models import Habitacion  # Importar desde habitaciones
 from usuarios.models import Usuario  # Importar desde usuarios
 from personal.models import Administrador  # Importar desde personal
 
+CENTIMOS = Decimal('0.01')
+
+def fecha_local(valor):
+    """Fecha en la zona horaria del hotel (TIME_ZONE) de un datetime."""
+    return timezone.localdate(valor) if timezone.is_aware(valor) else valor.date()
+
+def calcular_noches(checkin, checkout):
+    """Noches cobradas entre dos fechas locales (mínimo una). Coincide con las
+    filas de NocheHabitacion que ocupa la reserva. Antes se contaban sobre las
+    fechas UTC: un check-in por la noche (hora de Lima) cae al día siguiente en
+    UTC y cobraba una noche menos; al volver a guardar esas reservas, o con
+    ``recalcular_montos_reservas``, sus totales pasan a las fechas locales."""
+    return max((fecha_local(checkout) - fecha_local(checkin)).days, 1)
+
+def calcular_descuento(usuario, subtotal):
+    """Descuento por fidelidad según el nivel del huésped (ver usuarios.fidelidad)."""
+    from usuarios.fidelidad import nivel
+    return (subtotal * nivel(usuario.pk).descuento).quantize(CENTIMOS)
+
+# Cambios que obligan a recalcular los montos guardados
+CAMPOS_MONTOS = {
+    'fecha_checkin_programado', 'fecha_checkout_programado',
+    'precio_noche', 'descuento_aplicado', 'impuestos',
+}
+
 class TipoReserva(models.Model):
     id_tipo_reserva = models.AutoField(primary_key=True)
     nombre = models.CharField(max_length=30, unique=True)
@@ -31,6 +57,21 @@ class EstadoReserva(models.Model):
     class Meta:
         db_table = 'estado_reserva'
 
+class GrupoReserva(models.Model):
+    """Reservas de varias habitaciones hechas en una sola operación (por ejemplo,
+    un operador turístico). Comparten fechas y una cuenta por cobrar."""
+    id = models.AutoField(primary_key=True)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name='grupos_reserva')
+    usuario_admin = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, null=True, blank=True, related_name='grupos_administrados')
+    nombre = models.CharField(max_length=100, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Grupo #{self.id}"
+
+    class Meta:
+        db_table = 'grupo_reserva'
+
 class Reserva(models.Model):
     id = models.AutoField(primary_key=True)
     usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
@@ -38,6 +79,7 @@ class Reserva(models.Model):
     usuario_admin = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, null=True, blank=True, related_name='reservas_administradas')
     id_tipo_reserva = models.ForeignKey(TipoReserva, on_delete=models.PROTECT)
     id_estado_reserva = models.ForeignKey(EstadoReserva, on_delete=models.PROTECT, default=1)
+    grupo = models.ForeignKey(GrupoReserva, on_delete=models.PROTECT, null=True, blank=True, related_name='reservas')
     
     # Fechas y tiempos
     fecha_reserva = models.DateTimeField(auto_now_add=True)
@@ -60,25 +102,25 @@ class Reserva(models.Model):
     ]
     pago = models.CharField(max_length=20, choices=TIPO_PAGO_CHOICES, default='efectivo')
 
-    # Campos calculados (se gestionarán a nivel de aplicación)
+    # Campos calculados: se guardan para poder agregarlos en la base de datos
+    # (ver calcular_montos y reservas.reportes)
+    total_noches = models.PositiveIntegerField(default=0, editable=False)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    total_pagar = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
 
     @property
     def descuento(self):
         # Ahora retorna el descuento fijo guardado
         return self.descuento_aplicado
-    
-    @property
-    def total_noches(self):
-        noches = (self.fecha_checkout_programado.date() - self.fecha_checkin_programado.date()).days
-        return max(noches, 1)
-    
-    @property
-    def subtotal(self):
-        return Decimal(self.precio_noche) * self.total_noches
 
-    @property
-    def total_pagar(self):
-        return self.subtotal - Decimal(self.descuento_aplicado) + Decimal(self.impuestos)
+    def calcular_montos(self):
+        """Actualiza total_noches, subtotal y total_pagar a partir de las fechas,
+        el precio, el descuento y los impuestos."""
+        self.total_noches = calcular_noches(self.fecha_checkin_programado, self.fecha_checkout_programado)
+        self.subtotal = (Decimal(self.precio_noche) * self.total_noches).quantize(CENTIMOS)
+        self.total_pagar = (
+            self.subtotal - Decimal(self.descuento_aplicado) + Decimal(self.impuestos)
+        ).quantize(CENTIMOS)
     
     # Información adicional
     observaciones = models.TextField(blank=True, null=True)
@@ -95,107 +137,66 @@ class Reserva(models.Model):
     def __str__(self):
         return f"Reserva #{self.id}"
 
+    # Campos de los que dependen las noches ocupadas (NocheHabitacion)
+    CAMPOS_OCUPACION = (
+        'codigo_habitacion_id', 'id_estado_reserva_id',
+        'fecha_checkin_programado', 'fecha_checkout_programado', 'fecha_checkout_real',
+    )
+
+    def _datos_ocupacion(self):
+        return tuple(getattr(self, campo) for campo in self.CAMPOS_OCUPACION)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Con campos diferidos (only/defer) no se registra: el próximo save sincroniza
+        if all(campo in field_names for campo in cls.CAMPOS_OCUPACION):
+            instance._ocupacion_guardada = instance._datos_ocupacion()
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Las noches ocupadas (NocheHabitacion) se escriben en la misma transacción
+        from .ocupacion import sincronizar
+        nueva = self._state.adding
+        self.calcular_montos()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & CAMPOS_MONTOS:
+            kwargs['update_fields'] = set(update_fields) | {'total_noches', 'subtotal', 'total_pagar'}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            datos = self._datos_ocupacion()
+            if datos != getattr(self, '_ocupacion_guardada', None):
+                sincronizar(self, nueva=nueva)
+        self._ocupacion_guardada = datos
+
+    # Las transiciones de estado se implementan en reservas.transiciones
+
     def cancelar(self, motivo=None):
-        from reservas.models import EstadoReserva
-        from habitaciones.models import EstadoHabitacion
-        from django.utils import timezone
-
-        if self.id_estado_reserva.pk == 1:  # Pendiente
-            pass  # Se puede cancelar
-        elif self.id_estado_reserva.pk == 2 and self.codigo_habitacion.id_estado.pk == 3:  # Confirmada y Reservada
-            pass  # Se puede cancelar
-        else:
-            raise ValueError("Solo se pueden cancelar reservas pendientes o confirmadas con habitación reservada.")
-
-        estado_cancelada = EstadoReserva.objects.get(pk=3)  # Cancelada
-        self.id_estado_reserva = estado_cancelada
-        if motivo:
-            self.motivo_cancelacion = motivo
-
-        # Si la habitación estaba reservada, la marcamos como disponible
-        if self.codigo_habitacion.id_estado.pk == 3:  # Reservada
-            estado_disponible = EstadoHabitacion.objects.get(pk=1)  # Disponible
-            self.codigo_habitacion.id_estado = estado_disponible
-            self.codigo_habitacion.save()
-
-        self.save()
+        """Cancela la reserva (pendiente, o confirmada con habitación reservada) y libera la habitación"""
+        from .transiciones import cancelar
+        cancelar(self, motivo=motivo)
 
     def check_in(self):
         """Realiza el check-in: cambia habitación a Ocupada y registra fecha real"""
-        from habitaciones.models import EstadoHabitacion
-        from django.utils import timezone
-        
-        # Solo permitir check-in si la reserva está confirmada
-        if self.id_estado_reserva.pk != 2:  # No está confirmada
-            raise ValueError("Solo se puede hacer check-in de reservas confirmadas")
-        
-        estado_ocupada = EstadoHabitacion.objects.get(pk=2)  # Ocupada
-        self.codigo_habitacion.id_estado = estado_ocupada
-        self.codigo_habitacion.save()
-        
-        self.fecha_checkin_real = timezone.now()
-        self.save()
+        from .transiciones import check_in
+        check_in(self)
 
     def check_out(self):
         """Realiza el check-out: cambia habitación a Limpieza y reserva a Finalizada"""
-        from habitaciones.models import EstadoHabitacion
-        from reservas.models import EstadoReserva
-        from django.utils import timezone
-        
-        # Solo permitir check-out si hay check-in registrado
-        if not self.fecha_checkin_real:
-            raise ValueError("No se puede hacer check-out sin check-in previo")
-        
-        estado_limpieza = EstadoHabitacion.objects.get(pk=5)  # Limpieza
-        estado_finalizada = EstadoReserva.objects.get(pk=4)  # Finalizada
-        
-        self.codigo_habitacion.id_estado = estado_limpieza
-        self.codigo_habitacion.save()
-        
-        self.id_estado_reserva = estado_finalizada
-        self.fecha_checkout_real = timezone.now()
-        self.save()
+        from .transiciones import check_out
+        check_out(self)
 
     def confirmar(self):
-        from reservas.models import EstadoReserva
-        from habitaciones.models import EstadoHabitacion
-        from django.db.models import Q
-
-        if self.id_estado_reserva.pk != 1:  # No está pendiente
-            raise ValueError("Solo se pueden confirmar reservas pendientes")
-
-        # Validar solapamiento de reservas confirmadas u ocupadas
-        solapada = Reserva.objects.filter(
-            codigo_habitacion=self.codigo_habitacion,
-            id_estado_reserva__nombre__in=['Confirmada', 'Ocupada'],
-            fecha_checkin_programado__lt=self.fecha_checkout_programado,
-            fecha_checkout_programado__gt=self.fecha_checkin_programado
-        ).exclude(pk=self.pk).exists()
-        if solapada:
-            raise ValueError("Ya existe una reserva confirmada u ocupada para esta habitación en el rango de fechas seleccionado.")
-
-        estado_confirmada = EstadoReserva.objects.get(pk=2)  # Confirmada
-        estado_reservada = EstadoHabitacion.objects.get(pk=3)  # Reservada
-
-        self.id_estado_reserva = estado_confirmada
-        self.codigo_habitacion.id_estado = estado_reservada
-        self.codigo_habitacion.save()
-        self.save()
-
-        if hasattr(self.usuario, 'rol') and self.usuario.rol == 'HUESPED':
-            self.usuario.total_visitas = getattr(self.usuario, 'total_visitas', 0) + 1
-            self.usuario.save()
+        """Confirma una reserva pendiente si no se solapa con otra confirmada u ocupada"""
+        from .transiciones import confirmar
+        confirmar(self)
 
     def finalizar_limpieza(self):
         """Marca la habitación como disponible después de la limpieza"""
-        from habitaciones.models import EstadoHabitacion
-        from django.utils import timezone
-        
-        if self.codigo_habitacion.id_estado.pk == 5:  # En limpieza
-            estado_disponible = EstadoHabitacion.objects.get(pk=1)  # Disponible
-            self.codigo_habitacion.id_estado = estado_disponible
-            self.codigo_habitacion.fecha_ultima_limpieza = timezone.now()
-            self.codigo_habitacion.save()
+        from .transiciones import finalizar_limpieza
+        habitacion = finalizar_limpieza(self.codigo_habitacion_id)
+        if habitacion is not None:
+            self.codigo_habitacion = habitacion
 
     class Meta:
         db_table = 'reserva'
@@ -206,6 +207,9 @@ class Reserva(models.Model):
             models.Index(fields=['fecha_checkin_programado', 'fecha_checkout_programado'], name='idx_reserva_fechas'),
             models.Index(fields=['id_estado_reserva'], name='idx_reserva_estado'),
             models.Index(fields=['id_tipo_reserva'], name='idx_reserva_tipo'),
+            # Paginación por cursor de los listados
+            models.Index(fields=['fecha_reserva', 'id'], name='idx_reserva_fecha_id'),
+            models.Index(fields=['fecha_checkin_programado', 'id'], name='idx_reserva_checkin_id'),
         ]
         constraints = [
             models.CheckConstraint(
@@ -218,6 +222,26 @@ class Reserva(models.Model):
             ),
         ]
 
+class NocheHabitacion(models.Model):
+    """Una noche ocupada de una habitación. La restricción única impide que dos
+    reservas activas compartan una noche (ver reservas.ocupacion)."""
+    id = models.BigAutoField(primary_key=True)
+    habitacion = models.ForeignKey(Habitacion, on_delete=models.PROTECT, related_name='noches')
+    fecha = models.DateField()
+    reserva = models.ForeignKey(Reserva, on_delete=models.CASCADE, related_name='noches')
+
+    class Meta:
+        db_table = 'noche_habitacion'
+        indexes = [
+            models.Index(fields=['fecha'], name='idx_noche_fecha'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['habitacion', 'fecha'], name='uniq_noche_habitacion'),
+        ]
+
+    def __str__(self):
+        return f"{self.habitacion_id} - {self.fecha}"
+
 class HistorialReserva(models.Model):
     huesped = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='historial_reservas')  # Solo usuarios con rol HUESPED
     reserva = models.ForeignKey(Reserva, on_delete=models.CASCADE, related_name='historiales')
@@ -230,3 +254,30 @@ class HistorialReserva(models.Model):
 
     def __str__(self):
         return f"Historial de {self.huesped} - Reserva {self.reserva.id}"
+
+
+class ClaveIdempotencia(models.Model):
+    """Respuesta guardada de una petición con cabecera Idempotency-Key
+    (ver reservas.idempotencia). Sin estado_http la petición sigue en curso."""
+    id = models.BigAutoField(primary_key=True)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    clave = models.CharField(max_length=255)
+    hash_peticion = models.CharField(max_length=64)
+    estado_http = models.PositiveSmallIntegerField(null=True, blank=True)
+    respuesta = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Inicio del reclamo de la petición en curso; vencido, otra petición puede retomarla
+    reclamada_en = models.DateTimeField(default=timezone.now)
+    expira = models.DateTimeField()
+
+    class Meta:
+        db_table = 'clave_idempotencia'
+        indexes = [
+            models.Index(fields=['expira'], name='idx_idempotencia_expira'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'clave'], name='uniq_clave_idempotencia'),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario_id} - {self.clave}"
@@ -0,0 +1,103 @@
+"""
+Ocupación de habitaciones por noche.
+
+Cada reserva activa (Pendiente o Confirmada) ocupa una fila de
+``NocheHabitacion`` por noche, y la tabla tiene una restricción única
+(habitacion, fecha). Las filas se escriben en la misma transacción que la
+reserva, de modo que la base de datos rechaza una reserva solapada aunque dos
+peticiones lleguen a la vez, con una búsqueda en el índice por noche.
+
+Las noches son fechas locales (``TIME_ZONE``): la noche del día D va del
+check-in de D al check-out de D + 1. Al cancelar se liberan todas; al hacer
+check-out se liberan las que quedaban por delante y se conservan las usadas,
+para los reportes de ocupación.
+
+Cada escritura de noches registra las habitaciones afectadas con
+``registrar_cambios`` en la misma transacción, para que el índice de
+disponibilidad de cada proceso recargue solo esas habitaciones.
+"""
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+
+from habitaciones.catalogos import estados_reserva
+from habitaciones.disponibilidad import registrar_cambios
+from .models import NocheHabitacion, fecha_local
+
+ESTADOS_CON_NOCHES = ('Pendiente', 'Confirmada')
+MENSAJE_SOLAPAMIENTO = "La habitación ya está reservada para alguna de las noches seleccionadas."
+
+
+def rango_noches(checkin, checkout):
+    """Devuelve (primera noche, día siguiente a la última). Siempre al menos una noche."""
+    desde = fecha_local(checkin)
+    hasta = max(fecha_local(checkout), desde + timedelta(days=1))
+    return desde, hasta
+
+
+def noches(checkin, checkout):
+    desde, hasta = rango_noches(checkin, checkout)
+    return [desde + timedelta(days=i) for i in range((hasta - desde).days)]
+
+
+def _ocupa_noches(reserva):
+    return reserva.id_estado_reserva_id in {
+        estados_reserva.por_nombre(nombre).pk for nombre in ESTADOS_CON_NOCHES
+    }
+
+
+def ocupar(reserva):
+    """Registra las noches de la reserva. Lanza ValueError si alguna ya está ocupada."""
+    filas = [
+        NocheHabitacion(habitacion_id=reserva.codigo_habitacion_id, fecha=fecha, reserva=reserva)
+        for fecha in noches(reserva.fecha_checkin_programado, reserva.fecha_checkout_programado)
+    ]
+    try:
+        with transaction.atomic():
+            NocheHabitacion.objects.bulk_create(filas)
+    except IntegrityError:
+        raise ValueError(MENSAJE_SOLAPAMIENTO)
+    registrar_cambios([reserva.codigo_habitacion_id])
+
+
+def liberar(reserva, desde=None):
+    """Elimina las noches de la reserva, todas o a partir de la fecha ``desde``."""
+    filas = NocheHabitacion.objects.filter(reserva=reserva)
+    if desde is not None:
+        filas = filas.filter(fecha__gte=desde)
+    filas.delete()
+    registrar_cambios([reserva.codigo_habitacion_id])
+
+
+def sincronizar(reserva, nueva=False):
+    """Ajusta las noches al estado y las fechas actuales de la reserva."""
+    if not nueva:
+        anterior = getattr(reserva, '_ocupacion_guardada', None)
+        if anterior is None:
+            # Sin los datos guardados no se sabe si cambió de habitación
+            registrar_cambios(NocheHabitacion.objects.filter(reserva=reserva).values_list('habitacion_id', flat=True))
+        elif anterior[0] != reserva.codigo_habitacion_id:
+            registrar_cambios([anterior[0]])
+    if _ocupa_noches(reserva):
+        if not nueva:
+            liberar(reserva)
+        ocupar(reserva)
+    elif reserva.fecha_checkout_real and reserva.id_estado_reserva_id == estados_reserva.por_nombre('Finalizada').pk:
+        liberar(reserva, desde=fecha_local(reserva.fecha_checkout_real))
+    elif not nueva:
+        liberar(reserva)
+
+
+def habitaciones_ocupadas(checkin, checkout):
+    """Subconsulta con los códigos de habitación que tienen alguna noche ocupada en el rango."""
+    desde, hasta = rango_noches(checkin, checkout)
+    return NocheHabitacion.objects.filter(fecha__gte=desde, fecha__lt=hasta).values('habitacion_id')
+
+
+def ocupacion_por_fecha(desde, hasta):
+    """Habitaciones ocupadas por noche en [desde, hasta)."""
+    return (
+        NocheHabitacion.objects.filter(fecha__gte=desde, fecha__lt=hasta)
+        .values('fecha').annotate(habitaciones=Count('id')).order_by('fecha')
+    )
@@ -0,0 +1,68 @@
+"""
+Paginación por cursor (keyset) para los listados de reservas.
+
+El orden es descendente por (campo, id) y el cursor codifica la última fila
+entregada, así que cada página es una sola consulta que usa el índice, sin
+OFFSET: pedir la página 1000 cuesta lo mismo que pedir la primera.
+
+Es opcional: sin ``cursor`` ni ``page_size`` en la petición los listados
+responden la lista completa, como antes.
+"""
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.urls import replace_query_param
+
+TAMANO_PAGINA = 50
+TAMANO_MAXIMO = 200
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def _codificar(valor, pk):
+    datos = json.dumps([valor.isoformat(), pk])
+    return base64.urlsafe_b64encode(datos.encode()).decode()
+
+
+def _decodificar(cursor):
+    try:
+        valor, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        fecha = parse_datetime(valor)
+        if fecha is None:
+            raise ValueError
+        return fecha, int(pk)
+    except (TypeError, ValueError):
+        raise CursorInvalido("Cursor inválido")
+
+
+def solicita_pagina(request):
+    return 'cursor' in request.query_params or 'page_size' in request.query_params
+
+
+def paginar(request, queryset, campo):
+    """Devuelve (filas de la página, url de la siguiente página o None)."""
+    try:
+        tamano = min(int(request.query_params.get('page_size', TAMANO_PAGINA)), TAMANO_MAXIMO)
+    except ValueError:
+        tamano = TAMANO_PAGINA
+    tamano = max(tamano, 1)
+
+    queryset = queryset.order_by(f'-{campo}', '-id')
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        valor, pk = _decodificar(cursor)
+        queryset = queryset.filter(Q(**{f'{campo}__lt': valor}) | Q(**{campo: valor, 'id__lt': pk}))
+
+    filas = list(queryset[:tamano + 1])
+    siguiente = None
+    if len(filas) > tamano:
+        filas = filas[:tamano]
+        ultima = filas[-1]
+        siguiente = replace_query_param(
+            request.build_absolute_uri(), 'cursor', _codificar(getattr(ultima, campo), ultima.pk)
+        )
+    return filas, siguiente
@@ -0,0 +1,125 @@
+"""
+Registro de hospedajes presenciales (walk-in) en recepción.
+
+Un solo servicio para las dos variantes: con check-in inmediato o dejando la
+reserva Pendiente. Todo ocurre en una transacción y con un número fijo de
+consultas, sin importar si el huésped ya existía:
+
+1. ``get_or_create`` del huésped (la contraseña inicial, su DNI, solo se
+   calcula si hay que crearlo).
+2. El administrador, solo si se indica ``dni_admin``.
+3. La habitación, bloqueada como en las transiciones (ver
+   ``reservas.transiciones``); su estado y capacidad salen de los catálogos.
+4. La reserva, insertada ya en su estado final junto con sus noches.
+5. Con check-in: el estado de la habitación y la visita del huésped
+   (``usuarios.fidelidad.registrar_visita``).
+"""
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from habitaciones.catalogos import estados_habitacion, estados_reserva, tipos_habitacion, tipos_reserva
+from habitaciones.models import Habitacion
+from usuarios import fidelidad
+from usuarios.models import Usuario
+from .models import Reserva, calcular_descuento, calcular_noches
+from .transiciones import _bloquear_habitacion, _cambiar_habitacion
+
+ESTADOS_NO_RESERVABLES = ('Ocupada', 'Reservada', 'Limpieza')
+
+
+class HospedajeInvalido(ValueError):
+    """La solicitud de hospedaje presencial no se puede registrar."""
+
+
+def _huesped(dni, nombres, apellidos):
+    usuario, creado = Usuario.objects.get_or_create(dni=dni, defaults={
+        'nombres': nombres,
+        'apellidos': apellidos,
+        'rol': 'HUESPED',
+        'password': lambda: make_password(dni),
+        'change_password': True,
+    })
+    if creado and not (nombres and apellidos):
+        raise HospedajeInvalido('Se requieren nombres y apellidos para registrar un huésped nuevo.')
+    if usuario.rol != 'HUESPED':
+        raise HospedajeInvalido('El usuario debe tener rol HUESPED.')
+    return usuario
+
+
+def _administrador(recepcionista, dni_admin):
+    if not dni_admin:
+        if recepcionista.rol != 'ADMIN':
+            raise HospedajeInvalido('El usuario_admin debe tener rol ADMIN.')
+        return recepcionista
+    try:
+        return Usuario.objects.get(dni=dni_admin, rol='ADMIN')
+    except Usuario.DoesNotExist:
+        raise HospedajeInvalido('Administrador no encontrado.')
+
+
+def _habitacion(codigo, numero_huespedes):
+    try:
+        habitacion = _bloquear_habitacion(codigo)
+    except Habitacion.DoesNotExist:
+        raise HospedajeInvalido('Habitación no encontrada.')
+    estado = estados_habitacion.get(habitacion.id_estado_id).nombre
+    if estado in ESTADOS_NO_RESERVABLES:
+        raise HospedajeInvalido(f"No puedes reservar una habitación que está actualmente en estado '{estado}'.")
+    capacidad = tipos_habitacion.get(habitacion.id_tipo_id).capacidad_maxima
+    if numero_huespedes > capacidad:
+        raise HospedajeInvalido(
+            f'El número de huéspedes ({numero_huespedes}) supera la capacidad máxima de la habitación ({capacidad}).'
+        )
+    return habitacion
+
+
+def registrar(recepcionista, datos, checkin_inmediato=True):
+    """Registra el hospedaje con los datos validados por
+    ``HospedajePresencialSerializer``. Devuelve (usuario, reserva).
+
+    Con ``checkin_inmediato`` la reserva queda Confirmada con check-in hecho y
+    la habitación Ocupada; si no, queda Pendiente y la habitación no cambia.
+    Lanza HospedajeInvalido si algo impide el registro (no se guarda nada).
+    """
+    ahora = timezone.now()
+    fecha_checkin = datos.get('fecha_checkin_programado')
+    fecha_checkout = datos.get('fecha_checkout_programado')
+    if checkin_inmediato or not (fecha_checkin and fecha_checkout):
+        fecha_checkin = ahora
+        fecha_checkout = ahora + timedelta(days=datos['dias'])
+    if fecha_checkout <= fecha_checkin:
+        raise HospedajeInvalido('La fecha de check-out debe ser posterior a la de check-in.')
+
+    with transaction.atomic():
+        usuario = _huesped(datos['dni'], datos.get('nombres'), datos.get('apellidos'))
+        usuario_admin = _administrador(recepcionista, datos.get('dni_admin'))
+        habitacion = _habitacion(datos['habitacion_id'], datos['numero_huespedes'])
+
+        subtotal = habitacion.precio_actual * calcular_noches(fecha_checkin, fecha_checkout)
+        reserva = Reserva(
+            usuario=usuario,
+            usuario_admin=usuario_admin,
+            codigo_habitacion=habitacion,
+            id_tipo_reserva=tipos_reserva.por_nombre('Presencial'),
+            id_estado_reserva=estados_reserva.por_nombre('Confirmada' if checkin_inmediato else 'Pendiente'),
+            fecha_checkin_programado=fecha_checkin,
+            fecha_checkout_programado=fecha_checkout,
+            fecha_checkin_real=ahora if checkin_inmediato else None,
+            numero_huespedes=datos['numero_huespedes'],
+            precio_noche=habitacion.precio_actual,
+            descuento_aplicado=calcular_descuento(usuario, subtotal),
+            pago=datos['pago'],
+        )
+        try:
+            reserva.save()
+        except ValueError as e:
+            # Otra reserva ocupa alguna de las noches (restricción de NocheHabitacion)
+            raise HospedajeInvalido(str(e))
+
+        if checkin_inmediato:
+            _cambiar_habitacion(habitacion, 'Ocupada')
+            fidelidad.registrar_visita(usuario)
+    return usuario, reserva
@@ -0,0 +1,62 @@
+"""
+Reportes de ingresos calculados en la base de datos.
+
+Usan las columnas guardadas ``total_noches``, ``subtotal`` y ``total_pagar``,
+de modo que cada reporte es un único ``SELECT ... GROUP BY`` sin importar
+cuántas reservas abarque.
+"""
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+
+from habitaciones.catalogos import estados_reserva
+from .models import Reserva
+
+# Agrupación -> expresión (las fechas se truncan en la zona horaria del hotel)
+AGRUPACIONES = {
+    'dia': TruncDate('fecha_checkin_programado'),
+    'mes': TruncMonth('fecha_checkin_programado'),
+    'tipo_habitacion': F('codigo_habitacion__id_tipo__nombre'),
+    'pago': F('pago'),
+}
+
+ESTADOS_FACTURABLES = ('Pendiente', 'Confirmada', 'Finalizada')
+
+
+def reservas_facturables(desde=None, hasta=None):
+    """Reservas no canceladas, opcionalmente por fecha de check-in (inclusive)."""
+    ids = [estados_reserva.por_nombre(nombre).pk for nombre in ESTADOS_FACTURABLES]
+    reservas = Reserva.objects.filter(id_estado_reserva__in=ids)
+    if desde:
+        reservas = reservas.filter(fecha_checkin_programado__date__gte=desde)
+    if hasta:
+        reservas = reservas.filter(fecha_checkin_programado__date__lte=hasta)
+    return reservas
+
+
+def totales(reservas):
+    """Totales de un queryset de reservas en una sola consulta."""
+    return reservas.aggregate(
+        reservas=Count('id'),
+        noches=Sum('total_noches'),
+        subtotal=Sum('subtotal'),
+        descuentos=Sum('descuento_aplicado'),
+        impuestos=Sum('impuestos'),
+        ingresos=Sum('total_pagar'),
+    )
+
+
+def ingresos(reservas, agrupar='dia'):
+    """Ingresos agrupados por día o mes de check-in, tipo de habitación o medio de pago."""
+    if agrupar not in AGRUPACIONES:
+        raise ValueError(f"Agrupación no soportada: {agrupar}. Opciones: {', '.join(AGRUPACIONES)}")
+    return (
+        reservas.values(clave=AGRUPACIONES[agrupar])
+        .annotate(
+            reservas=Count('id'),
+            noches=Sum('total_noches'),
+            subtotal=Sum('subtotal'),
+            descuentos=Sum('descuento_aplicado'),
+            ingresos=Sum('total_pagar'),
+        )
+        .order_by('clave')
+    )
@@ -1,6 +1,7 @@
 from rest_framework import serializers
-from .models import Reserva, HistorialReserva
+from .models import Reserva, HistorialReserva, calcular_descuento, calcular_noches
 from usuarios.models import Usuario
+from habitaciones.catalogos import estados_habitacion, tipos_habitacion, tipos_reserva
 
 class ReservaSerializer(serializers.ModelSerializer):
     usuario = serializers.PrimaryKeyRelatedField(queryset=Usuario.objects.all())
@@ -40,13 +41,14 @@ class ReservaSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Las reservas presenciales deben tener un administrador asignado.')
         # Validar que el número de huéspedes no supere la capacidad máxima de la habitación
         if codigo_habitacion and numero_huespedes:
-            capacidad_maxima = codigo_habitacion.id_tipo.capacidad_maxima
+            capacidad_maxima = tipos_habitacion.get(codigo_habitacion.id_tipo_id).capacidad_maxima
             if numero_huespedes > capacidad_maxima:
                 raise serializers.ValidationError(f'El número de huéspedes ({numero_huespedes}) supera la capacidad máxima de la habitación ({capacidad_maxima}).')
         # Validar que el usuario no tenga ya una reserva para la misma habitación y fechas solapadas
-        if codigo_habitacion and codigo_habitacion.id_estado.nombre in ['Ocupada', 'Reservada', 'Limpieza']:
+        estado_habitacion = estados_habitacion.get(codigo_habitacion.id_estado_id) if codigo_habitacion else None
+        if estado_habitacion and estado_habitacion.nombre in ['Ocupada', 'Reservada', 'Limpieza']:
             raise serializers.ValidationError(
-                f"No puedes reservar una habitación que está actualmente en estado '{codigo_habitacion.id_estado.nombre}'."
+                f"No puedes reservar una habitación que está actualmente en estado '{estado_habitacion.nombre}'."
             )
         if usuario and codigo_habitacion and fecha_checkin and fecha_checkout:
             existe = Reserva.objects.filter(
@@ -64,22 +66,52 @@ class ReservaSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         # Calcular descuento_aplicado según total_visitas del usuario
-        from decimal import Decimal
         usuario = validated_data['usuario']
         precio_noche = validated_data['precio_noche']
         fecha_checkin = validated_data['fecha_checkin_programado']
         fecha_checkout = validated_data['fecha_checkout_programado']
-        total_noches = (fecha_checkout.date() - fecha_checkin.date()).days
-        total_noches = max(total_noches, 1)
+        total_noches = calcular_noches(fecha_checkin, fecha_checkout)
         subtotal = precio_noche * total_noches
-        if hasattr(usuario, 'total_visitas') and usuario.total_visitas >= 10:
-            descuento_aplicado = subtotal * Decimal('0.15')    
-        elif hasattr(usuario, 'total_visitas') and usuario.total_visitas >= 5:
-            descuento_aplicado = subtotal * Decimal('0.10')
-        else:
-            descuento_aplicado = Decimal('0.00')
-        validated_data['descuento_aplicado'] = descuento_aplicado
-        return super().create(validated_data)
+        validated_data['descuento_aplicado'] = calcular_descuento(usuario, subtotal)
+        try:
+            return super().create(validated_data)
+        except ValueError as e:
+            # Otra reserva ocupa alguna de las noches (restricción de NocheHabitacion)
+            raise serializers.ValidationError(str(e))
+
+class HabitacionGrupoSerializer(serializers.Serializer):
+    codigo_habitacion = serializers.CharField(max_length=10)
+    numero_huespedes = serializers.IntegerField(min_value=1, default=1)
+
+class GrupoReservaSerializer(serializers.Serializer):
+    """Datos de entrada de una reserva grupal (ver reservas.grupos)."""
+    habitaciones = HabitacionGrupoSerializer(many=True, allow_empty=False)
+    fecha_checkin_programado = serializers.DateTimeField()
+    fecha_checkout_programado = serializers.DateTimeField()
+    id_tipo_reserva = serializers.IntegerField()
+    usuario_admin = serializers.PrimaryKeyRelatedField(queryset=Usuario.objects.all(), required=False, allow_null=True)
+    pago = serializers.ChoiceField(choices=Reserva.TIPO_PAGO_CHOICES, default='efectivo')
+    nombre = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    observaciones = serializers.CharField(required=False, allow_blank=True)
+
+    def validate_id_tipo_reserva(self, value):
+        try:
+            return tipos_reserva.get(value)
+        except tipos_reserva.modelo.DoesNotExist:
+            raise serializers.ValidationError('Tipo de reserva no encontrado.')
+
+class HospedajePresencialSerializer(serializers.Serializer):
+    """Datos de entrada de un hospedaje presencial (ver reservas.presencial)."""
+    dni = serializers.CharField(max_length=20)
+    nombres = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    apellidos = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    habitacion_id = serializers.CharField(max_length=10)
+    numero_huespedes = serializers.IntegerField(min_value=1, default=1)
+    dias = serializers.IntegerField(min_value=1, default=3)
+    dni_admin = serializers.CharField(max_length=20, required=False, allow_null=True, allow_blank=True)
+    pago = serializers.ChoiceField(choices=Reserva.TIPO_PAGO_CHOICES)
+    fecha_checkin_programado = serializers.DateTimeField(required=False, allow_null=True)
+    fecha_checkout_programado = serializers.DateTimeField(required=False, allow_null=True)
 
 class ReservaDetalleSerializer(serializers.ModelSerializer):
     usuario_dni = serializers.CharField(source='usuario.dni', read_only=True)
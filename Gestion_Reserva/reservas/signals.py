@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Se envía después del commit de cada transición de reservas (ver reservas.transiciones).
+# Argumentos: transicion (nombre de la transición) y reservas (lista de instancias ya actualizadas).
+transicion_reserva = Signal()
@@ -1,3 +1,595 @@
-from django.test import TestCase
+import asyncio
+import csv
+import importlib
+import io
+import json
+import os
+import threading
+import time
+import unittest
+import warnings
+from unittest import mock
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from django.utils import timezone
+
+from habitaciones.models import Habitacion, EstadoHabitacion
+from habitaciones.tests import FIXTURES
+from usuarios.models import Usuario
+from . import exportacion, idempotencia, reportes, transiciones, vencimiento
+from pagos.models import CuentaCobrar
+from .models import Reserva, ClaveIdempotencia, EstadoReserva, GrupoReserva, NocheHabitacion
+
+
+class ReservasMixin:
+    fixtures = FIXTURES
+    codigo = 'HAB101'
+
+    def crear_huesped(self, dni='70000001'):
+        return Usuario.objects.create_user(dni, 'Ana', 'Pérez', password='clave-segura')
+
+    def crear_reserva(self, usuario, dias=10, noches=3, estado=1, codigo=None):
+        checkin = timezone.now() + timedelta(days=dias)
+        return Reserva.objects.create(
+            usuario=usuario,
+            codigo_habitacion_id=codigo or self.codigo,
+            id_tipo_reserva_id=2,
+            id_estado_reserva_id=estado,
+            fecha_checkin_programado=checkin,
+            fecha_checkout_programado=checkin + timedelta(days=noches),
+            precio_noche=100,
+        )
+
+
+class TransicionesTests(ReservasMixin, TestCase):
+    def setUp(self):
+        self.huesped = self.crear_huesped()
+
+    def test_ciclo_completo(self):
+        reserva = self.crear_reserva(self.huesped)
+        reserva.confirmar()
+        self.assertEqual(reserva.id_estado_reserva.nombre, 'Confirmada')
+        self.assertEqual(Habitacion.objects.get(pk=self.codigo).id_estado.nombre, 'Reservada')
+
+        with self.assertRaises(ValueError):
+            reserva.check_out()  # Sin check-in previo
+
+        reserva.check_in()
+        self.assertIsNotNone(Reserva.objects.get(pk=reserva.pk).fecha_checkin_real)
+        reserva.check_out()
+        self.assertEqual(Reserva.objects.get(pk=reserva.pk).id_estado_reserva.nombre, 'Finalizada')
+        self.assertEqual(Habitacion.objects.get(pk=self.codigo).id_estado.nombre, 'Limpieza')
+
+        reserva.finalizar_limpieza()
+        self.assertEqual(reserva.codigo_habitacion.id_estado.nombre, 'Disponible')
+
+    def test_transicion_invalida_no_modifica_nada(self):
+        reserva = self.crear_reserva(self.huesped, estado=3)
+        with self.assertRaises(ValueError):
+            reserva.confirmar()
+        self.assertEqual(Reserva.objects.get(pk=reserva.pk).id_estado_reserva_id, 3)
+        self.assertEqual(Habitacion.objects.get(pk=self.codigo).id_estado.nombre, 'Disponible')
+
+
+class OcupacionTests(ReservasMixin, TestCase):
+    def setUp(self):
+        self.huesped = self.crear_huesped()
+
+    def test_reserva_solapada_es_rechazada(self):
+        primera = self.crear_reserva(self.huesped, noches=3)
+        self.assertEqual(primera.noches.count(), 3)
+        with self.assertRaises(ValueError):
+            self.crear_reserva(self.huesped, dias=12)
+        self.assertEqual(Reserva.objects.count(), 1)
+        # Empieza el día del check-out de la primera: no se solapa
+        self.crear_reserva(self.huesped, dias=13)
+
+    def test_cancelar_y_check_out_liberan_noches(self):
+        reserva = self.crear_reserva(self.huesped)
+        reserva.cancelar()
+        self.assertFalse(reserva.noches.exists())
+        self.crear_reserva(self.huesped)
+
+        estancia = self.crear_reserva(self.huesped, dias=-1, noches=3, codigo='HAB102')
+        estancia.confirmar()
+        estancia.check_in()
+        estancia.check_out()
+        hoy = timezone.localdate()
+        self.assertEqual(
+            list(estancia.noches.values_list('fecha', flat=True)), [hoy - timedelta(days=1)]
+        )
+
+    def test_migracion_de_noches_falla_con_reservas_solapadas(self):
+        from django.apps import apps
+        migracion = importlib.import_module('reservas.migrations.0007_noche_habitacion')
+        primera = self.crear_reserva(self.huesped, noches=3)
+        segunda = self.crear_reserva(self.huesped, dias=11, codigo='HAB102')
+        # Datos previos a la migración: sin noches y con la segunda solapada
+        NocheHabitacion.objects.all().delete()
+        Reserva.objects.filter(pk=segunda.pk).update(codigo_habitacion_id=self.codigo)
+
+        with self.assertRaisesMessage(RuntimeError, f'reservas {primera.pk} y {segunda.pk}'):
+            with transaction.atomic():
+                migracion.registrar_noches(apps, None)
+        self.assertFalse(NocheHabitacion.objects.exists())
+
+        Reserva.objects.filter(pk=segunda.pk).update(codigo_habitacion_id='HAB102')
+        migracion.registrar_noches(apps, None)
+        self.assertEqual(primera.noches.count(), 3)
+        self.assertEqual(segunda.noches.count(), 3)
+
+
+class MontosReservaTests(ReservasMixin, TestCase):
+    def test_montos_guardados_y_reporte_agregado(self):
+        huesped = self.crear_huesped()
+        reserva = self.crear_reserva(huesped, noches=3)
+        self.assertEqual((reserva.total_noches, reserva.subtotal, reserva.total_pagar), (3, 300, 300))
+
+        reserva.descuento_aplicado = Decimal('30.00')
+        reserva.save(update_fields=['descuento_aplicado'])
+        self.assertEqual(Reserva.objects.get(pk=reserva.pk).total_pagar, Decimal('270.00'))
+
+        otra = self.crear_reserva(huesped, codigo='HAB102', noches=2)
+        Reserva.objects.filter(pk=otra.pk).update(pago='yape')
+        self.crear_reserva(huesped, codigo='HAB103', estado=3)  # Cancelada: no suma
+
+        with self.assertNumQueries(1):
+            grupos = {g['clave']: g for g in reportes.ingresos(reportes.reservas_facturables(), 'pago')}
+        self.assertEqual(grupos['efectivo']['ingresos'], Decimal('270.00'))
+        self.assertEqual(grupos['yape']['noches'], 2)
+        self.assertEqual(reportes.totales(reportes.reservas_facturables())['ingresos'], Decimal('470.00'))
+
+        Reserva.objects.update(total_noches=0, subtotal=0, total_pagar=0)
+        call_command('recalcular_montos_reservas', stdout=io.StringIO())
+        self.assertEqual(Reserva.objects.get(pk=reserva.pk).total_pagar, Decimal('270.00'))
+
+
+    def test_noches_cobradas_sobre_fechas_locales(self):
+        huesped = self.crear_huesped()
+        dia = timezone.localdate() + timedelta(days=10)
+        # 20:00 en Lima ya es el día siguiente en UTC: ahí se cobraba una noche menos
+        checkin = timezone.make_aware(datetime.combine(dia, dt_time(20)))
+        checkout = timezone.make_aware(datetime.combine(dia + timedelta(days=2), dt_time(10)))
+        en_utc = [fecha.astimezone(dt_timezone.utc).date() for fecha in (checkin, checkout)]
+        self.assertEqual((en_utc[1] - en_utc[0]).days, 1)
+
+        reserva = Reserva.objects.create(
+            usuario=huesped, codigo_habitacion_id=self.codigo, id_tipo_reserva_id=2,
+            id_estado_reserva_id=1, fecha_checkin_programado=checkin,
+            fecha_checkout_programado=checkout, precio_noche=100,
+        )
+        self.assertEqual(reserva.total_noches, 2)
+        self.assertEqual(reserva.noches.count(), reserva.total_noches)
+        self.assertEqual(Reserva.objects.get(pk=reserva.pk).subtotal, Decimal('200.00'))
+
+
+class ReservaGrupalTests(ReservasMixin, TestCase):
+    def setUp(self):
+        self.huesped = self.crear_huesped()
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.huesped)
+        self.checkin = timezone.now() + timedelta(days=20)
+
+    def reservar_grupo(self, codigos):
+        return self.cliente.post('/api/reservas/grupo/', {
+            'habitaciones': [{'codigo_habitacion': c, 'numero_huespedes': 2} for c in codigos],
+            'fecha_checkin_programado': self.checkin.isoformat(),
+            'fecha_checkout_programado': (self.checkin + timedelta(days=2)).isoformat(),
+            'id_tipo_reserva': 2,
+        }, format='json')
+
+    def test_consultas_constantes_y_cuenta_consolidada(self):
+        codigos = list(Habitacion.objects.order_by('codigo').values_list('codigo', flat=True))
+        self.reservar_grupo(codigos[:1])  # Carga los catálogos
+
+        with CaptureQueriesContext(connection) as pocas:
+            respuesta = self.reservar_grupo(codigos[1:3])
+        self.assertEqual(respuesta.status_code, 201)
+        with CaptureQueriesContext(connection) as muchas:
+            respuesta = self.reservar_grupo(codigos[3:23])
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(len(muchas), len(pocas))
+
+        grupo = GrupoReserva.objects.get(pk=respuesta.data['grupo_id'])
+        reservas = list(grupo.reservas.all())
+        self.assertEqual(len(reservas), 20)
+        cuenta = CuentaCobrar.objects.get(grupo=grupo)
+        self.assertEqual(cuenta.monto_total, sum(r.total_pagar for r in reservas))
+        self.assertEqual(NocheHabitacion.objects.filter(reserva__grupo=grupo).count(), 40)
+
+    def test_una_habitacion_ocupada_anula_todo_el_grupo(self):
+        self.crear_reserva(self.huesped, dias=21, codigo='HAB104')
+        respuesta = self.reservar_grupo(['HAB101', 'HAB104', 'HAB999'])
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(len(respuesta.data['errores']), 2)
+        self.assertFalse(GrupoReserva.objects.exists())
+        self.assertEqual(Reserva.objects.count(), 1)
+
+
+class VencimientoTests(ReservasMixin, TestCase):
+    def crear_cuenta(self, reserva, vence_en):
+        return CuentaCobrar.objects.create(
+            codigo_reserva=reserva,
+            dni_huesped=reserva.usuario,
+            monto_total=reserva.total_pagar,
+            fecha_vencimiento=timezone.localdate() + timedelta(days=vence_en),
+        )
+
+    def test_cancela_pendientes_vencidas_y_libera_noches(self):
+        huesped = self.crear_huesped()
+        vencida = self.crear_reserva(huesped, codigo='HAB101')
+        confirmada = self.crear_reserva(huesped, codigo='HAB102', estado=2)
+        vigente = self.crear_reserva(huesped, codigo='HAB103')
+        cuentas = [self.crear_cuenta(vencida, -1), self.crear_cuenta(confirmada, -3), self.crear_cuenta(vigente, 1)]
+
+        with mock.patch('reservas.vencimiento.transicion_reserva.send') as enviar, \
+                self.captureOnCommitCallbacks(execute=True):
+            resultado = vencimiento.barrer(lote=1)
+
+        self.assertEqual((resultado.cuentas, resultado.canceladas, resultado.reservas, resultado.lotes), (2, 1, 1, 2))
+        # La reserva confirmada es deuda real (VENCIDO); la abandonada se cancela con su cuenta
+        self.assertEqual([c.estado for c in CuentaCobrar.objects.filter(pk__in=[c.pk for c in cuentas]).order_by('fecha_vencimiento')],
+                         ['VENCIDO', 'CANCELADO', 'PENDIENTE'])
+        self.assertEqual(Reserva.objects.get(pk=vencida.pk).id_estado_reserva_id, 3)
+        self.assertEqual(Reserva.objects.get(pk=confirmada.pk).id_estado_reserva_id, 2)
+        self.assertFalse(NocheHabitacion.objects.filter(reserva=vencida).exists())
+        self.assertTrue(NocheHabitacion.objects.filter(reserva=vigente).exists())
+        enviar.assert_called_once()
+        self.assertEqual([r.pk for r in enviar.call_args.kwargs['reservas']], [vencida.pk])
+
+
+    def test_cuenta_pagada_durante_el_barrido_conserva_sus_reservas(self):
+        huesped = self.crear_huesped()
+        reserva = self.crear_reserva(huesped)
+        cuenta = self.crear_cuenta(reserva, -1)
+        con_deuda = vencimiento._con_deuda
+
+        def pagar_entre_medio(*args):
+            # El pago se confirma después de la lectura y antes del UPDATE
+            CuentaCobrar.objects.filter(pk=cuenta.pk).update(estado='PAGADO', saldo_pendiente=0)
+            return con_deuda(*args)
+
+        with mock.patch('reservas.vencimiento._con_deuda', side_effect=pagar_entre_medio):
+            resultado = vencimiento.barrer()
+
+        self.assertEqual((resultado.cuentas, resultado.reservas), (0, 0))
+        self.assertEqual(CuentaCobrar.objects.get(pk=cuenta.pk).estado, 'PAGADO')
+        self.assertEqual(Reserva.objects.get(pk=reserva.pk).id_estado_reserva_id, 1)
+        self.assertTrue(NocheHabitacion.objects.filter(reserva=reserva).exists())
+
+    @override_settings(PAGOS_PASARELA='falsa')
+    def test_cancela_el_intento_abierto_de_la_cuenta_cancelada(self):
+        from pagos import pasarelas, services
+
+        cuenta = self.crear_cuenta(self.crear_reserva(self.crear_huesped()), -1)
+        services.crear_payment_intent(cuenta)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            vencimiento.barrer()
+
+        self.assertEqual(pasarelas.obtener().intentos[cuenta.payment_intent_id].estado, 'canceled')
+
+
+class HospedajePresencialTests(ReservasMixin, TestCase):
+    # Consultas de un registro con check-in (huésped nuevo o existente, dentro
+    # de la transacción del test): huésped, habitación, nivel de fidelidad,
+    # reserva, noches y su cambio de disponibilidad, estado de la habitación
+    # y versión del dashboard, total_visitas y la versión compartida del nivel.
+    PRESUPUESTO = 20
+
+    def setUp(self):
+        self.admin = Usuario.objects.create_user('40000001', 'Admin', 'Hotel', password='clave-segura', rol='ADMIN')
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.admin)
+        # Los catálogos se cargan una vez por proceso
+        self.cliente.post('/api/reservas/hospedaje-presencial-pendiente/', {
+            'dni': '70000009', 'nombres': 'Eva', 'apellidos': 'Ríos', 'habitacion_id': 'HAB407', 'pago': 'efectivo',
+        }, format='json')
+
+    def registrar(self, dni, codigo, ruta='hospedaje-presencial'):
+        return self.cliente.post(f'/api/reservas/{ruta}/', {
+            'dni': dni, 'nombres': 'Luis', 'apellidos': 'Soto',
+            'habitacion_id': codigo, 'dias': 2, 'pago': 'efectivo',
+        }, format='json')
+
+    # La versión del nivel la leyó el registro del setUp; no se vuelve a comparar
+    @mock.patch('usuarios.fidelidad.VERIFICAR_SEGUNDOS', 60)
+    def test_checkin_con_presupuesto_fijo_de_consultas(self):
+        with self.assertNumQueries(self.PRESUPUESTO):
+            respuesta = self.registrar('70000002', 'HAB101')
+        self.assertEqual(respuesta.status_code, 201)
+        # Sin el INSERT del huésped; la visita anterior obliga a leer otra vez la versión del nivel
+        with self.assertNumQueries(self.PRESUPUESTO - 3 + 1):
+            respuesta = self.registrar('70000002', 'HAB102')
+        self.assertEqual(respuesta.status_code, 201)
+
+        huesped = Usuario.objects.get(pk='70000002')
+        self.assertEqual(huesped.total_visitas, 2)
+        self.assertTrue(huesped.check_password('70000002'))
+        reserva = Reserva.objects.get(pk=respuesta.data['reserva']['id'])
+        self.assertEqual(reserva.id_estado_reserva_id, 2)
+        self.assertIsNotNone(reserva.fecha_checkin_real)
+        self.assertEqual(Habitacion.objects.get(pk='HAB102').id_estado.nombre, 'Ocupada')
+        self.assertEqual(NocheHabitacion.objects.filter(reserva=reserva).count(), 2)
+
+    def test_pendiente_no_cambia_la_habitacion(self):
+        respuesta = self.registrar('70000003', 'HAB103', ruta='hospedaje-presencial-pendiente')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(respuesta.data['reserva']['id_estado_reserva'], 1)
+        self.assertEqual(Habitacion.objects.get(pk='HAB103').id_estado.nombre, 'Disponible')
+        self.assertEqual(Usuario.objects.get(pk='70000003').total_visitas, 0)
+
+        # La habitación ya está tomada para esas noches: no se crea nada
+        respuesta = self.registrar('70000004', 'HAB103')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertFalse(Usuario.objects.filter(pk='70000004').exists())
+
+
+class IdempotenciaTests(ReservasMixin, TestCase):
+    def setUp(self):
+        self.huesped = self.crear_huesped()
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.huesped)
+        checkin = timezone.now() + timedelta(days=20)
+        self.datos = {
+            'codigo_habitacion': 'HAB101',
+            'id_tipo_reserva': 2,
+            'fecha_checkin_programado': checkin.isoformat(),
+            'fecha_checkout_programado': (checkin + timedelta(days=2)).isoformat(),
+            'precio_noche': '100.00',
+            'pago': 'tarjeta',
+        }
+
+    def crear(self, datos, clave='clave-1'):
+        return self.cliente.post('/api/reservas/crear/', datos, format='json', HTTP_IDEMPOTENCY_KEY=clave)
+
+    def test_reintento_devuelve_la_respuesta_guardada(self):
+        primera = self.crear(self.datos)
+        self.assertEqual(primera.status_code, 201)
+        repetida = self.crear(self.datos)
+        self.assertEqual(repetida.status_code, 201)
+        self.assertEqual(repetida['Idempotent-Replayed'], 'true')
+        self.assertEqual(repetida.json(), primera.json())
+        self.assertEqual(Reserva.objects.count(), 1)
+        self.assertEqual(CuentaCobrar.objects.count(), 1)
+
+        otra = dict(self.datos, pago='yape')
+        self.assertEqual(self.crear(otra).status_code, 422)
+
+    def test_duplicado_en_curso_recibe_409(self):
+        ClaveIdempotencia.objects.create(
+            usuario=self.huesped, clave='clave-2', hash_peticion=idempotencia._hash(
+                mock.Mock(method='POST', path='/api/reservas/crear/', data=self.datos)),
+            expira=timezone.now() + timedelta(hours=1),
+        )
+        # Responde sin esperar a que termine la petición original
+        with mock.patch('time.sleep', side_effect=AssertionError('no debe esperar')):
+            respuesta = self.crear(self.datos, clave='clave-2')
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta['Retry-After'], '1')
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_error_5xx_no_deja_escrituras_y_libera_la_clave(self):
+        with mock.patch('reservas.views.CuentaCobrar.objects.create', side_effect=Exception('sin conexión')):
+            self.assertEqual(self.crear(self.datos).status_code, 500)
+        # La reserva se deshizo junto con la clave: el reintento la crea una sola vez
+        self.assertFalse(Reserva.objects.exists())
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+        self.assertEqual(self.crear(self.datos).status_code, 201)
+        self.assertEqual(Reserva.objects.count(), 1)
+
+    def test_peticion_que_pierde_el_reclamo_no_confirma_nada(self):
+        def retomar(**kwargs):
+            # Otra petición retoma la clave mientras esta sigue ejecutando la vista
+            ClaveIdempotencia.objects.update(reclamada_en=timezone.now() + timedelta(seconds=1))
+
+        with mock.patch('reservas.views.HistorialReserva.objects.create', side_effect=retomar):
+            respuesta = self.crear(self.datos)
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertFalse(Reserva.objects.exists())
+        self.assertIsNone(ClaveIdempotencia.objects.get().estado_http)
+
+    @override_settings(IDEMPOTENCIA_RECLAMO_SEGUNDOS=60)
+    def test_reclamo_vencido_se_retoma(self):
+        # El worker que reclamó la clave murió hace dos minutos sin responder
+        hash_peticion = idempotencia._hash(mock.Mock(method='POST', path='/api/reservas/crear/', data=self.datos))
+        ClaveIdempotencia.objects.create(
+            usuario=self.huesped, clave='clave-3', hash_peticion=hash_peticion,
+            reclamada_en=timezone.now() - timedelta(minutes=2), expira=timezone.now() + timedelta(hours=1),
+        )
+        self.assertEqual(self.crear(dict(self.datos, pago='yape'), clave='clave-3').status_code, 422)
+        self.assertEqual(self.crear(self.datos, clave='clave-3').status_code, 201)
+        self.assertEqual(self.crear(self.datos, clave='clave-3')['Idempotent-Replayed'], 'true')
+        self.assertEqual(Reserva.objects.count(), 1)
+
+
+class ListadoReservasTests(ReservasMixin, TestCase):
+    def setUp(self):
+        huesped = self.crear_huesped()
+        for i in range(7):
+            self.crear_reserva(huesped, dias=10 + 4 * i, noches=2)
+        self.cliente = APIClient()
+        admin = Usuario.objects.create_user('70000002', 'Luis', 'Rojas', password='clave-segura', rol='ADMIN')
+        self.cliente.force_authenticate(admin)
+
+    def recorrer(self, url, page_size):
+        ids = []
+        siguiente = f'{url}?page_size={page_size}'
+        while siguiente:
+            with self.assertNumQueries(1):
+                respuesta = self.cliente.get(siguiente)
+            self.assertEqual(respuesta.status_code, 200)
+            ids.extend(r['id'] for r in respuesta.data['results'])
+            siguiente = respuesta.data['next']
+        return ids
+
+    def test_paginas_con_consultas_constantes(self):
+        esperados = list(Reserva.objects.order_by('-fecha_checkin_programado', '-id').values_list('id', flat=True))
+        for page_size in (2, 7):
+            self.assertEqual(self.recorrer('/api/reservas/todas/', page_size), esperados)
+        self.assertEqual(len(self.recorrer('/api/reservas/listar/', 3)), 7)
+
+    def test_sin_paginar_y_cursor_invalido(self):
+        with self.assertNumQueries(1):
+            respuesta = self.cliente.get('/api/reservas/todas/')
+        self.assertEqual(len(respuesta.data), 7)
+        self.assertEqual(self.cliente.get('/api/reservas/todas/?cursor=xyz').status_code, 400)
+
+    def test_exportacion_en_streaming(self):
+        Reserva.objects.filter(pk=Reserva.objects.order_by('id').first().pk).update(id_estado_reserva=3)
+
+        respuesta = self.cliente.get('/api/reservas/exportar/?estado=Pendiente')
+        self.assertTrue(respuesta.streaming)
+        lineas = [json.loads(l) for l in b''.join(respuesta.streaming_content).decode().splitlines()]
+        self.assertEqual(len(lineas), 6)
+        self.assertEqual(lineas[0]['total_noches'], 2)
+        self.assertEqual(Decimal(lineas[0]['total_pagar']), Decimal('200.00'))
+
+        respuesta = self.cliente.get('/api/reservas/exportar/?formato=csv&habitacion=HAB101')
+        filas = list(csv.DictReader(b''.join(respuesta.streaming_content).decode().splitlines()))
+        self.assertEqual(len(filas), 7)
+        self.assertEqual(filas[0]['estado_reserva'], 'Cancelada')
+
+        self.assertEqual(self.cliente.get('/api/reservas/exportar/?estado=Otro').status_code, 400)
+
+    def test_exportacion_en_streaming_bajo_asgi(self):
+        # Como el cliente de pruebas, sin cerrar la conexión de la transacción del test
+        for senal in (request_started, request_finished):
+            senal.disconnect(close_old_connections)
+            self.addCleanup(senal.connect, close_old_connections)
+        token = AccessToken.for_user(Usuario.objects.get(pk='70000002'))
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': '/api/reservas/exportar/', 'raw_path': b'/api/reservas/exportar/',
+            'query_string': b'', 'root_path': '', 'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+            'headers': [(b'host', b'testserver'), (b'authorization', f'Bearer {token}'.encode())],
+        }
+        estados, fragmentos, pedidos = [], [], []
+
+        async def receive():
+            if not pedidos:
+                pedidos.append(True)
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await asyncio.Event().wait()  # El cliente no se desconecta
+
+        async def send(mensaje):
+            if mensaje['type'] == 'http.response.start':
+                estados.append(mensaje['status'])
+            elif mensaje.get('body'):
+                fragmentos.append(mensaje['body'])
+
+        with mock.patch.object(exportacion, 'TAMANO_LOTE', 3), warnings.catch_warnings(record=True) as avisos:
+            warnings.simplefilter('always')
+            async_to_sync(ASGIHandler())(scope, receive, send)
+        self.assertEqual(estados, [200])
+        self.assertEqual(len(b''.join(fragmentos).decode().splitlines()), 7)
+        self.assertEqual(len(fragmentos), 3)  # Lotes de 3 líneas, no la lista completa
+        self.assertEqual([str(a.message) for a in avisos if 'StreamingHttpResponse' in str(a.message)], [])
+
+
+class ConcurrenciaTransicionesTests(ReservasMixin, TransactionTestCase):
+    HILOS = 8
+    REINTENTOS = 50
+
+    def en_paralelo(self, operaciones):
+        """Ejecuta cada operación en su propio hilo, todas a la vez. Devuelve
+        'ok', 'rechazada' o 'agotada' por operación."""
+        barrera = threading.Barrier(len(operaciones))
+        resultados = []
+
+        def ejecutar(operacion):
+            try:
+                barrera.wait()
+                for _ in range(self.REINTENTOS):
+                    try:
+                        operacion()
+                        resultados.append('ok')
+                        return
+                    except OperationalError:  # Base de datos bloqueada: se reintenta
+                        time.sleep(0.01)
+                    except ValueError:
+                        resultados.append('rechazada')
+                        return
+                resultados.append('agotada')
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=ejecutar, args=(op,)) for op in operaciones]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return resultados
+
+    def test_confirmaciones_concurrentes_de_la_misma_reserva(self):
+        huesped = self.crear_huesped()
+        reserva_id = self.crear_reserva(huesped).pk
+        resultados = self.en_paralelo([
+            lambda: Reserva.objects.get(pk=reserva_id).confirmar() for _ in range(self.HILOS)
+        ])
+
+        self.assertEqual(resultados.count('ok'), 1)
+        self.assertEqual(Reserva.objects.get(pk=reserva_id).id_estado_reserva.nombre, 'Confirmada')
+        self.assertEqual(Habitacion.objects.get(pk=self.codigo).id_estado.nombre, 'Reservada')
+        # Solo una confirmación suma la visita
+        self.assertEqual(Usuario.objects.get(pk=huesped.pk).total_visitas, 1)
+
+    def test_reservas_concurrentes_de_las_mismas_noches(self):
+        huesped = self.crear_huesped()
+        resultados = self.en_paralelo([
+            lambda i=i: self.crear_reserva(huesped, dias=10 + i % 3) for i in range(self.HILOS)
+        ])
+        self.assertEqual(resultados.count('ok'), 1)
+        self.assertEqual(Reserva.objects.count(), 1)
+
+
+def confirmar_sin_maquina(reserva):
+    """Implementación anterior de Reserva.confirmar, usada como referencia."""
+    if reserva.id_estado_reserva.nombre != 'Pendiente':
+        raise ValueError("Solo se pueden confirmar reservas pendientes")
+    solapada = Reserva.objects.filter(
+        codigo_habitacion=reserva.codigo_habitacion,
+        id_estado_reserva__nombre__in=['Confirmada', 'Ocupada'],
+        fecha_checkin_programado__lt=reserva.fecha_checkout_programado,
+        fecha_checkout_programado__gt=reserva.fecha_checkin_programado
+    ).exclude(pk=reserva.pk).exists()
+    if solapada:
+        raise ValueError("Ya existe una reserva confirmada u ocupada para esta habitación en el rango de fechas seleccionado.")
+    reserva.id_estado_reserva = EstadoReserva.objects.get(nombre='Confirmada')
+    reserva.codigo_habitacion.id_estado = EstadoHabitacion.objects.get(nombre='Reservada')
+    reserva.codigo_habitacion.save()
+    reserva.save()
+
+
+@unittest.skipUnless(os.environ.get('BENCHMARK'), "Definir BENCHMARK=1 para medir transiciones por segundo")
+class RendimientoTransicionesTests(ReservasMixin, TestCase):
+    RESERVAS = 200
+
+    def medir(self, confirmar):
+        huesped = Usuario.objects.first() or self.crear_huesped()
+        reservas = [
+            self.crear_reserva(huesped, dias=10 + 4 * i, noches=2, codigo=self.codigo)
+            for i in range(self.RESERVAS)
+        ]
+        inicio = time.perf_counter()
+        with transaction.atomic():
+            for reserva in reservas:
+                confirmar(reserva)
+        return self.RESERVAS / (time.perf_counter() - inicio)
+
+    def test_transiciones_por_segundo(self):
+        anterior = self.medir(confirmar_sin_maquina)
+        Reserva.objects.all().delete()
+        actual = self.medir(transiciones.confirmar)
+        print(f"\nconfirmar: anterior {anterior:.0f}/s, máquina de estados {actual:.0f}/s")
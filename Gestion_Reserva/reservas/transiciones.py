@@ -0,0 +1,188 @@
+"""
+Máquina de estados de las reservas.
+
+Cada transición se ejecuta en un único ``transaction.atomic``:
+
+1. Se bloquea la fila de la habitación (``select_for_update``; en SQLite, que no
+   lo soporta, una escritura sobre la fila toma el lock de escritura antes de
+   cualquier lectura). Así dos recepcionistas que operan sobre la misma
+   habitación quedan serializados y la validación de solapamiento es segura.
+2. La reserva se actualiza con un ``UPDATE ... WHERE estado IN (origen)``: si
+   otro proceso ya la movió de estado, no se actualiza ninguna fila y la
+   transición falla sin efectos.
+3. Se actualiza el estado de la habitación y, si corresponde, se liberan sus
+   noches en ``NocheHabitacion`` (ver ``reservas.ocupacion``).
+
+Los estados se declaran por nombre en ``TRANSICIONES`` y se resuelven con el
+catálogo en memoria, sin consultas extra. Al confirmarse la transacción se
+envía la señal ``transicion_reserva``.
+"""
+from dataclasses import dataclass
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from habitaciones.catalogos import estados_habitacion, estados_reserva
+from habitaciones.models import Habitacion
+from usuarios import fidelidad
+from .models import Reserva
+from .ocupacion import liberar
+from .signals import transicion_reserva
+
+
+@dataclass(frozen=True)
+class Transicion:
+    origen: tuple                  # Estados de reserva desde los que se permite
+    destino: str = None            # Nuevo estado de la reserva (None: no cambia)
+    habitacion: str = None         # Nuevo estado de la habitación
+    habitacion_desde: tuple = ()   # Solo se cambia la habitación si está en alguno de estos estados
+    error: str = ''
+
+
+TRANSICIONES = {
+    'confirmar': Transicion(
+        origen=('Pendiente',),
+        destino='Confirmada',
+        habitacion='Reservada',
+        error="Solo se pueden confirmar reservas pendientes",
+    ),
+    'cancelar': Transicion(
+        # Las confirmadas solo si la habitación sigue Reservada (ver cancelar)
+        origen=('Pendiente', 'Confirmada'),
+        destino='Cancelada',
+        habitacion='Disponible',
+        habitacion_desde=('Reservada',),
+        error="Solo se pueden cancelar reservas pendientes o confirmadas con habitación reservada.",
+    ),
+    'check_in': Transicion(
+        origen=('Confirmada',),
+        habitacion='Ocupada',
+        error="Solo se puede hacer check-in de reservas confirmadas",
+    ),
+    'check_out': Transicion(
+        origen=('Confirmada',),
+        destino='Finalizada',
+        habitacion='Limpieza',
+        error="No se puede hacer check-out sin check-in previo",
+    ),
+}
+
+
+def _ids_estados_reserva(nombres):
+    """Ids de los estados indicados; los que no existen en el catálogo se omiten."""
+    ids = []
+    for nombre in nombres:
+        try:
+            ids.append(estados_reserva.por_nombre(nombre).pk)
+        except estados_reserva.modelo.DoesNotExist:
+            pass
+    return ids
+
+
+def _bloquear_habitacion(codigo):
+    habitaciones = Habitacion.objects.filter(pk=codigo)
+    if connection.features.has_select_for_update:
+        return habitaciones.select_for_update().get()
+    # SQLite: la primera sentencia de la transacción es una escritura, de modo
+    # que el lock se toma antes de leer y la lectura siguiente ya es consistente.
+    habitaciones.update(updated_at=F('updated_at'))
+    return habitaciones.get()
+
+
+def _cambiar_habitacion(habitacion, nombre_estado, **campos):
+    habitacion.id_estado = estados_habitacion.por_nombre(nombre_estado)
+    for campo, valor in campos.items():
+        setattr(habitacion, campo, valor)
+    habitacion.save(update_fields=['id_estado', 'updated_at', *campos])
+
+
+def _ejecutar(reserva, nombre, origen=None, condiciones=None, campos=None, validar=None):
+    """Aplica la transición ``nombre`` a ``reserva`` y refleja los cambios en la instancia."""
+    transicion = TRANSICIONES[nombre]
+    campos = dict(campos or {})
+    if transicion.destino:
+        campos['id_estado_reserva'] = estados_reserva.por_nombre(transicion.destino)
+
+    with transaction.atomic():
+        habitacion = _bloquear_habitacion(reserva.codigo_habitacion_id)
+        origen_ids = _ids_estados_reserva(origen(habitacion) if origen else transicion.origen)
+        if validar:
+            validar(reserva, habitacion)
+        actualizadas = Reserva.objects.filter(
+            pk=reserva.pk, id_estado_reserva__in=origen_ids, **(condiciones or {})
+        ).update(updated_at=timezone.now(), **campos)
+        if not actualizadas:
+            raise ValueError(transicion.error)
+
+        if transicion.habitacion:
+            desde_ids = [estados_habitacion.por_nombre(n).pk for n in transicion.habitacion_desde]
+            if not desde_ids or habitacion.id_estado_id in desde_ids:
+                _cambiar_habitacion(habitacion, transicion.habitacion)
+
+        for campo, valor in campos.items():
+            setattr(reserva, campo, valor)
+        reserva.codigo_habitacion = habitacion
+        transaction.on_commit(
+            lambda: transicion_reserva.send(sender=Reserva, transicion=nombre, reservas=[reserva])
+        )
+    return reserva
+
+
+def _validar_sin_solapamiento(reserva, habitacion):
+    solapada = Reserva.objects.filter(
+        codigo_habitacion=habitacion,
+        id_estado_reserva__in=_ids_estados_reserva(['Confirmada', 'Ocupada']),
+        fecha_checkin_programado__lt=reserva.fecha_checkout_programado,
+        fecha_checkout_programado__gt=reserva.fecha_checkin_programado
+    ).exclude(pk=reserva.pk).exists()
+    if solapada:
+        raise ValueError("Ya existe una reserva confirmada u ocupada para esta habitación en el rango de fechas seleccionado.")
+
+
+def confirmar(reserva):
+    with transaction.atomic():
+        _ejecutar(reserva, 'confirmar', validar=_validar_sin_solapamiento)
+        fidelidad.registrar_visita(reserva.usuario)
+    return reserva
+
+
+def cancelar(reserva, motivo=None):
+    def origen(habitacion):
+        if habitacion.id_estado_id == estados_habitacion.por_nombre('Reservada').pk:
+            return TRANSICIONES['cancelar'].origen
+        return ('Pendiente',)
+
+    campos = {'motivo_cancelacion': motivo} if motivo else None
+    with transaction.atomic():
+        _ejecutar(reserva, 'cancelar', origen=origen, campos=campos)
+        liberar(reserva)
+    return reserva
+
+
+def check_in(reserva):
+    return _ejecutar(reserva, 'check_in', campos={'fecha_checkin_real': timezone.now()})
+
+
+def check_out(reserva):
+    ahora = timezone.now()
+    with transaction.atomic():
+        _ejecutar(
+            reserva, 'check_out',
+            condiciones={'fecha_checkin_real__isnull': False},
+            campos={'fecha_checkout_real': ahora},
+        )
+        # Las noches ya usadas se conservan; las restantes quedan libres
+        liberar(reserva, desde=timezone.localdate(ahora))
+    return reserva
+
+
+def finalizar_limpieza(codigo_habitacion):
+    """Pasa la habitación de Limpieza a Disponible. Devuelve la habitación, o
+    None si no estaba en limpieza."""
+    with transaction.atomic():
+        habitacion = _bloquear_habitacion(codigo_habitacion)
+        if habitacion.id_estado_id != estados_habitacion.por_nombre('Limpieza').pk:
+            return None
+        _cambiar_habitacion(habitacion, 'Disponible', fecha_ultima_limpieza=timezone.now())
+    return habitacion
@@ -1,6 +1,7 @@
 from django.urls import path
 from .views import (
     crear_reserva, 
+    crear_reserva_grupal,
     listar_reservas,
     confirmar_reserva,
     cancelar_reserva,
@@ -11,12 +12,15 @@ from .views import (
     registrar_hospedaje_presencial,
     registrar_hospedaje_presencial_pendiente,
     listar_reservas_confirmadas_ocupadas_limpieza,
-    listar_todas_las_reservas
+    listar_todas_las_reservas,
+    exportar_reservas,
+    reporte_ingresos
 )
 
 urlpatterns = [
     # Gestión básica de reservas
     path('crear/', crear_reserva, name='crear_reserva'),
+    path('grupo/', crear_reserva_grupal, name='crear_reserva_grupal'),
     path('listar/', listar_reservas, name='listar_reservas'),
     
     # Acciones de reserva (requieren ID)
@@ -29,6 +33,8 @@ urlpatterns = [
     path('hospedaje-presencial-pendiente/', registrar_hospedaje_presencial_pendiente, name='hospedaje_presencial_pendiente'),
     path('confirmadas-ocupadas-limpieza/', listar_reservas_confirmadas_ocupadas_limpieza, name='reservas_confirmadas_ocupadas_limpieza'),
     path('todas/', listar_todas_las_reservas, name='listar_todas_las_reservas'),
+    path('exportar/', exportar_reservas, name='exportar_reservas'),
+    path('reportes/ingresos/', reporte_ingresos, name='reporte_ingresos'),
 
     # Historial de reservas de un usuario específico
     path('historial/<str:dni>/', historial_reservas_usuario, name='historial_reservas_usuario'),
@@ -0,0 +1,213 @@
+"""
+Vencimiento de reservas pendientes sin pago.
+
+Al crear una reserva se genera una ``CuentaCobrar`` con ``fecha_vencimiento``.
+Si la fecha pasa y la cuenta sigue PENDIENTE, el barrido:
+
+1. Cierra la cuenta (la búsqueda usa el índice ``idx_cuenta_estado_venc``
+   sobre (estado, fecha_vencimiento)). Si ninguna de sus reservas se
+   confirmó ni se usó, la reserva se abandonó y la cuenta pasa a CANCELADO:
+   deja de contar como saldo del huésped y ya no se puede pagar. Si alguna
+   se confirmó o se hospedó, la deuda es real y la cuenta pasa a VENCIDO.
+2. Cancela las reservas Pendiente de las cuentas que realmente cambió (todas
+   las del grupo en las cuentas grupales) con un único ``UPDATE`` por lote.
+   Una cuenta pagada entre la lectura y el ``UPDATE`` queda fuera.
+3. Libera sus noches en ``NocheHabitacion``, de modo que las habitaciones
+   vuelven a aparecer como disponibles para esas fechas.
+
+Las reservas Pendiente nunca cambian el estado de la habitación (eso lo hace
+``confirmar``), así que no hay habitaciones que devolver a Disponible. Tras
+el commit de cada lote se envía ``transicion_reserva`` con la transición
+``'vencer'`` y todas las reservas canceladas: el resumen diario se actualiza
+con un solo envío. Las noches liberadas se registran para el índice de
+disponibilidad dentro de la transacción del lote. También tras el commit se
+cancela en la pasarela el PaymentIntent abierto de las cuentas canceladas.
+
+Se ejecuta con el comando ``vencer_reservas`` o, si se define
+``BARREDOR_RESERVAS_INTERVALO`` (segundos), en un hilo del propio proceso.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from habitaciones.catalogos import estados_reserva
+from habitaciones.disponibilidad import registrar_cambios
+from .models import NocheHabitacion, Reserva
+from .signals import transicion_reserva
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = 500
+MOTIVO = "Cancelada automáticamente: la cuenta por cobrar venció sin pago."
+
+
+@dataclass
+class ResultadoBarrido:
+    cuentas: int = 0
+    canceladas: int = 0
+    reservas: int = 0
+    lotes: int = 0
+    segundos: float = 0.0
+
+    def __str__(self):
+        return (f"{self.cuentas} cuentas cerradas ({self.canceladas} canceladas), "
+                f"{self.reservas} reservas canceladas en {self.lotes} lotes ({self.segundos:.3f} s)")
+
+
+def _filtro_reservas(cuentas):
+    """Reservas de las cuentas (id, codigo_reserva, grupo): la reserva de las
+    individuales y todas las del grupo en las grupales."""
+    return (Q(pk__in=[reserva for _, reserva, grupo in cuentas if grupo is None])
+            | Q(grupo__in=[grupo for _, _, grupo in cuentas if grupo is not None]))
+
+
+def _con_deuda(cuentas, pendiente, cancelada):
+    """Ids de las cuentas con alguna reserva confirmada, en curso o finalizada."""
+    usadas = set(
+        Reserva.objects.filter(_filtro_reservas(cuentas))
+        .exclude(id_estado_reserva__in=[pendiente, cancelada])
+        .values_list('pk', 'grupo_id')
+    )
+    reservas = {pk for pk, _ in usadas}
+    grupos = {grupo for _, grupo in usadas if grupo is not None}
+    return {
+        cuenta for cuenta, reserva, grupo in cuentas
+        if (grupo in grupos if grupo is not None else reserva in reservas)
+    }
+
+
+def _cancelar_intentos(ids):
+    """Cancela en la pasarela los intentos abiertos de las cuentas canceladas.
+    Si falla, el intento caduca solo; un cobro posterior lo marca la conciliación
+    como ``cobro_cuenta_cancelada``."""
+    from pagos import pasarelas
+
+    for cuenta, id_intento in ids:
+        try:
+            pasarelas.obtener().cancelar_intento(id_intento)
+        except (pasarelas.ErrorPasarela, pasarelas.PasarelaNoDisponible) as e:
+            logger.warning("No se pudo cancelar el intento %s de la cuenta %s: %s", id_intento, cuenta, e)
+
+
+def _vencer_lote(hoy, lote):
+    """Procesa hasta ``lote`` cuentas vencidas. Devuelve (cuentas cerradas,
+    cuentas canceladas, reservas canceladas), o None si ya no quedan cuentas
+    por vencer."""
+    from pagos.models import CuentaCobrar
+
+    pendiente = estados_reserva.por_nombre('Pendiente')
+    cancelada = estados_reserva.por_nombre('Cancelada')
+    with transaction.atomic():
+        candidatas = CuentaCobrar.objects.filter(estado='PENDIENTE', fecha_vencimiento__lt=hoy)
+        if connection.features.has_select_for_update:
+            candidatas = candidatas.select_for_update()
+        cuentas = list(
+            candidatas.order_by('fecha_vencimiento').values_list('id_cuenta', 'codigo_reserva_id', 'grupo_id')[:lote]
+        )
+        if not cuentas:
+            return None
+
+        ahora = timezone.now()
+        con_deuda = _con_deuda(cuentas, pendiente, cancelada)
+        ids = {c[0] for c in cuentas}
+        for estado, grupo in (('VENCIDO', con_deuda), ('CANCELADO', ids - con_deuda)):
+            if grupo:
+                CuentaCobrar.objects.filter(pk__in=grupo, estado='PENDIENTE').update(estado=estado, updated_at=ahora)
+        # Solo las que cambió este UPDATE: una cuenta pagada entre la lectura y
+        # la escritura sigue PAGADO y sus reservas no se tocan
+        cerradas = list(
+            CuentaCobrar.objects.filter(pk__in=ids, estado__in=('VENCIDO', 'CANCELADO'), updated_at=ahora)
+            .values_list('id_cuenta', 'codigo_reserva_id', 'grupo_id', 'estado', 'payment_intent_id')
+        )
+        intentos = [(c[0], c[4]) for c in cerradas if c[3] == 'CANCELADO' and c[4]]
+        if intentos:
+            transaction.on_commit(lambda: _cancelar_intentos(intentos))
+        if not cerradas:
+            return 0, 0, []
+
+        reservas = Reserva.objects.filter(_filtro_reservas([c[:3] for c in cerradas]), id_estado_reserva=pendiente)
+        if connection.features.has_select_for_update:
+            reservas = reservas.select_for_update()
+        reservas = list(reservas)
+        ids_reservas = [r.pk for r in reservas]
+
+        Reserva.objects.filter(pk__in=ids_reservas).update(
+            id_estado_reserva=cancelada, motivo_cancelacion=MOTIVO, updated_at=ahora
+        )
+        NocheHabitacion.objects.filter(reserva__in=ids_reservas).delete()
+        registrar_cambios(reserva.codigo_habitacion_id for reserva in reservas)
+
+        for reserva in reservas:
+            reserva.id_estado_reserva = cancelada
+            reserva.motivo_cancelacion = MOTIVO
+            reserva.updated_at = ahora
+        if reservas:
+            transaction.on_commit(
+                lambda: transicion_reserva.send(sender=Reserva, transicion='vencer', reservas=reservas)
+            )
+    return len(cerradas), sum(c[3] == 'CANCELADO' for c in cerradas), reservas
+
+
+def barrer(lote=TAMANO_LOTE, hoy=None):
+    """Cierra todas las cuentas PENDIENTE con fecha_vencimiento anterior a ``hoy``
+    (por defecto la fecha local actual). Cada lote va en su propia transacción."""
+    hoy = hoy or timezone.localdate()
+    resultado = ResultadoBarrido()
+    inicio = time.perf_counter()
+    while True:
+        procesado = _vencer_lote(hoy, lote)
+        if procesado is None:
+            break
+        cuentas, canceladas, reservas = procesado
+        resultado.cuentas += cuentas
+        resultado.canceladas += canceladas
+        resultado.reservas += len(reservas)
+        resultado.lotes += 1
+    resultado.segundos = time.perf_counter() - inicio
+    logger.info("Barrido de reservas vencidas: %s", resultado)
+    return resultado
+
+
+class Barredor(threading.Thread):
+    """Hilo que ejecuta ``barrer`` cada ``intervalo`` segundos."""
+
+    def __init__(self, intervalo):
+        super().__init__(name='barredor-reservas', daemon=True)
+        self.intervalo = intervalo
+        self.detenido = threading.Event()
+
+    def run(self):
+        while not self.detenido.wait(self.intervalo):
+            try:
+                barrer()
+            except Exception:
+                logger.exception("Error en el barrido de reservas vencidas")
+            finally:
+                close_old_connections()
+
+    def detener(self):
+        self.detenido.set()
+
+
+_barredor = None
+_barredor_lock = threading.Lock()
+
+
+def iniciar_barredor():
+    """Inicia el hilo si ``BARREDOR_RESERVAS_INTERVALO`` está definido. Devuelve
+    el hilo en ejecución o None."""
+    global _barredor
+    intervalo = getattr(settings, 'BARREDOR_RESERVAS_INTERVALO', None)
+    if not intervalo:
+        return None
+    with _barredor_lock:
+        if _barredor is None or not _barredor.is_alive():
+            _barredor = Barredor(intervalo)
+            _barredor.start()
+    return _barredor
@@ -3,20 +3,49 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from .models import Reserva, HistorialReserva
-from .serializers import ReservaSerializer, HistorialReservaSerializer, ReservaDetalleSerializer
+from .serializers import ReservaSerializer, HistorialReservaSerializer, ReservaDetalleSerializer, GrupoReservaSerializer, HospedajePresencialSerializer
 from usuarios.models import Usuario
 from usuarios.serializers import UsuarioSerializer
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from datetime import timedelta
 from habitaciones.models import Habitacion, EstadoHabitacion
 from .models import Reserva, HistorialReserva, TipoReserva, EstadoReserva
 from django.db.models import Q
 from pagos.models import CuentaCobrar
+from habitaciones.catalogos import estados_habitacion, estados_reserva, tipos_reserva
+from .paginacion import CursorInvalido, paginar, solicita_pagina
+from . import exportacion, presencial, reportes
+from .grupos import GrupoInvalido, crear_grupo
+from .presencial import HospedajeInvalido
+from .idempotencia import idempotente
+
+# Filas relacionadas que lee ReservaDetalleSerializer
+RELACIONES_DETALLE = ('usuario', 'codigo_habitacion__id_tipo', 'codigo_habitacion__id_estado')
+
+
+def _listar(request, reservas, serializer_class, campo):
+    """Serializa el listado completo o, si se pide cursor/page_size, una página."""
+    if not solicita_pagina(request):
+        serializer = serializer_class(reservas.order_by(f'-{campo}', '-id'), many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+    try:
+        filas, siguiente = paginar(request, reservas, campo)
+    except CursorInvalido as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        "next": siguiente,
+        "results": serializer_class(filas, many=True).data,
+    }, status=status.HTTP_200_OK)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotente
 def crear_reserva(request):
     data = request.data.copy()
     data['usuario'] = request.user.pk  # Asignar usuario autenticado
@@ -27,20 +56,23 @@ def crear_reserva(request):
 
         # Crear historial (si aplica)
         try:
-            HistorialReserva.objects.create(huesped=reserva.usuario, reserva=reserva)
+            # Punto de guardado: un fallo aquí no invalida la transacción de la petición
+            with transaction.atomic():
+                HistorialReserva.objects.create(huesped=reserva.usuario, reserva=reserva)
         except Exception as e:
             print(f"[!] Error al guardar historial: {e}")  # Log o ignorar
 
         # Crear cuenta por cobrar
         try:
             fecha_vencimiento = timezone.now().date() + timedelta(days=2)
-            cuenta = CuentaCobrar.objects.create(
-                codigo_reserva=reserva,
-                dni_huesped=reserva.usuario,  # ← asegúrate que exista `huesped`
-                monto_total=reserva.total_pagar,
-                fecha_vencimiento=fecha_vencimiento,
-                estado='PENDIENTE'
-            )
+            with transaction.atomic():
+                cuenta = CuentaCobrar.objects.create(
+                    codigo_reserva=reserva,
+                    dni_huesped=reserva.usuario,  # ← asegúrate que exista `huesped`
+                    monto_total=reserva.total_pagar,
+                    fecha_vencimiento=fecha_vencimiento,
+                    estado='PENDIENTE'
+                )
         except Exception as e:
             return Response(
                 {"error": f"No se pudo crear cuenta por cobrar: {str(e)}"},
@@ -65,16 +97,52 @@ def listar_reservas(request):
     
     if user.rol == 'HUESPED':
         # Los huéspedes solo ven sus propias reservas
-        reservas = Reserva.objects.filter(usuario=user).order_by('-fecha_reserva')
+        reservas = Reserva.objects.filter(usuario=user)
     elif user.rol in ['ADMIN', 'RECEPCIONISTA', 'SUPERVISOR']:
         # Los administradores ven todas las reservas
-        reservas = Reserva.objects.all().order_by('-fecha_reserva')
+        reservas = Reserva.objects.all()
     else:
         return Response({"error": "Sin permisos para ver reservas"}, 
                        status=status.HTTP_403_FORBIDDEN)
     
-    serializer = ReservaSerializer(reservas, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    # ReservaSerializer solo expone claves foráneas: no necesita select_related
+    return _listar(request, reservas, ReservaSerializer, 'fecha_reserva')
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotente
+def crear_reserva_grupal(request):
+    """
+    Reserva varias habitaciones con las mismas fechas en una sola transacción
+    y genera una cuenta por cobrar consolidada. Si alguna habitación no se puede
+    reservar no se crea ninguna reserva.
+    """
+    serializer = GrupoReservaSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    datos = serializer.validated_data
+    try:
+        grupo, reservas, cuenta = crear_grupo(
+            usuario=request.user,
+            solicitudes=datos['habitaciones'],
+            fecha_checkin=datos['fecha_checkin_programado'],
+            fecha_checkout=datos['fecha_checkout_programado'],
+            tipo_reserva=datos['id_tipo_reserva'],
+            pago=datos['pago'],
+            usuario_admin=datos.get('usuario_admin'),
+            nombre=datos.get('nombre'),
+            observaciones=datos.get('observaciones'),
+        )
+    except GrupoInvalido as e:
+        return Response({"errores": e.errores}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        "grupo_id": grupo.id,
+        "reservas": ReservaSerializer(reservas, many=True).data,
+        "cuenta_id": str(cuenta.id_cuenta),
+        "monto_total": cuenta.monto_total,
+    }, status=status.HTTP_201_CREATED)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -189,7 +257,7 @@ def historial_reservas_usuario(request, dni):
     except Usuario.DoesNotExist:
         return Response({"error": "Usuario no encontrado"}, status=status.HTTP_404_NOT_FOUND)
     try:
-        historial = HistorialReserva.objects.filter(huesped=usuario).order_by('-fecha')
+        historial = HistorialReserva.objects.filter(huesped=usuario).select_related('reserva').order_by('-fecha')
         serializer = HistorialReservaSerializer(historial, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except:
@@ -197,181 +265,43 @@ def historial_reservas_usuario(request, dni):
         serializer = ReservaSerializer(reservas, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+
+def _registrar_hospedaje(request, checkin_inmediato, mensaje):
+    if request.user.rol not in ['ADMIN', 'RECEPCIONISTA', 'SUPERVISOR']:
+        return Response({"error": "Sin permisos para registrar hospedaje presencial"}, status=status.HTTP_403_FORBIDDEN)
+
+    serializer = HospedajePresencialSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        usuario, reserva = presencial.registrar(request.user, serializer.validated_data, checkin_inmediato)
+    except HospedajeInvalido as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        "message": mensaje,
+        "usuario": UsuarioSerializer(usuario).data,
+        "reserva": ReservaSerializer(reserva).data
+    }, status=status.HTTP_201_CREATED)
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotente
 def registrar_hospedaje_presencial(request):
     """
     Registro de hospedaje presencial: crea usuario huésped si no existe,
     asocia reserva a un administrador y realiza check-in inmediato.
     """
-    if request.user.rol not in ['ADMIN', 'RECEPCIONISTA', 'SUPERVISOR']:
-        return Response({"error": "Sin permisos para registrar hospedaje presencial"}, status=status.HTTP_403_FORBIDDEN)
-
-    dni = request.data.get('dni')
-    nombres = request.data.get('nombres')
-    apellidos = request.data.get('apellidos')
-    habitacion_id = request.data.get('habitacion_id')
-    numero_huespedes = request.data.get('numero_huespedes', 1)
-    dias = int(request.data.get('dias', 3))
-    dni_admin = request.data.get('dni_admin')
-    pago = request.data.get('pago')  # nuevo campo de pago
+    return _registrar_hospedaje(request, True, "Registro y check-in exitoso")
 
-    # Buscar o crear usuario huésped
-    try:
-        usuario = Usuario.objects.get(dni=dni)
-    except Usuario.DoesNotExist:
-        data = {
-            'dni': dni,
-            'nombres': nombres,
-            'apellidos': apellidos,
-            'password': dni,
-            'rol': 'HUESPED'
-        }
-        serializer = UsuarioSerializer(data=data)
-        if serializer.is_valid():
-            usuario = serializer.save()
-        else:
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-    # Buscar usuario administrador
-    if dni_admin:
-        try:
-            usuario_admin = Usuario.objects.get(dni=dni_admin, rol='ADMIN')
-        except Usuario.DoesNotExist:
-            return Response({'error': 'Administrador no encontrado.'}, status=status.HTTP_400_BAD_REQUEST)
-    else:
-        usuario_admin = request.user
-
-    # Buscar habitación
-    try:
-        habitacion = Habitacion.objects.get(pk=habitacion_id)
-    except Habitacion.DoesNotExist:
-        return Response({'error': 'Habitación no encontrada.'}, status=status.HTTP_400_BAD_REQUEST)
-
-    # Fechas
-    fecha_checkin = timezone.now()
-    fecha_checkout = fecha_checkin + timedelta(days=dias)
-
-    # Tipo y estado de reserva
-    tipo_reserva = TipoReserva.objects.get(nombre='Presencial')
-    estado_reserva = EstadoReserva.objects.get(nombre='Confirmada')
-
-    # Validar y crear reserva usando el serializer
-    reserva_data = {
-        "usuario": usuario.pk,
-        "usuario_admin": usuario_admin.pk if usuario_admin else None,
-        "codigo_habitacion": habitacion.pk,
-        "id_tipo_reserva": tipo_reserva.pk,
-        "id_estado_reserva": estado_reserva.pk,
-        "fecha_checkin_programado": fecha_checkin,
-        "fecha_checkout_programado": fecha_checkout,
-        "numero_huespedes": numero_huespedes,
-        "precio_noche": habitacion.precio_actual,
-        "pago": pago,  # nuevo campo de pago
-        # 'descuento' eliminado, ahora lo calcula el serializer
-    }
-    serializer = ReservaSerializer(data=reserva_data)
-    if serializer.is_valid():
-        reserva = serializer.save()
-        reserva.check_in()
-        if hasattr(usuario, 'rol') and usuario.rol == 'HUESPED':
-            usuario.total_visitas = getattr(usuario, 'total_visitas', 0) + 1
-            usuario.save()
-        return Response({
-            "message": "Registro y check-in exitoso",
-            "usuario": UsuarioSerializer(usuario).data,
-            "reserva": ReservaSerializer(reserva).data
-        }, status=status.HTTP_201_CREATED)
-    else:
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotente
 def registrar_hospedaje_presencial_pendiente(request):
     """
     Registro de hospedaje presencial: crea usuario huésped si no existe,
     asocia reserva a un administrador y deja la reserva en estado pendiente (sin check-in inmediato).
     """
-    if request.user.rol not in ['ADMIN', 'RECEPCIONISTA', 'SUPERVISOR']:
-        return Response({"error": "Sin permisos para registrar hospedaje presencial"}, status=status.HTTP_403_FORBIDDEN)
-
-    dni = request.data.get('dni')
-    nombres = request.data.get('nombres')
-    apellidos = request.data.get('apellidos')
-    habitacion_id = request.data.get('habitacion_id')
-    numero_huespedes = request.data.get('numero_huespedes', 1)
-    dias = int(request.data.get('dias', 3))
-    dni_admin = request.data.get('dni_admin')
-    pago = request.data.get('pago')  
-
-    # Buscar o crear usuario huésped
-    try:
-        usuario = Usuario.objects.get(dni=dni)
-    except Usuario.DoesNotExist:
-        data = {
-            'dni': dni,
-            'nombres': nombres,
-            'apellidos': apellidos,
-            'password': dni,
-            'rol': 'HUESPED'
-        }
-        serializer = UsuarioSerializer(data=data)
-        if serializer.is_valid():
-            usuario = serializer.save()
-        else:
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-    # Buscar usuario administrador
-    if dni_admin:
-        try:
-            usuario_admin = Usuario.objects.get(dni=dni_admin, rol='ADMIN')
-        except Usuario.DoesNotExist:
-            return Response({'error': 'Administrador no encontrado.'}, status=status.HTTP_400_BAD_REQUEST)
-    else:
-        usuario_admin = request.user
-
-    # Buscar habitación
-    try:
-        habitacion = Habitacion.objects.get(pk=habitacion_id)
-    except Habitacion.DoesNotExist:
-        return Response({'error': 'Habitación no encontrada.'}, status=status.HTTP_400_BAD_REQUEST)
-
-    # Fechas: usar las del request si existen, si no calcularlas
-    fecha_checkin = request.data.get('fecha_checkin_programado')
-    fecha_checkout = request.data.get('fecha_checkout_programado')
-    if not fecha_checkin or not fecha_checkout:
-        fecha_checkin = timezone.now()
-        fecha_checkout = fecha_checkin + timedelta(days=dias)
-
-    # Tipo y estado de reserva
-    tipo_reserva = TipoReserva.objects.get(nombre='Presencial')
-    estado_reserva = EstadoReserva.objects.get(nombre='Pendiente')
-
-    # Validar y crear reserva usando el serializer
-    reserva_data = {
-        "usuario": usuario.pk,
-        "usuario_admin": usuario_admin.pk if usuario_admin else None,
-        "codigo_habitacion": habitacion.pk,
-        "id_tipo_reserva": tipo_reserva.pk,
-        "id_estado_reserva": estado_reserva.pk,
-        "fecha_checkin_programado": fecha_checkin,
-        "fecha_checkout_programado": fecha_checkout,
-        "numero_huespedes": numero_huespedes,
-        "precio_noche": habitacion.precio_actual,
-        "pago": pago,  # nuevo campo de pago
-        # 'descuento' eliminado, ahora lo calcula el serializer
-    }
-    serializer = ReservaSerializer(data=reserva_data)
-    if serializer.is_valid():
-        reserva = serializer.save()
-        # No se hace check_in ni se cambia el estado de la habitación
-        return Response({
-            "message": "Reserva presencial registrada en estado pendiente",
-            "usuario": UsuarioSerializer(usuario).data,
-            "reserva": ReservaSerializer(reserva).data
-        }, status=status.HTTP_201_CREATED)
-    else:
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    return _registrar_hospedaje(request, False, "Reserva presencial registrada en estado pendiente")
     
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -384,10 +314,10 @@ def listar_reservas_confirmadas_ocupadas_limpieza(request):
     if request.user.rol not in ['ADMIN', 'RECEPCIONISTA', 'SUPERVISOR']:
         return Response({"error": "Sin permisos para ver reservas confirmadas"}, status=status.HTTP_403_FORBIDDEN)
 
-    estado_confirmada = EstadoReserva.objects.get(nombre='Confirmada')
-    estado_finalizada = EstadoReserva.objects.get(nombre='Finalizada')
-    estado_ocupada = EstadoHabitacion.objects.get(nombre='Ocupada')
-    estado_limpieza = EstadoHabitacion.objects.get(nombre='Limpieza')
+    estado_confirmada = estados_reserva.por_nombre('Confirmada')
+    estado_finalizada = estados_reserva.por_nombre('Finalizada')
+    estado_ocupada = estados_habitacion.por_nombre('Ocupada')
+    estado_limpieza = estados_habitacion.por_nombre('Limpieza')
 
     reservas = Reserva.objects.filter(
         Q(
@@ -395,7 +325,7 @@ def listar_reservas_confirmadas_ocupadas_limpieza(request):
             codigo_habitacion__id_estado__in=[estado_ocupada, estado_limpieza]
         ) |
         Q(id_estado_reserva=estado_finalizada)
-    ).distinct().order_by('-fecha_checkin_programado')
+    ).distinct().select_related(*RELACIONES_DETALLE).order_by('-fecha_checkin_programado')
 
     serializer = ReservaDetalleSerializer(reservas, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
@@ -404,8 +334,68 @@ def listar_reservas_confirmadas_ocupadas_limpieza(request):
 @permission_classes([IsAuthenticated])
 def listar_todas_las_reservas(request):
     """
-    Lista todas las reservas del sistema.
+    Lista todas las reservas del sistema. Admite paginación por cursor
+    (?page_size=N y luego ?cursor=... tomado de "next").
     """
-    reservas = Reserva.objects.all().order_by('-fecha_checkin_programado')
-    serializer = ReservaDetalleSerializer(reservas, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+    reservas = Reserva.objects.select_related(*RELACIONES_DETALLE)
+    return _listar(request, reservas, ReservaDetalleSerializer, 'fecha_checkin_programado')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def exportar_reservas(request):
+    """
+    Exporta reservas en streaming (?formato=ndjson|csv) con filtros opcionales:
+    desde, hasta (fecha de check-in), estado, tipo, tipo_habitacion y habitacion.
+    """
+    if request.user.rol not in ['ADMIN', 'RECEPCIONISTA', 'SUPERVISOR']:
+        return Response({"error": "Sin permisos para exportar reservas"}, status=status.HTTP_403_FORBIDDEN)
+
+    formato = request.query_params.get('formato', 'ndjson')
+    if formato not in ('ndjson', 'csv'):
+        return Response({"error": "Formato no soportado. Use 'ndjson' o 'csv'."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        reservas = exportacion.filtrar(request.query_params)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    lineas = exportacion.csv_lineas(reservas) if formato == 'csv' else exportacion.ndjson(reservas)
+    if isinstance(request._request, ASGIRequest):
+        # Con un generador síncrono el handler ASGI cargaría todo en memoria
+        lineas = exportacion.en_lotes(lineas)
+    if formato == 'csv':
+        respuesta = StreamingHttpResponse(lineas, content_type='text/csv; charset=utf-8')
+        respuesta['Content-Disposition'] = 'attachment; filename="reservas.csv"'
+    else:
+        respuesta = StreamingHttpResponse(lineas, content_type='application/x-ndjson')
+    return respuesta
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def reporte_ingresos(request):
+    """
+    Ingresos de reservas no canceladas agrupados por ?agrupar=dia|mes|tipo_habitacion|pago,
+    con filtros opcionales desde y hasta (fecha de check-in, AAAA-MM-DD).
+    """
+    if request.user.rol not in ['ADMIN', 'SUPERVISOR']:
+        return Response({"error": "Sin permisos para ver reportes"}, status=status.HTTP_403_FORBIDDEN)
+
+    agrupar = request.query_params.get('agrupar', 'dia')
+    fechas = {}
+    for param in ('desde', 'hasta'):
+        valor = request.query_params.get(param)
+        if valor:
+            fechas[param] = parse_date(valor)
+            if fechas[param] is None:
+                return Response({"error": f"Fecha no válida en '{param}'"}, status=status.HTTP_400_BAD_REQUEST)
+    reservas = reportes.reservas_facturables(**fechas)
+    try:
+        grupos = list(reportes.ingresos(reservas, agrupar))
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        "agrupar": agrupar,
+        "totales": reportes.totales(reservas),
+        "grupos": grupos,
+    }, status=status.HTTP_200_OK)
@@ -0,0 +1,72 @@
+"""
+Autenticación JWT sin consultar la tabla ``usuario`` en cada petición.
+
+``JWTAuthentication`` de simplejwt carga el usuario completo por DNI en cada
+llamada a la API. ``JWTAutenticacionCache`` guarda en la caché, por DNI y
+durante ``AUTH_USUARIO_CACHE_SEGUNDOS``, solo los campos de ``CAMPOS`` (los
+que usan los permisos y las comprobaciones de rol) y devuelve un ``Usuario``
+con el resto de campos diferidos: ``request.user.rol`` no hace consultas y
+leer otro campo lo carga de la base como con ``.only()``. Guardar esa
+instancia solo escribe los campos cargados.
+
+Las vistas solo leen ``pk`` y ``rol`` de ``request.user`` o lo pasan como
+clave foránea (reservas, grupos, idempotencia, movimientos de pago); el perfil
+se vuelve a leer completo (``usuarios.views.perfil_usuario``). Si una vista
+necesita otro campo, debe agregarse a ``CAMPOS``: lo comprueba
+``test_vistas_no_cargan_campos_diferidos``.
+
+La entrada se invalida al guardar o borrar el usuario (``usuarios.signals``).
+Un ``UPDATE`` directo o la caché de otro proceso pueden tardar hasta el
+tiempo de expiración en reflejar un cambio de rol o una desactivación.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Usuario
+
+PREFIJO = 'auth:usuario:'
+# En el orden de los campos del modelo, que es el que espera Model.from_db
+CAMPOS = tuple(
+    f.attname for f in Usuario._meta.concrete_fields
+    if f.attname in ('dni', 'rol', 'is_active', 'is_staff', 'is_superuser')
+)
+
+
+def invalidar(*dnis):
+    cache.delete_many([PREFIJO + str(dni) for dni in dnis])
+
+
+def usuario(dni):
+    """``Usuario`` con solo ``CAMPOS`` cargados, o None si no existe."""
+    clave = PREFIJO + str(dni)
+    valores = cache.get(clave)
+    if valores is None:
+        valores = Usuario.objects.filter(pk=dni).values_list(*CAMPOS).first()
+        if valores is None:
+            return None
+        cache.set(clave, valores, getattr(settings, 'AUTH_USUARIO_CACHE_SEGUNDOS', 60))
+    return Usuario.from_db(router.db_for_read(Usuario), CAMPOS, valores)
+
+
+class JWTAutenticacionCache(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Necesita el hash de la contraseña, que no se guarda en la caché
+            return super().get_user(validated_token)
+        try:
+            dni = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = usuario(dni)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
@@ -0,0 +1,104 @@
+"""
+Programa de fidelidad: visitas de los huéspedes y nivel de descuento.
+
+``total_visitas`` solo se modifica con ``UPDATE ... SET total_visitas =
+total_visitas + 1`` sobre esa columna, de modo que dos confirmaciones
+simultáneas del mismo huésped suman dos visitas y no se reescribe el resto de
+la fila (contraseña incluida).
+
+El nivel de cada huésped se guarda en la caché por DNI. La caché puede ser
+propia de cada proceso (``LocMemCache``), así que la clave incluye una versión
+compartida en la base de datos (``habitaciones.versiones``): registrar una
+visita o guardar un usuario la incrementa y las entradas de todos los
+procesos dejan de usarse. Cada proceso compara la versión como máximo cada
+``FIDELIDAD_VERIFICAR_SEGUNDOS``; ese es el retraso máximo con el que otro
+worker aplica el nuevo descuento. El comando ``recalcular_visitas``
+reconstruye los contadores desde las reservas.
+"""
+import threading
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from habitaciones.versiones import incrementar_version, obtener_version
+from .models import Usuario
+
+Nivel = namedtuple('Nivel', 'nombre visitas_minimas descuento')
+
+# De mayor a menor: se aplica el primero que se alcanza
+NIVELES = (
+    Nivel('ORO', 10, Decimal('0.15')),
+    Nivel('PLATA', 5, Decimal('0.10')),
+    Nivel('BASICO', 0, Decimal('0.00')),
+)
+
+PREFIJO = 'fidelidad:nivel:'
+CLAVE_VERSION = 'fidelidad:niveles:version'
+DURACION_CACHE = 24 * 60 * 60
+VERIFICAR_SEGUNDOS = getattr(settings, 'FIDELIDAD_VERIFICAR_SEGUNDOS', 5)
+
+# Versión conocida por este proceso y cuándo se comparó por última vez
+_local = {'version': None, 'verificado': 0.0}
+_lock = threading.Lock()
+
+
+def nivel_para(visitas):
+    for nivel in NIVELES:
+        if visitas >= nivel.visitas_minimas:
+            return nivel
+    return NIVELES[-1]
+
+
+def _version():
+    ahora = time.monotonic()
+    if _local['version'] is None or ahora - _local['verificado'] >= VERIFICAR_SEGUNDOS:
+        with _lock:
+            _local['version'] = obtener_version(CLAVE_VERSION)
+            _local['verificado'] = ahora
+    return _local['version']
+
+
+def _clave(dni, version):
+    return f'{PREFIJO}{version}:{dni}'
+
+
+def nivel(dni):
+    """Nivel del huésped, leído de la caché o calculado con una consulta."""
+    clave = _clave(dni, _version())
+    nombre = cache.get(clave)
+    if nombre is None:
+        visitas = Usuario.objects.filter(pk=dni).values_list('total_visitas', flat=True).first() or 0
+        nombre = nivel_para(visitas).nombre
+        cache.set(clave, nombre, DURACION_CACHE)
+    return next(n for n in NIVELES if n.nombre == nombre)
+
+
+def _olvidar_version():
+    _local['version'] = None
+
+
+def invalidar(*dnis):
+    """Invalida el nivel en todos los procesos. Dentro de una transacción la
+    nueva versión solo la ven los demás tras el commit."""
+    incrementar_version(CLAVE_VERSION)
+    _olvidar_version()
+    # Antes del commit otra petición de este proceso pudo leer la versión
+    # anterior; se vuelve a comparar en la siguiente lectura
+    transaction.on_commit(_olvidar_version)
+
+
+def registrar_visita(usuario):
+    """Suma una visita al huésped de forma atómica. La instancia se incrementa
+    en memoria; otra visita simultánea solo se ve en la base de datos."""
+    if getattr(usuario, 'rol', None) != 'HUESPED':
+        return
+    Usuario.objects.filter(pk=usuario.pk).update(total_visitas=F('total_visitas') + 1)
+    if 'total_visitas' not in usuario.get_deferred_fields():
+        # Una instancia de la caché de autenticación no lo trae: no se carga solo para sumarle uno
+        usuario.total_visitas += 1
+    invalidar(usuario.pk)
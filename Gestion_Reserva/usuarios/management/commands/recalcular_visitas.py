@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from habitaciones.catalogos import estados_reserva
+from reservas.models import Reserva
+from usuarios import fidelidad
+from usuarios.models import Usuario
+
+# Estados de las reservas que sumaron una visita al confirmarse
+ESTADOS_VISITA = ('Confirmada', 'Finalizada')
+
+
+class Command(BaseCommand):
+    help = "Reconstruye total_visitas de los huéspedes a partir de sus reservas confirmadas o finalizadas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help="Usuarios por UPDATE")
+
+    def handle(self, *args, lote, **options):
+        estados = [estados_reserva.por_nombre(nombre).pk for nombre in ESTADOS_VISITA]
+        visitas = dict(
+            Reserva.objects.filter(id_estado_reserva__in=estados)
+            .values('usuario').annotate(visitas=Count('id')).order_by()
+            .values_list('usuario', 'visitas')
+        )
+        cambiados = [
+            Usuario(dni=dni, total_visitas=visitas.get(dni, 0))
+            for dni, actual in Usuario.objects.filter(rol='HUESPED').values_list('dni', 'total_visitas').iterator(lote)
+            if actual != visitas.get(dni, 0)
+        ]
+        with transaction.atomic():
+            Usuario.objects.bulk_update(cambiados, ['total_visitas'], batch_size=lote)
+        fidelidad.invalidar(*[u.dni for u in cambiados])
+        self.stdout.write(self.style.SUCCESS(f"Huéspedes actualizados: {len(cambiados)}"))
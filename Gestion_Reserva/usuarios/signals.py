@@ -0,0 +1,16 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Usuario
+from . import autenticacion, fidelidad
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def usuario_modificado(sender, instance, created=False, update_fields=None, **kwargs):
+    # total_visitas pudo cambiar (admin, serializer): el nivel se vuelve a calcular.
+    # Un usuario nuevo todavía no tiene nivel guardado en ninguna caché.
+    if not created and (update_fields is None or 'total_visitas' in update_fields):
+        fidelidad.invalidar(instance.pk)
+    # Rol o is_active pudieron cambiar: el próximo token vuelve a leer el usuario
+    autenticacion.invalidar(instance.pk)
@@ -1,3 +1,140 @@
+import io
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from habitaciones.tests import FIXTURES
+from reservas.models import Reserva, calcular_descuento
+from . import autenticacion, fidelidad
+from .models import Usuario
+
+
+class FidelidadTests(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        self.huesped = Usuario.objects.create_user('70000001', 'Ana', 'Pérez', password='clave-segura')
+        # Las versiones compartidas vuelven atrás con el rollback de cada test
+        cache.clear()
+        fidelidad._local['version'] = None
+
+    def test_visita_atomica_invalida_el_nivel(self):
+        Usuario.objects.filter(pk=self.huesped.pk).update(total_visitas=4)
+        fidelidad.invalidar(self.huesped.pk)
+        self.assertEqual(fidelidad.nivel(self.huesped.pk).nombre, 'BASICO')
+        with self.assertNumQueries(0):
+            self.assertEqual(calcular_descuento(self.huesped, Decimal('100.00')), Decimal('0.00'))
+
+        # La instancia está desactualizada: el UPDATE usa el valor de la base (más la versión compartida)
+        with self.assertNumQueries(2):
+            fidelidad.registrar_visita(self.huesped)
+        huesped = Usuario.objects.get(pk=self.huesped.pk)
+        self.assertEqual(huesped.total_visitas, 5)
+        self.assertEqual(huesped.password, self.huesped.password)
+        self.assertEqual(calcular_descuento(huesped, Decimal('100.00')), Decimal('10.00'))
+
+    def test_invalidacion_desde_otro_proceso(self):
+        self.assertEqual(fidelidad.nivel(self.huesped.pk).nombre, 'BASICO')
+
+        # Otro worker registra la visita que sube de nivel: tiene su propia caché
+        Usuario.objects.filter(pk=self.huesped.pk).update(total_visitas=5)
+        with mock.patch.object(fidelidad, 'cache', LocMemCache('otro-proceso', {})), \
+                mock.patch.dict(fidelidad._local):
+            fidelidad.invalidar(self.huesped.pk)
+
+        with mock.patch.object(fidelidad, 'VERIFICAR_SEGUNDOS', 0):
+            self.assertEqual(fidelidad.nivel(self.huesped.pk).nombre, 'PLATA')
+            self.assertEqual(calcular_descuento(self.huesped, Decimal('100.00')), Decimal('10.00'))
+
+    def test_recalcular_visitas_desde_las_reservas(self):
+        checkin = timezone.now() + timedelta(days=5)
+        for i, estado in enumerate([2, 4, 3, 1]):  # Confirmada, Finalizada, Cancelada, Pendiente
+            Reserva.objects.create(
+                usuario=self.huesped,
+                codigo_habitacion_id=f'HAB10{i + 1}',
+                id_tipo_reserva_id=2,
+                id_estado_reserva_id=estado,
+                fecha_checkin_programado=checkin,
+                fecha_checkout_programado=checkin + timedelta(days=1),
+                precio_noche=100,
+            )
+        otro = Usuario.objects.create_user('70000002', 'Luis', 'Soto', password='clave-segura')
+        Usuario.objects.filter(pk=otro.pk).update(total_visitas=7)
+        fidelidad.nivel(otro.pk)
+
+        call_command('recalcular_visitas', stdout=io.StringIO())
+        self.assertEqual(Usuario.objects.get(pk=self.huesped.pk).total_visitas, 2)
+        self.assertEqual(Usuario.objects.get(pk=otro.pk).total_visitas, 0)
+        self.assertEqual(fidelidad.nivel(otro.pk).nombre, 'BASICO')
+
+
+class AutenticacionCacheTests(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user('40000002', 'Rosa', 'Quispe', password='clave-segura',
+                                                   rol='RECEPCIONISTA')
+        self.cabecera = f'Bearer {AccessToken.for_user(self.usuario)}'
+
+    def autenticar(self):
+        peticion = APIRequestFactory().get('/', HTTP_AUTHORIZATION=self.cabecera)
+        return autenticacion.JWTAutenticacionCache().authenticate(peticion)[0]
+
+    def test_rol_sin_consultas_e_invalidacion(self):
+        with self.assertNumQueries(1):
+            self.autenticar()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.autenticar().rol, 'RECEPCIONISTA')
+
+        self.usuario.rol = 'ADMIN'
+        self.usuario.save()
+        self.assertEqual(self.autenticar().rol, 'ADMIN')
+
+        self.usuario.is_active = False
+        self.usuario.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.autenticar()
+
+    def test_campos_diferidos_y_perfil(self):
+        usuario = self.autenticar()
+        usuario.celular = '999888777'
+        usuario.save()  # Solo escribe los campos cargados
+        guardado = Usuario.objects.get(pk=self.usuario.pk)
+        self.assertEqual((guardado.celular, guardado.nombres), ('999888777', 'Rosa'))
+        self.assertEqual(guardado.password, self.usuario.password)
+
+        cliente = APIClient()
+        cliente.credentials(HTTP_AUTHORIZATION=self.cabecera)
+        respuesta = cliente.get('/api/usuarios/perfil/')
+        self.assertEqual((respuesta.status_code, respuesta.data['nombres']), (200, 'Rosa'))
+
+    def test_vistas_no_cargan_campos_diferidos(self):
+        """Las vistas que pasan request.user a los servicios (como clave foránea,
+        para calcular el descuento o comparar con el dueño) solo leen CAMPOS."""
+        huesped = Usuario.objects.create_user('70000001', 'Ana', 'Pérez', password='clave-segura')
+        cliente = APIClient()
+        cliente.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(huesped)}')
+        checkin = timezone.now() + timedelta(days=20)
 
-# Create your tests here.
+        with mock.patch.object(Usuario, 'refresh_from_db', autospec=True,
+                               side_effect=Usuario.refresh_from_db) as recarga:
+            respuesta = cliente.post('/api/reservas/grupo/', {
+                'habitaciones': [{'codigo_habitacion': 'HAB101', 'numero_huespedes': 2}],
+                'fecha_checkin_programado': checkin.isoformat(),
+                'fecha_checkout_programado': (checkin + timedelta(days=2)).isoformat(),
+                'id_tipo_reserva': 2,
+            }, format='json')
+            self.assertEqual(respuesta.status_code, 201)
+            self.assertEqual(cliente.get('/api/reservas/listar/').status_code, 200)
+            reserva = respuesta.data['reservas'][0]['id']
+            self.assertEqual(cliente.post(f'/api/reservas/{reserva}/cancelar/').status_code, 200)
+        recarga.assert_not_called()
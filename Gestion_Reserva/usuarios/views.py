@@ -45,7 +45,9 @@ def login_usuario(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def perfil_usuario(request):
-    return Response(UsuarioSerializer(request.user).data, status=status.HTTP_200_OK)
+    # request.user solo trae los campos de la autenticación: el perfil se lee completo
+    usuario = Usuario.objects.get(pk=request.user.pk)
+    return Response(UsuarioSerializer(usuario).data, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
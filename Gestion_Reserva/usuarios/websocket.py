@@ -0,0 +1,42 @@
+"""
+Autenticación JWT para las conexiones WebSocket (Channels).
+
+Los navegadores no permiten cabeceras propias al abrir un WebSocket, así que
+el token de acceso se acepta en ``?token=`` además de en ``Authorization:
+Bearer``. Se valida con la primera clase de ``DEFAULT_AUTHENTICATION_CLASSES``
+(la misma que usa la API) y el resultado queda en ``scope['user']``
+(``AnonymousUser`` si falta o no es válido). Cada consumidor decide qué hacer
+con un usuario anónimo.
+"""
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.settings import api_settings
+
+
+def _token(scope):
+    cabeceras = dict(scope.get('headers', []))
+    autorizacion = cabeceras.get(b'authorization', b'').decode()
+    if autorizacion.startswith('Bearer '):
+        return autorizacion[len('Bearer '):].strip()
+    return (parse_qs(scope.get('query_string', b'').decode()).get('token') or [None])[0]
+
+
+@database_sync_to_async
+def _usuario(token):
+    autenticador = api_settings.DEFAULT_AUTHENTICATION_CLASSES[0]()
+    try:
+        return autenticador.get_user(autenticador.get_validated_token(token))
+    except AuthenticationFailed:  # Incluye InvalidToken de simplejwt
+        return AnonymousUser()
+
+
+class JWTWebsocketMiddleware(BaseMiddleware):
+
+    async def __call__(self, scope, receive, send):
+        token = _token(scope)
+        scope = dict(scope, user=await _usuario(token) if token else AnonymousUser())
+        return await super().__call__(scope, receive, send)